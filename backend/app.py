@@ -1,11 +1,33 @@
-from flask import Flask, jsonify, request, session, redirect, send_from_directory
+from flask import Flask, Response, jsonify, request, session, redirect, send_from_directory
 from flask_cors import CORS
 from gmail_oauth import GmailOAuthManager
 from google.auth.transport.requests import Request
 from email_summarizer import EmailSummarizer
 import secrets
-from email_agent_service import generate_email_from_description
+from email_agent_service import (
+    generate_email_from_description, stream_email_from_description, discard_writer, writer_stats,
+    get_writer, build_writer_prompt
+)
+from llm_gateway import gateway as llm_gateway
+from draft_speculator import DraftSpeculator
+from draft_edits import edit_stats as writer_edit_stats
+from summary_cache import summary_cache_from_env
 from info_extractor import EmailMediator
+from mediator_fast_path import fast_path_stats
+from mediator_output import output_stats as mediator_output_stats
+from fused_pipeline import PIPELINE_MODE, advance_pipeline
+from mediator_store import (
+    MediatorStore, backend_from_env,
+    DEFAULT_MAX_SESSIONS, DEFAULT_IDLE_TTL_SECONDS, DEFAULT_FLUSH_INTERVAL_SECONDS
+)
+from inbox_fetcher import fetch_messages, summarize_message, LIST_METADATA_HEADERS
+from inbox_sync import InboxSyncEngine, is_sync_page_token, sync_page_offset
+from message_cache import MessageCache
+from contact_index import ContactIndexRegistry, merge_counts
+from typeahead import TypeaheadIndex, local_part
+from mime_parser import parse_payload, get_header, html_to_text
+from google_services import get_service
+from identity import fetch_identity, remember_identity, get_current_identity, forget_current_identity
 from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 import tempfile
@@ -16,12 +38,12 @@ import firebase_admin
 from firebase_admin import credentials, firestore
 import json
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
+from email.utils import getaddresses
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from dateutil import parser
@@ -29,9 +51,9 @@ from datetime import datetime, timedelta
 import time
 import threading
 import pytz
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 
 from flask import send_file
 import io
@@ -119,7 +141,19 @@ CORS(
     supports_credentials=True
 )
 
-mediators = {}
+mediators = MediatorStore(
+    lambda data=None: EmailMediator.from_dict(data) if data else EmailMediator(),
+    backend=backend_from_env(),
+    max_sessions=int(os.environ.get('MEDIATOR_MAX_SESSIONS', DEFAULT_MAX_SESSIONS)),
+    idle_ttl=int(os.environ.get('MEDIATOR_IDLE_TTL', DEFAULT_IDLE_TTL_SECONDS)),
+    flush_interval=float(os.environ.get('MEDIATOR_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL_SECONDS))
+)
+message_cache = MessageCache()
+# Keeps message_cache labels current as the mirror syncs
+inbox_sync = InboxSyncEngine(message_cache=message_cache)
+contact_indexes = ContactIndexRegistry()
+# Start drafting as soon as the mediator has a description (SPECULATIVE_DRAFTS=0 to disable)
+draft_speculator = DraftSpeculator() if os.environ.get('SPECULATIVE_DRAFTS', '1') != '0' else None
 
 
 @app.route('/api/health', methods=['GET'])
@@ -143,12 +177,11 @@ def google_callback():
         session["google_creds"] = credentials_to_dict(creds)
         
         try:
-            user_info_service = build('oauth2', 'v2', credentials=creds)
-            user_info = user_info_service.userinfo().get().execute()
+            identity = fetch_identity(creds)
             
-            email = user_info.get('email')
-            name = user_info.get('name', 'Unknown')
-            picture = user_info.get('picture', '')
+            email = identity['email']
+            name = identity['name'] or 'Unknown'
+            picture = identity['picture']
 
             # Save to Firebase
             if get_db():
@@ -169,11 +202,7 @@ def google_callback():
                 user_ref.set(user_data, merge=True)
             
             # Cache in session for quick access
-            session['user_info'] = {
-                'email': email,
-                'name': name,
-                'picture': picture
-            }
+            remember_identity(identity)
                 
         except Exception as e:
             print(f"Error fetching/storing user info: {e}")
@@ -191,22 +220,11 @@ def auth_status():
         return jsonify({'authenticated': False})
 
     try:
-        creds_data = session['google_creds']
-        creds = Credentials(
-            token=creds_data['token'],
-            refresh_token=creds_data.get('refresh_token'),
-            token_uri=creds_data['token_uri'],
-            client_id=creds_data['client_id'],
-            client_secret=creds_data['client_secret'],
-            scopes=creds_data['scopes']
-        )
-        
-        user_info_service = build('oauth2', 'v2', credentials=creds)
-        user_info = user_info_service.userinfo().get().execute()
+        identity = get_current_identity()
         
-        email = user_info.get('email')
-        name = user_info.get('name', 'Unknown')
-        picture = user_info.get('picture', '')
+        email = identity['email']
+        name = identity['name'] or 'Unknown'
+        picture = identity['picture']
 
         return jsonify({
             'authenticated': True, 
@@ -217,6 +235,7 @@ def auth_status():
 
     except Exception as e:
         print(f"Auth Status Check Error: {e}")
+        forget_current_identity()
         session.pop('google_creds', None)
         return jsonify({'authenticated': False, 'error': str(e)})
 
@@ -237,6 +256,17 @@ def google_login():
 
 @app.route("/api/auth/logout", methods=["POST"])
 def logout():
+    user_key = session.get('user_info', {}).get('email')
+    forget_current_identity()
+    if user_key:
+        inbox_sync.reset(user_key)
+        message_cache.clear_user(user_key)
+        contact_indexes.drop(user_key)
+    if session.get('session_id'):
+        mediators.delete(session['session_id'])
+        if draft_speculator:
+            draft_speculator.cancel(session['session_id'])
+        discard_writer(session['session_id'])
     session.clear()
     return jsonify({"success": True})
 
@@ -254,42 +284,47 @@ def search_contacts():
             return jsonify({'error': 'Not authenticated'}), 401
 
         creds = service._http.credentials
-
-        google_contacts = GmailOAuthManager.search_contacts_with_creds(creds, query)
-        
         user_email = get_current_user_email()
-        relation_contacts = []
-        
+
+        relations = {}
+        email_counts = {}
         if user_email and get_db():
             try:
-                user_ref = get_db().collection('users').document(user_email)
-                user_doc = user_ref.get()
-                
+                user_doc = get_db().collection('users').document(user_email).get()
                 if user_doc.exists:
                     user_data = user_doc.to_dict()
                     relations = user_data.get('relations', {})
-                    
-                    query_lower = query.lower()
-                    
-                    for relation, emails in relations.items():
-                        if query_lower in relation.lower():
-                            for email in emails:
-                                relation_contacts.append({
-                                    'name': f"{relation.capitalize()} - {email.split('@')[0]}",
-                                    'email': email,
-                                    'source': 'saved_relation'
-                                })
-                        else:
-                            for email in emails:
-                                if query_lower in email.lower():
-                                    relation_contacts.append({
-                                        'name': f"{relation.capitalize()} - {email.split('@')[0]}",
-                                        'email': email,
-                                        'source': 'saved_relation'
-                                    })
-                    
+                    email_counts = user_data.get('email_counts', {})
+            except Exception as e:
+                print(f"Error loading saved relations: {e}")
+
+        if user_email:
+            try:
+                google_contacts = contact_indexes.search(user_email, creds, query, email_counts=email_counts)
             except Exception as e:
-                print(f"Error searching saved relations: {e}")
+                print(f"Error searching contacts: {e}")
+                google_contacts = []
+            # Rank saved relations with the same counts, seeded from sent mail
+            email_counts = merge_counts(email_counts, contact_indexes.sent_counts(user_email))
+        else:
+            google_contacts = GmailOAuthManager.search_contacts_with_creds(creds, query)
+        
+        # Saved relations are few, so their index is built per request
+        relation_index = TypeaheadIndex()
+        for relation, emails in relations.items():
+            for email in emails:
+                relation_index.add(
+                    (relation, email),
+                    {
+                        'name': f"{relation.capitalize()} - {email.split('@')[0]}",
+                        'email': email,
+                        'source': 'saved_relation'
+                    },
+                    [relation, local_part(email)]
+                )
+        relation_contacts = relation_index.search(
+            query, score=lambda r: email_counts.get(r['email'].lower(), 0)
+        )
         
         all_contacts = []
         seen_emails = set()
@@ -317,28 +352,34 @@ def search_contacts():
 def get_current_user_email():
     """Get current user's email from session"""
     try:
-        if 'google_creds' not in session:
-            return None
-        
-        creds_data = session['google_creds']
-        creds = Credentials(
-            token=creds_data['token'],
-            refresh_token=creds_data.get('refresh_token'),
-            token_uri=creds_data['token_uri'],
-            client_id=creds_data['client_id'],
-            client_secret=creds_data['client_secret'],
-            scopes=creds_data['scopes']
-        )
-        
-        user_info_service = build('oauth2', 'v2', credentials=creds)
-        user_info = user_info_service.userinfo().get().execute()
-        return user_info.get('email')
+        identity = get_current_identity()
+        return identity['email'] if identity else None
         
     except Exception as e:
         print(f"Error fetching user email: {e}")
         return None
 
 
+def record_sent_addresses(user_email, to_field):
+    """Count one more email sent to each address in to_field (ranks contact search)"""
+    if not user_email or not to_field or not get_db():
+        return
+
+    try:
+        addresses = [addr.lower() for _, addr in getaddresses([to_field]) if addr]
+        if not addresses:
+            return
+
+        # set(merge=True) with a nested dict keeps the dots in addresses
+        # from being read as field paths
+        get_db().collection('users').document(user_email).set(
+            {'email_counts': {addr: firestore.Increment(1) for addr in addresses}},
+            merge=True
+        )
+    except Exception as e:
+        print(f"Error recording sent addresses: {e}")
+
+
 def save_email_relationship(user_email, recipient_email, relation):
     """Save the relationship between user and recipient to Firebase"""
     if not user_email or not recipient_email or not relation or not get_db():
@@ -418,7 +459,7 @@ def send_scheduled_draft_task(credentials_dict, draft_id):
         print(f"   ✅ Credentials OK")
         
         print(f"2️⃣ Building Gmail service...")
-        service = build('gmail', 'v1', credentials=creds)
+        service = get_service('gmail', 'v1', creds)
         print(f"   ✅ Service built")
         
         print(f"3️⃣ Sending draft {draft_id}...")
@@ -475,14 +516,21 @@ def send_email():
 
         if reply_to_id:
             try:
-                original_msg = service.users().messages().get(
-                    userId='me', 
-                    id=reply_to_id, 
-                    format='metadata', 
-                    metadataHeaders=['Message-ID', 'References']
-                ).execute()
-                headers = original_msg.get('payload', {}).get('headers', [])
-                rfc_message_id = next((h['value'] for h in headers if h['name'] == 'Message-ID'), None)
+                user_key = get_mailbox_key()
+                rfc_message_id = message_cache.get_header(user_key, reply_to_id, 'Message-ID') if user_key else None
+
+                if not rfc_message_id:
+                    original_msg = service.users().messages().get(
+                        userId='me', 
+                        id=reply_to_id, 
+                        format='metadata', 
+                        metadataHeaders=['Message-ID', 'References']
+                    ).execute()
+                    headers = original_msg.get('payload', {}).get('headers', [])
+                    rfc_message_id = get_header(original_msg.get('payload', {}), 'Message-ID')
+                    if user_key and headers:
+                        message_cache.put(user_key, reply_to_id, headers={h['name']: h['value'] for h in headers})
+
                 if rfc_message_id:
                     message['In-Reply-To'] = rfc_message_id
                     message['References'] = rfc_message_id
@@ -549,8 +597,10 @@ def send_email():
 
         sent_message = service.users().messages().send(userId='me', body=body_payload).execute()
         
+        user_email = get_current_user_email()
+        record_sent_addresses(user_email, to_email)
+
         try:
-            user_email = get_current_user_email()
             mediator = get_mediator()
             recipient_relation = mediator.json_state.get('recipient_relation')
             if user_email and recipient_relation:
@@ -574,10 +624,24 @@ def get_mediator():
         session_id = secrets.token_hex(16)
         session['session_id'] = session_id
 
-    if session_id not in mediators:
-        mediators[session_id] = EmailMediator()
+    return mediators.get(session_id)
 
-    return mediators[session_id]
+
+def save_mediator(mediator):
+    """Record a mediator after an advance; returns its state version"""
+    return mediators.save(session['session_id'], mediator)
+
+
+@app.route('/api/compose/reset', methods=['POST'])
+def reset_compose():
+    """Start a new email: fresh mediator state, no draft carried over from the last one"""
+    get_mediator()
+    session_id = session['session_id']
+    mediators.reset(session_id)
+    if draft_speculator:
+        draft_speculator.cancel(session_id)
+    discard_writer(session_id)
+    return jsonify({'success': True})
 
 
 @app.route('/api/compose/context', methods=['GET'])
@@ -595,11 +659,7 @@ def compose_context():
 @app.route('/api/email/generate', methods=['POST'])
 def generate_email():
     mediator = get_mediator()
-    description = mediator.json_state.get("description")
-    if mediator.json_state.get("recipient_name"):
-        description += "recipient_name: " + mediator.json_state.get("recipient_name")
-
-    revision = mediator.json_state.get("mail_revision") if mediator.json_state.get("mail_revision") else None
+    description = build_writer_prompt(mediator.json_state)
 
     if not description:
         return jsonify({
@@ -607,9 +667,14 @@ def generate_email():
             "error": "Description not ready"
         }), 400
 
-    if revision:
-        description += f"\n\nPlease revise the email as follows:\n{revision}"
-    email_data = generate_email_from_description(description)
+    email_data = None
+    job = draft_speculator.job_for(session['session_id'], description) if draft_speculator else None
+    if job:
+        email_data = job.result()
+    if not email_data:
+        email_data = generate_email_from_description(description, session_id=session['session_id'])
+    if not email_data:
+        return jsonify({"success": False, "error": "Email generation failed"}), 502
 
     return jsonify({
         "success": True,
@@ -617,6 +682,79 @@ def generate_email():
         "body": email_data["body"]
     })
 
+
+def follow_draft(job, description, session_id):
+    """
+    Events of a speculative draft. If it fails, is cancelled or stalls, the
+    draft is written again the normal way, after a ("restart",) event when
+    deltas of the failed attempt were already sent.
+    """
+    sent = False
+    for event in job.follow():
+        if event[0] == "error":
+            print(f"Speculative draft failed ({event[1]}), generating again")
+            break
+        sent = sent or event[0] == "delta"
+        yield event
+        if event[0] == "done":
+            return
+
+    # Let go of the writer if the speculative run is still going
+    job.cancel()
+    if sent:
+        yield ("restart",)
+    yield from stream_email_from_description(description, session_id=session_id)
+
+
+@app.route('/api/email/generate/stream', methods=['POST'])
+def generate_email_stream():
+    """
+    Same as /api/email/generate, streamed as newline-delimited JSON:
+    {"type": "delta", "field": "subject"|"body", "text": ...} while the
+    model writes, then one {"type": "done", "success": true, "subject",
+    "body"} (or {"type": "error", "success": false, "error"}). A
+    {"type": "restart"} line means the deltas so far are void and the
+    draft starts over.
+    """
+    mediator = get_mediator()
+    description = build_writer_prompt(mediator.json_state)
+
+    if not description:
+        return jsonify({
+            "success": False,
+            "error": "Description not ready"
+        }), 400
+
+    job = draft_speculator.job_for(session['session_id'], description) if draft_speculator else None
+    if job:
+        # Replays what the speculative draft has produced so far, then follows it
+        events = follow_draft(job, description, session['session_id'])
+    else:
+        events = stream_email_from_description(description, session_id=session['session_id'])
+
+    def stream():
+        for event in events:
+            if event[0] == "delta":
+                line = {"type": "delta", "field": event[1], "text": event[2]}
+            elif event[0] == "restart":
+                line = {"type": "restart"}
+            elif event[0] == "done":
+                line = {
+                    "type": "done",
+                    "success": True,
+                    "subject": event[1].get("subject", ""),
+                    "body": event[1].get("body", "")
+                }
+            else:
+                line = {"type": "error", "success": False, "error": event[1]}
+            yield json.dumps(line) + "\n"
+
+    return Response(stream(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
 @app.route('/api/mediator/advance', methods=['POST'])
 def advance_mediator():
     mediator = get_mediator()
@@ -625,47 +763,110 @@ def advance_mediator():
     if not user_input:
         return jsonify({'success': False, 'error': 'Missing input'}), 400
     
-    name = session.get('user_info', {}).get('name', 'User')
-    
-    if name == 'User':
-        # Fallback: fetch from database if not in session
-        try:
-            if 'google_creds' in session:
-                creds_data = session['google_creds']
-                creds = Credentials(
-                    token=creds_data['token'],
-                    refresh_token=creds_data.get('refresh_token'),
-                    token_uri=creds_data['token_uri'],
-                    client_id=creds_data['client_id'],
-                    client_secret=creds_data['client_secret'],
-                    scopes=creds_data['scopes']
-                )
-                
-                user_info_service = build('oauth2', 'v2', credentials=creds)
-                user_info = user_info_service.userinfo().get().execute()
-                email = user_info.get('email')
-                name = user_info.get('name', 'User')
-                
-                # Cache in session for future requests
-                session['user_info'] = {
-                    'email': email,
-                    'name': name
-                }
-        except Exception as e:
-            print(f"Error fetching user name: {e}")
+    name = 'User'
+    try:
+        identity = get_current_identity()
+        if identity and identity.get('name'):
+            name = identity['name']
+    except Exception as e:
+        print(f"Error fetching user name: {e}")
     
-    state = mediator.advance(user_input + f" sender_name: {name}")   # <-- Pass sender's name to mediator, fetched from the DB
+    mediator_input = user_input + f" sender_name: {name}"   # <-- Pass sender's name to mediator, fetched from the DB
+    if PIPELINE_MODE == 'two_stage':
+        state = mediator.advance(mediator_input)
+    else:
+        # Fused modes: the same call may write the draft, which the writer then serves
+        writer = get_writer(session['session_id'])
+        if draft_speculator:
+            # Superseded by this turn; otherwise it would hold the writer until it finished
+            draft_speculator.cancel(session['session_id'])
+        with writer.lock:
+            state = advance_pipeline(mediator, writer, mediator_input)
+    version = save_mediator(mediator)
     print(f"[MEDIATOR ADVANCE] Input='{user_input}' | New State={state}")
+
+    if draft_speculator:
+        session_id = session['session_id']
+        prompt = build_writer_prompt(state)
+        if prompt:
+            # No-op when a draft for this exact prompt is already running
+            draft_speculator.speculate(
+                session_id, prompt,
+                lambda: stream_email_from_description(prompt, session_id=session_id)
+            )
+        else:
+            draft_speculator.cancel(session_id)
     
     return jsonify({
         'success': True,
-        'state': state
+        'state': state,
+        'version': version
+    })
+
+# Mediator push channel: an event stream is closed after this long so the
+# browser reconnects (EventSource does this on its own, resuming from the
+# last version it saw); a comment line is sent when nothing changes.
+MEDIATOR_STREAM_SECONDS = 5 * 60
+MEDIATOR_KEEPALIVE_SECONDS = 15
+MAX_LONG_POLL_SECONDS = 30
+
+
+@app.route('/api/mediator/events', methods=['GET'])
+def mediator_events():
+    """
+    Server-sent events: one 'state' event per new mediator state version.
+    Event ids are state cursors, so a browser resuming with a Last-Event-ID
+    from before an eviction or restart gets the current state straight away.
+    """
+    get_mediator()
+    session_id = session['session_id']
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+
+    def stream():
+        cursor = since
+        yield "retry: 2000\n\n"
+        deadline = time.monotonic() + MEDIATOR_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            change = mediators.wait_for_change(session_id, cursor, MEDIATOR_KEEPALIVE_SECONDS)
+            if change is None:
+                yield ": keepalive\n\n"
+                continue
+            state, cursor = change
+            yield f"id: {cursor}\nevent: state\ndata: {json.dumps(state)}\n\n"
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
     })
 
+
 @app.route('/api/mediator/state', methods=['GET'])
 def mediator_state():
+    """
+    Current mediator state. With ?since=<cursor>&wait=<seconds> this is a
+    long poll: it answers as soon as the state moves past that cursor (the
+    last ETag), or with 304 when it does not within the wait.
+    """
     mediator = get_mediator()
-    return jsonify(mediator.json_state)
+    since = request.args.get('since')
+    if since is not None:
+        wait = min(request.args.get('wait', 0, type=float), MAX_LONG_POLL_SECONDS)
+        snapshot = mediators.wait_for_change(session['session_id'], since, wait)
+        if snapshot is None:
+            return '', 304
+    else:
+        snapshot = mediators.snapshot(session['session_id'])
+    if snapshot is None:
+        return jsonify(mediator.json_state)
+
+    state, cursor = snapshot
+    etag = f'"{cursor}"'
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304
+
+    response = jsonify(state)
+    response.headers['ETag'] = etag
+    return response
 
 
 @app.route("/api/audio/transcribe", methods=["POST"])
@@ -687,20 +888,87 @@ def transcribe_audio():
 
 
 
+PREVIEW_BODY_LENGTH = 500
+# Headers kept in the message cache: what the list view shows plus what
+# reply threading needs
+CACHED_HEADERS = ['subject', 'from', 'to', 'date', 'message-id', 'references']
+# Largest maxResults Gmail accepts for messages.list
+GMAIL_MAX_LIST_RESULTS = 500
+MAX_HYDRATE_IDS = 100
+# Cap on decoded body size for the message view; 0 means no cap
+DETAIL_BODY_MAX_BYTES = int(os.environ.get('DETAIL_BODY_MAX_BYTES', 0)) or None
+
+
+def extract_preview_body(payload, max_length=PREVIEW_BODY_LENGTH):
+    """Return the preferred text body of a 'full' payload, truncated for previews"""
+    # A UTF-8 character is at most 4 bytes, so this many bytes always
+    # covers max_length characters
+    return parse_payload(payload).preview_text(max_bytes=max_length * 4)[:max_length]
+
+
+def get_mailbox_key():
+    """Key for the current user's synced mailbox mirror"""
+    return get_current_user_email()
+
+
+def list_label_messages(service, label_id, max_results, page_token=None, offset=0):
+    """
+    One page of a label straight from Gmail, starting offset messages past
+    page_token. Gmail pages only by token, so the messages before offset
+    are listed (IDs only) and skipped. Returns (messages, next_page_token).
+    """
+    messages = []
+    while len(messages) < offset + max_results:
+        results = service.users().messages().list(
+            userId='me',
+            maxResults=min(offset + max_results - len(messages), GMAIL_MAX_LIST_RESULTS),
+            pageToken=page_token,
+            labelIds=[label_id]
+        ).execute()
+        messages.extend(results.get('messages', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+    return messages[offset:], page_token
+
+
 @app.route('/api/inbox/messages', methods=['GET'])
 def get_inbox_messages():
     """Fetch recent emails from user's inbox, sent folder, OR SEARCH RESULTS"""
     try:
         page_token = request.args.get('pageToken')
         max_results = int(request.args.get('maxResults', 20))
+        # Position of a mirror page that has to be served from Gmail instead
+        sync_offset = 0
         label_id = request.args.get('label', 'INBOX').upper()
         
         query = request.args.get('q') 
+        list_format = request.args.get('format', 'full').lower()
         
         service = get_gmail_service_from_session()
         if not service:
             return jsonify({'error': 'Not authenticated'}), 401
 
+        # Label views in metadata mode are served from the synced mirror;
+        # searches and legacy full-body listings still go to Gmail directly.
+        user_key = get_mailbox_key()
+        if user_key and not query and list_format == 'metadata' and (not page_token or is_sync_page_token(page_token)):
+            try:
+                synced_messages, next_page_token = inbox_sync.list_messages(
+                    service, user_key, label_id, max_results, page_token
+                )
+                return jsonify({
+                    'success': True,
+                    'messages': synced_messages,
+                    'nextPageToken': next_page_token
+                })
+            except Exception as e:
+                print(f"Inbox sync error, falling back to direct fetch: {e}")
+                inbox_sync.reset(user_key)
+                # Gmail can't read our token, but can serve the same position
+                sync_offset = sync_page_offset(page_token)
+                page_token = None
+
         if query:
             # If searching, use the 'q' parameter
             # We don't restrict by labelIds when searching (usually user wants to search all mail)
@@ -710,57 +978,48 @@ def get_inbox_messages():
                 pageToken=page_token,
                 q=query  # Pass the search query to Gmail
             ).execute()
+            messages = results.get('messages', [])
+            next_page_token = results.get('nextPageToken')
         else:
-            results = service.users().messages().list(
-                userId='me',
-                maxResults=max_results,
-                pageToken=page_token,
-                labelIds=[label_id]
-            ).execute()
-
-        messages = results.get('messages', [])
-        next_page_token = results.get('nextPageToken')
+            messages, next_page_token = list_label_messages(
+                service, label_id, max_results, page_token, sync_offset
+            )
         
+        # 'metadata' skips bodies entirely; the list view only renders the
+        # headers and Gmail's snippet. 'full' keeps the old body preview.
+        if list_format == 'metadata':
+            fetched_messages, fetch_errors = fetch_messages(
+                service,
+                [msg['id'] for msg in messages],
+                format='metadata',
+                metadata_headers=LIST_METADATA_HEADERS
+            )
+        else:
+            fetched_messages, fetch_errors = fetch_messages(
+                service,
+                [msg['id'] for msg in messages],
+                format='full'
+            )
+        for failed_id, error in fetch_errors.items():
+            print(f"Error fetching message {failed_id}: {error}")
+
         detailed_messages = []
-        for msg in messages:
+        for message in fetched_messages:
             try:
-                message = service.users().messages().get(
-                    userId='me',
-                    id=msg['id'],
-                    format='full'
-                ).execute()
-
-                headers = message['payload'].get('headers', [])
-                subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), '(No Subject)')
-                from_email = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown')
-                to_email = next((h['value'] for h in headers if h['name'].lower() == 'to'), 'Unknown')
-                date = next((h['value'] for h in headers if h['name'].lower() == 'date'), '')
-                
-                body = ''
-                if 'parts' in message['payload']:
-                    for part in message['payload']['parts']:
-                        if part['mimeType'] == 'text/plain' and 'body' in part and 'data' in part['body']:
-                            body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
-                            break
-                elif 'body' in message['payload'] and 'data' in message['payload']['body']:
-                    body = base64.urlsafe_b64decode(message['payload']['body']['data']).decode('utf-8', errors='ignore')
-
-                is_unread = 'UNREAD' in message.get('labelIds', [])
-
-                detailed_messages.append({
-                    'id': message['id'],
-                    'threadId': message['threadId'],
-                    'subject': subject,
-                    'from': from_email,
-                    'to': to_email,
-                    'date': date,
-                    'snippet': message.get('snippet', ''),
-                    'body': body[:500],
-                    'isUnread': is_unread
-                })
+                summary = summarize_message(message)
+                if list_format != 'metadata':
+                    summary['body'] = extract_preview_body(message['payload'])
+                    if user_key:
+                        cache_full_message(user_key, message)
+                elif user_key:
+                    headers = message['payload'].get('headers', [])
+                    message_cache.put(user_key, message['id'], headers={h['name']: h['value'] for h in headers})
+                    message_cache.set_labels(user_key, message['id'], message.get('labelIds', []))
+
+                detailed_messages.append(summary)
 
             except Exception as e:
-                print(f"Error fetching message {msg['id']}: {e}")
+                print(f"Error parsing message {message.get('id')}: {e}")
                 continue
 
         return jsonify({
@@ -773,6 +1032,52 @@ def get_inbox_messages():
         print(f"Inbox fetch error: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/inbox/messages/hydrate', methods=['POST'])
+def hydrate_inbox_messages():
+    """Fetch body previews for a set of message IDs listed in metadata mode"""
+    try:
+        service = get_gmail_service_from_session()
+        if not service:
+            return jsonify({'error': 'Not authenticated'}), 401
+
+        data = request.get_json(force=True, silent=True) or {}
+        message_ids = data.get('ids') or []
+
+        if not isinstance(message_ids, list) or not message_ids:
+            return jsonify({'success': False, 'error': 'Missing ids'}), 400
+
+        if len(message_ids) > MAX_HYDRATE_IDS:
+            return jsonify({'success': False, 'error': f'At most {MAX_HYDRATE_IDS} ids per request'}), 400
+
+        max_length = int(data.get('maxLength', PREVIEW_BODY_LENGTH))
+
+        fetched_messages, fetch_errors = fetch_messages(service, message_ids, format='full')
+
+        user_key = get_mailbox_key()
+
+        bodies = {}
+        for message in fetched_messages:
+            try:
+                bodies[message['id']] = extract_preview_body(message['payload'], max_length)
+                if user_key:
+                    cache_full_message(user_key, message)
+            except Exception as e:
+                fetch_errors[message['id']] = e
+
+        for failed_id, error in fetch_errors.items():
+            print(f"Error hydrating message {failed_id}: {error}")
+
+        return jsonify({
+            'success': True,
+            'bodies': bodies,
+            'errors': {message_id: str(error) for message_id, error in fetch_errors.items()}
+        })
+
+    except Exception as e:
+        print(f"Inbox hydrate error: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/scheduled/messages', methods=['GET'])
 def get_scheduled_messages():
     """Fetch pending scheduled emails from Firestore"""
@@ -822,6 +1127,77 @@ def get_scheduled_messages():
             'error': str(e)
         }), 500
 
+def parse_message_detail(message):
+    """Parse a 'full' Gmail message into the payload served by /api/inbox/message/<id>"""
+    payload = message.get('payload', {})
+    parsed = parse_payload(payload)
+
+    body, is_html = parsed.display_body(max_bytes=DETAIL_BODY_MAX_BYTES)
+
+    return {
+        'id': message['id'],
+        'threadId': message['threadId'],
+        'subject': parsed.header('Subject', '(No Subject)'),
+        'from': parsed.header('From', 'Unknown'),
+        'to': parsed.header('To', ''),
+        'date': parsed.header('Date', ''),
+        'body': body,
+        'isHtml': is_html,
+        'attachments': parsed.attachments
+    }
+
+
+def cache_full_message(user_key, message, detail=None):
+    """Store a 'full' Gmail message in the message cache"""
+    headers = message['payload'].get('headers', [])
+    message_cache.put(
+        user_key,
+        message['id'],
+        headers={h['name']: h['value'] for h in headers if h['name'].lower() in CACHED_HEADERS},
+        detail=detail if detail is not None else parse_message_detail(message)
+    )
+    message_cache.set_labels(user_key, message['id'], message.get('labelIds', []))
+
+
+def load_message_detail(service, user_key, message_id):
+    """(detail, labels) for a message, from the message cache or a 'full' fetch"""
+    cached = message_cache.get(user_key, message_id, field='detail') if user_key else None
+    if cached:
+        return cached['detail'], message_cache.get_labels(user_key, message_id)
+
+    message = service.users().messages().get(
+        userId='me',
+        id=message_id,
+        format='full'
+    ).execute()
+
+    detail = parse_message_detail(message)
+    if user_key:
+        cache_full_message(user_key, message, detail)
+    return detail, set(message.get('labelIds', []))
+
+
+def load_message_details(service, user_key, message_ids):
+    """Details for several messages, in order: cached ones, then one batched 'full' fetch for the rest"""
+    details = {}
+    for message_id in message_ids:
+        cached = message_cache.get(user_key, message_id, field='detail') if user_key else None
+        if cached:
+            details[message_id] = cached['detail']
+
+    missing = [message_id for message_id in message_ids if message_id not in details]
+    if missing:
+        messages, errors = fetch_messages(service, missing, format='full')
+        if errors:
+            raise next(iter(errors.values()))
+        for message in messages:
+            detail = parse_message_detail(message)
+            if user_key:
+                cache_full_message(user_key, message, detail)
+            details[message['id']] = detail
+    return [details[message_id] for message_id in message_ids]
+
+
 @app.route('/api/inbox/message/<message_id>', methods=['GET'])
 def get_message_detail(message_id):
     """Fetch full message details"""
@@ -830,86 +1206,25 @@ def get_message_detail(message_id):
         if not service:
             return jsonify({'error': 'Not authenticated'}), 401
 
-        message = service.users().messages().get(
-            userId='me',
-            id=message_id,
-            format='full'
-        ).execute()
-
-        headers = message['payload'].get('headers', [])
-        subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), '(No Subject)')
-        from_email = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown')
-        to_email = next((h['value'] for h in headers if h['name'].lower() == 'to'), '')
-        date = next((h['value'] for h in headers if h['name'].lower() == 'date'), '')
-        
-        body_html = ''
-        body_plain = ''
-        
-        # --- 1. NEW: Helper to extract attachments recursively ---
-        def get_attachments(parts):
-            atts = []
-            if not parts: return atts
-            for part in parts:
-                if part.get('filename') and part.get('body') and part['body'].get('attachmentId'):
-                    atts.append({
-                        'filename': part['filename'],
-                        'mimeType': part['mimeType'],
-                        'size': int(part['body'].get('size', 0)),
-                        'attachmentId': part['body']['attachmentId']
-                    })
-                if part.get('parts'):
-                    atts.extend(get_attachments(part['parts']))
-            return atts
-        # ---------------------------------------------------------
+        user_key = get_mailbox_key()
+        detail, labels = load_message_detail(service, user_key, message_id)
 
-        payload = message.get('payload', {})
-        parts = payload.get('parts', [])
-        
-        # Extract the attachments using the helper
-        attachments = get_attachments(parts)
-
-        # Logic to find Body Text/HTML
-        if parts:
-            for part in parts:
-                if part['mimeType'] == 'text/plain' and 'data' in part['body']:
-                    body_plain = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
-                elif part['mimeType'] == 'text/html' and 'data' in part['body']:
-                    body_html = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
-                elif part['mimeType'].startswith('multipart/') and 'parts' in part:
-                    for subpart in part['parts']:
-                        if subpart['mimeType'] == 'text/plain' and 'data' in subpart['body']:
-                            body_plain = base64.urlsafe_b64decode(subpart['body']['data']).decode('utf-8', errors='ignore')
-                        elif subpart['mimeType'] == 'text/html' and 'data' in subpart['body']:
-                            body_html = base64.urlsafe_b64decode(subpart['body']['data']).decode('utf-8', errors='ignore')
-        elif 'body' in payload and 'data' in payload['body']:
-            content = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8', errors='ignore')
-            if payload['mimeType'] == 'text/html':
-                body_html = content
-            else:
-                body_plain = content
-        
-        body = body_html if body_html else body_plain
-        is_html = bool(body_html)
+        # Label state is mutable, so it is the one thing we may still need
+        # to touch Gmail for; skip the call when the message is already read.
+        if labels is None or 'UNREAD' in labels:
+            service.users().messages().modify(
+                userId='me',
+                id=message_id,
+                body={'removeLabelIds': ['UNREAD']}
+            ).execute()
 
-        service.users().messages().modify(
-            userId='me',
-            id=message_id,
-            body={'removeLabelIds': ['UNREAD']}
-        ).execute()
+        if user_key:
+            message_cache.update_labels(user_key, message_id, remove=['UNREAD'])
+            inbox_sync.update_labels(user_key, message_id, remove=['UNREAD'])
 
         return jsonify({
             'success': True,
-            'message': {
-                'id': message['id'],
-                'threadId': message['threadId'],
-                'subject': subject,
-                'from': from_email,
-                'to': to_email,
-                'date': date,
-                'body': body,
-                'isHtml': is_html,
-                'attachments': attachments  # <--- WE SEND THE ATTACHMENTS HERE
-            }
+            'message': detail
         })
 
     except Exception as e:
@@ -923,9 +1238,214 @@ def get_message_detail(message_id):
     
 
 
-summarizer_service = EmailSummarizer()
+summary_cache = summary_cache_from_env()
+summarizer_service = EmailSummarizer(cache=summary_cache)
+
+
+def detail_summary_text(detail):
+    """Summarizer input for one parsed message: what the UI used to send"""
+    body = html_to_text(detail['body']) if detail['isHtml'] else detail['body']
+    return f"Subject: {detail['subject']}\n\n{body}"
+
+
+def thread_summary_text(details):
+    parts = []
+    for detail in details:
+        body = html_to_text(detail['body']) if detail['isHtml'] else detail['body']
+        parts.append(f"From: {detail['from']}\nDate: {detail['date']}\n\n{body}")
+    subject = details[0]['subject'] if details else ''
+    return f"Subject: {subject}\n\n" + "\n\n---\n\n".join(parts)
+
+
+def message_summary_key(user_key, message_id):
+    # A Gmail message never changes, so its ID is a complete cache key.
+    # IDs are only unique per mailbox: without a user, key on the text.
+    return summarizer_service.source_key(f"{user_key}:message:{message_id}") if user_key else None
+
+
+def summarize_message_id(service, user_key, message_id):
+    key = message_summary_key(user_key, message_id)
+    cached = summarizer_service.cached_summary(key) if key else None
+    if cached is not None:
+        return cached, {}
+
+    detail, _ = load_message_detail(service, user_key, message_id)
+    return summarizer_service.summarize_with_timings(detail_summary_text(detail), key=key)
+
+
+def summarize_thread_id(service, user_key, thread_id):
+    # A thread grows, so key on its current message IDs (a cheap 'minimal' fetch)
+    thread = service.users().threads().get(userId='me', id=thread_id, format='minimal').execute()
+    message_ids = [m['id'] for m in thread.get('messages', [])]
+    if not message_ids:
+        raise ValueError('Thread has no messages')
+
+    key = None
+    if user_key:
+        key = summarizer_service.source_key(f"{user_key}:thread:{thread_id}:{','.join(message_ids)}")
+    cached = summarizer_service.cached_summary(key) if key else None
+    if cached is not None:
+        return cached, {}
+
+    return summarizer_service.summarize_with_timings(
+        thread_summary_text(load_message_details(service, user_key, message_ids)), key=key
+    )
+
+
+# Digest: summaries of many messages at once
+MAX_DIGEST_MESSAGES = 50
+DIGEST_WORKERS = int(os.environ.get('DIGEST_WORKERS', 4))
+# Shared by every digest request, so total summarizer concurrency stays bounded
+digest_executor = ThreadPoolExecutor(max_workers=DIGEST_WORKERS, thread_name_prefix='digest')
+
+
+def digest_entry(detail, summary, cached):
+    # detail: a parsed message or an inbox list entry; both carry these fields
+    return {
+        'type': 'summary',
+        'id': detail['id'],
+        'threadId': detail['threadId'],
+        'subject': detail['subject'],
+        'from': detail['from'],
+        'date': detail['date'],
+        'summary': summary,
+        'cached': cached
+    }
+
+
+@app.route('/api/email/digest', methods=['POST'])
+def email_digest():
+    """
+    Summarize many messages: {ids: [...]} (at most MAX_DIGEST_MESSAGES) or
+    {label, maxResults, unreadOnly}.
+
+    Streams newline-delimited JSON, one {"type": "summary", ...} (or
+    {"type": "error", "id", "error"}) per message as it finishes, then
+    {"type": "done", "count"}. Cached summaries come first.
+    """
+    service = get_gmail_service_from_session()
+    if not service:
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+
+    data = request.get_json(silent=True) or {}
+    message_ids = data.get('ids')
+    if message_ids is not None:
+        if not isinstance(message_ids, list) or not all(isinstance(i, str) and i for i in message_ids):
+            return jsonify({'success': False, 'error': 'ids must be a list of message IDs'}), 400
+        if len(message_ids) > MAX_DIGEST_MESSAGES:
+            return jsonify({
+                'success': False,
+                'error': f'At most {MAX_DIGEST_MESSAGES} messages per digest'
+            }), 400
+    try:
+        if not message_ids:
+            label = (data.get('label') or 'INBOX').upper()
+            max_results = min(int(data.get('maxResults', 20)), MAX_DIGEST_MESSAGES)
+            results = service.users().messages().list(
+                userId='me',
+                labelIds=[label],
+                q='is:unread' if data.get('unreadOnly') else None,
+                maxResults=max_results
+            ).execute()
+            message_ids = [m['id'] for m in results.get('messages', [])]
+    except Exception as e:
+        print(f"Digest list error: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    message_ids = list(dict.fromkeys(message_ids))[:MAX_DIGEST_MESSAGES]
+    user_key = get_mailbox_key()
+
+    def stream():
+        count = 0
+        details = {}
+        to_fetch = []
+        # Summary cached but the detail evicted: only the headers are needed
+        summaries_to_label = {}
+
+        # 1. Summaries already cached (by ID), and details already parsed
+        for message_id in message_ids:
+            cached_detail = message_cache.get(user_key, message_id, field='detail') if user_key else None
+            detail = cached_detail['detail'] if cached_detail else None
+            key = message_summary_key(user_key, message_id)
+            summary = summarizer_service.cached_summary(key) if key else None
+
+            if detail and summary is not None:
+                count += 1
+                yield json.dumps(digest_entry(detail, summary, True)) + "\n"
+            elif summary is not None:
+                summaries_to_label[message_id] = summary
+            elif detail:
+                details[message_id] = detail
+            else:
+                to_fetch.append(message_id)
+
+        if summaries_to_label:
+            try:
+                messages, errors = fetch_messages(
+                    service, list(summaries_to_label), format='metadata',
+                    metadata_headers=LIST_METADATA_HEADERS
+                )
+            except Exception as e:
+                messages, errors = [], {message_id: str(e) for message_id in summaries_to_label}
+            for message in messages:
+                count += 1
+                entry = digest_entry(summarize_message(message), summaries_to_label[message['id']], True)
+                yield json.dumps(entry) + "\n"
+            for message_id, error in errors.items():
+                yield json.dumps({'type': 'error', 'id': message_id, 'error': str(error)}) + "\n"
+
+        # 2. Everything else in Gmail batch requests
+        if to_fetch:
+            try:
+                messages, errors = fetch_messages(service, to_fetch, format='full')
+            except Exception as e:
+                messages, errors = [], {message_id: str(e) for message_id in to_fetch}
+            for message in messages:
+                detail = parse_message_detail(message)
+                if user_key:
+                    cache_full_message(user_key, message, detail)
+                details[message['id']] = detail
+            for message_id, error in errors.items():
+                yield json.dumps({'type': 'error', 'id': message_id, 'error': str(error)}) + "\n"
+
+        # 3. Summarize with bounded concurrency, in completion order
+        futures = {
+            digest_executor.submit(
+                summarizer_service.summarize,
+                detail_summary_text(detail),
+                message_summary_key(user_key, message_id)
+            ): detail
+            for message_id, detail in details.items()
+        }
+        for future in as_completed(futures):
+            detail = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                summary, error = None, str(e)
+            else:
+                # The summarizer reports API failures as its summary text
+                error = summary if summary == summarizer_service.API_ERROR_SUMMARY else None
+            if error:
+                yield json.dumps({'type': 'error', 'id': detail['id'], 'error': error}) + "\n"
+            else:
+                count += 1
+                yield json.dumps(digest_entry(detail, summary, False)) + "\n"
+
+        yield json.dumps({'type': 'done', 'count': count}) + "\n"
+
+    return Response(stream(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
 @app.route('/api/email/summarize', methods=['POST', 'OPTIONS'])
 def summarize_email_route():
+    """
+    Summarize {text}, or a message or thread the server fetches itself:
+    {messageId} / {threadId}.
+    """
     if request.method == 'OPTIONS':
         return jsonify({'status': 'ok'}), 200
 
@@ -935,16 +1455,37 @@ def summarize_email_route():
         if not data:
             return jsonify({'success': False, 'error': 'No JSON data received'}), 400
 
+        message_id = data.get('messageId')
+        thread_id = data.get('threadId')
+
+        if message_id or thread_id:
+            service = get_gmail_service_from_session()
+            if not service:
+                return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+            user_key = get_mailbox_key()
+
+            if message_id:
+                summary_result, timings = summarize_message_id(service, user_key, message_id)
+            else:
+                summary_result, timings = summarize_thread_id(service, user_key, thread_id)
+
+            return jsonify({
+                'success': True,
+                'summary': summary_result,
+                'timings': timings
+            })
+
         text_content = data.get('text', '')
         
         if not text_content:
             return jsonify({'success': False, 'error': 'Missing text'}), 400
 
-        summary_result = summarizer_service.summarize(text_content)
+        summary_result, timings = summarizer_service.summarize_with_timings(text_content)
 
         return jsonify({
             'success': True,
-            'summary': summary_result
+            'summary': summary_result,
+            'timings': timings
         })
 
     except Exception as e:
@@ -987,6 +1528,23 @@ def download_attachment():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/cache/status', methods=['GET'])
+def cache_status():
+    return jsonify({
+        'messages': message_cache.stats(),
+        'inbox_sync': inbox_sync.stats(),
+        'mediators': mediators.stats(),
+        'mediator_fast_path': fast_path_stats.stats(),
+        'mediator_output': mediator_output_stats.stats(),
+        'writers': writer_stats(),
+        'writer_edits': writer_edit_stats.stats(),
+        'drafts': draft_speculator.stats() if draft_speculator else None,
+        'summaries': summary_cache.stats(),
+        'summary_stages': summarizer_service.timings.stats(),
+        'llm': llm_gateway.stats()
+    })
+
+
 @app.route('/api/scheduler/status', methods=['GET'])
 def scheduler_status():
     try:
@@ -1061,7 +1619,7 @@ def run_schedule_checker():
                     )
                     
                     print(f"   2️⃣ Building Gmail service...")
-                    service = build('gmail', 'v1', credentials=creds)
+                    service = get_service('gmail', 'v1', creds)
                     
                     draft_id = data.get('draft_id')
                     if not draft_id:
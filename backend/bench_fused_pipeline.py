@@ -0,0 +1,159 @@
+# bench_fused_pipeline.py
+"""
+Utterance-to-draft latency of the pipeline modes (see fused_pipeline):
+two-stage (EmailMediator.advance, then EmailWriter.generate_email), fused
+(one call for state and draft on every turn) and fused_first (fused until
+the first draft, then two-stage with edit-operation revisions).
+
+Each session replays SCRIPT: the first turn names the recipient, the
+second completes the description, the rest are revisions. Latency is
+counted for the turns that end with a draft. The fast path is off so every
+pipeline sees every turn.
+
+By default the LLM gateway is given a stub client. Each call's latency is
+modelled as a fixed cost, plus a prefill cost per prompt token, plus a
+decode cost per output token (tune with --base-ms / --per-token-ms /
+--decode-ms). Pass --live to call the real API instead (needs
+OPENAI_API_KEY).
+
+Run from the backend directory:
+    python bench_fused_pipeline.py [--sessions 5] [--live]
+"""
+
+import argparse
+import json
+import time
+from types import SimpleNamespace
+
+from info_extractor import EmailMediator
+from email_writer import EmailWriter
+from email_agent_service import build_writer_prompt
+from fused_pipeline import PIPELINE_MODES, advance_pipeline
+from llm_gateway import LLMGateway
+from mediator_context import estimate_tokens, message_tokens
+from mediator_output import encode_patch
+
+DESCRIPTION = (
+    "Email to Priya, the user's manager, letting her know the user will be late to tomorrow's "
+    "standup because of a dentist appointment, and will catch up on anything missed afterwards."
+)
+BASE = {
+    "recipient_name": "Priya", "recipient_relation": "manager", "recipient_options": None,
+    "cc": None, "bcc": None, "description": None, "mail_revision": None
+}
+SCRIPT = [
+    ("I need to email Priya, my manager", BASE),
+    ("Tell her I'll be late to tomorrow's standup because of a dentist appointment",
+     dict(BASE, description=DESCRIPTION)),
+    ("Make it a bit more formal",
+     dict(BASE, description=DESCRIPTION, mail_revision="Make the tone of the email more formal.")),
+    ("Also mention the deploy is still on track for Friday",
+     dict(BASE, description=DESCRIPTION, mail_revision="Add a sentence that the deploy is still on track for Friday.")),
+    ("Shorter please",
+     dict(BASE, description=DESCRIPTION, mail_revision="Shorten the second paragraph.")),
+    ("Add a thank you at the end",
+     dict(BASE, description=DESCRIPTION, mail_revision="Add a short thank you before the closing.")),
+]
+PARAGRAPH = (
+    "I wanted to let you know that I will be a little late to tomorrow's standup, as I have a dentist "
+    "appointment first thing in the morning that I was not able to move. "
+)
+EMAIL = {
+    "subject": "Running late to tomorrow's standup",
+    "body": "Hi Priya,\n\n" + PARAGRAPH * 2 + "\n\n" + PARAGRAPH * 2 + "\n\n" + PARAGRAPH
+            + "\n\nBest regards,\nJordan"
+}
+
+
+class StubCompletions:
+    """Answers as the mediator, writer or fused call would, with modelled latency"""
+
+    def __init__(self, base_ms, per_token_ms, decode_ms):
+        self.base_ms = base_ms
+        self.per_token_ms = per_token_ms
+        self.decode_ms = decode_ms
+        self.state = dict(BASE, recipient_name=None, recipient_relation=None)
+        self.target = None
+        self.modelled_ms = 0.0
+
+    def create(self, model, messages, **kwargs):
+        response_format = kwargs.get("response_format") or {}
+        schema_name = response_format.get("json_schema", {}).get("name")
+
+        if schema_name in ("mediator_patch", "mediator_fused"):
+            reply = json.loads(encode_patch(self.state, self.target))
+            if schema_name == "mediator_fused":
+                reply["email"] = EMAIL if self.target.get("description") else None
+            self.state = self.target
+            content = json.dumps(reply)
+        elif messages[0]["content"].startswith("You revise"):
+            content = json.dumps({"mode": "edit", "edits": [
+                {"op": "replace_paragraph", "index": 2, "text": PARAGRAPH.strip()}
+            ]})
+        else:
+            content = json.dumps(EMAIL)
+
+        self.modelled_ms += (self.base_ms + self.per_token_ms * message_tokens(messages)
+                             + self.decode_ms * estimate_tokens(content))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def run_session(mode, args):
+    """Latency in ms of each turn that ends with a draft"""
+    mediator = EmailMediator(fast_path=False)
+    writer = EmailWriter()
+    stub = None
+    if not args.live:
+        stub = StubCompletions(args.base_ms, args.per_token_ms, args.decode_ms)
+        mediator.llm = writer.llm = LLMGateway(client=SimpleNamespace(chat=SimpleNamespace(completions=stub)))
+
+    latencies = []
+    for utterance, target in SCRIPT:
+        if stub:
+            stub.target = target
+            stub.modelled_ms = 0.0
+        user_input = utterance + " sender_name: Jordan"
+
+        started = time.perf_counter()
+        state = advance_pipeline(mediator, writer, user_input, mode)
+        prompt = build_writer_prompt(state)
+        draft = writer.generate_email(prompt) if prompt else None
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if draft:
+            latencies.append(elapsed_ms + (stub.modelled_ms if stub else 0))
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--base-ms", type=float, default=300.0)
+    parser.add_argument("--per-token-ms", type=float, default=0.05)
+    parser.add_argument("--decode-ms", type=float, default=4.0)
+    parser.add_argument("--live", action="store_true")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in PIPELINE_MODES:
+        per_turn = []
+        for _ in range(args.sessions):
+            for i, ms in enumerate(run_session(mode, args)):
+                if i == len(per_turn):
+                    per_turn.append([])
+                per_turn[i].append(ms)
+        results[mode] = [sum(samples) / len(samples) for samples in per_turn]
+
+    print(f"{'draft':>6}" + "".join(f"{mode + ' ms':>16}" for mode in PIPELINE_MODES))
+    print('-' * (6 + 16 * len(PIPELINE_MODES)))
+    for i in range(len(results['two_stage'])):
+        label = "first" if i == 0 else f"rev {i}"
+        print(f"{label:>6}" + "".join(f"{results[mode][i]:>16.0f}" for mode in PIPELINE_MODES))
+    for mode in PIPELINE_MODES:
+        latencies = results[mode]
+        print(f"{mode}: {sum(latencies) / len(latencies):.0f} ms mean utterance-to-draft"
+              f"{'' if args.live else ' (modelled)'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# bench_google_services.py
+"""
+Per-request cost of building Google API service objects.
+
+Compares a plain discovery.build() per request (what every route used to
+do) with google_services.get_service(). No network access is needed: the
+services are built but never called.
+
+Run from the backend directory:
+    python bench_google_services.py
+"""
+
+import timeit
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+from google_services import get_service
+
+REQUESTS = 50
+
+
+def _credentials(index=0):
+    return Credentials(
+        token=f'token-{index}',
+        refresh_token='refresh',
+        token_uri='https://oauth2.googleapis.com/token',
+        client_id='client',
+        client_secret='secret'
+    )
+
+
+def main():
+    print(f"{'api':<12} {'build() per request':>20} {'get_service (warm)':>20} {'get_service (new user)':>24}")
+    print('-' * 80)
+
+    for api, version in [('gmail', 'v1'), ('oauth2', 'v2'), ('people', 'v1')]:
+        creds = _credentials()
+
+        cold = min(timeit.repeat(
+            lambda: build(api, version, credentials=creds), number=REQUESTS, repeat=3
+        )) / REQUESTS * 1000
+
+        get_service(api, version, creds)
+        warm = min(timeit.repeat(
+            lambda: get_service(api, version, creds), number=REQUESTS, repeat=3
+        )) / REQUESTS * 1000
+
+        # A different credential still skips discovery parsing
+        counter = iter(range(1, 10 ** 6))
+        new_user = min(timeit.repeat(
+            lambda: get_service(api, version, _credentials(next(counter))), number=REQUESTS, repeat=3
+        )) / REQUESTS * 1000
+
+        print(f"{api + ' ' + version:<12} {cold:>17.3f} ms {warm:>17.4f} ms {new_user:>21.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+# bench_mediator_context.py
+"""
+Prompt size and per-turn latency of EmailMediator.advance over long
+compose sessions: full chat history (the old behaviour) against the bounded
+MediatorContext.
+
+By default the LLM gateway is given a stub client that echoes a plausible
+mediator reply, and model latency is modelled as a fixed cost plus a prefill
+cost per prompt token and a decode cost per output token (tune with
+--base-ms / --per-token-ms / --decode-ms). --output-mode picks full-state or
+delta replies. Pass --live to call the real API instead (needs
+OPENAI_API_KEY; costs a few hundred calls).
+
+Run from the backend directory:
+    python bench_mediator_context.py [--turns 50] [--sessions 3] [--output-mode delta] [--live]
+"""
+
+import argparse
+import json
+import time
+from types import SimpleNamespace
+
+from info_extractor import EmailMediator
+from llm_gateway import LLMGateway
+from mediator_context import estimate_tokens, message_tokens
+from mediator_output import OUTPUT_MODE, encode_patch
+
+SCRIPT = [
+    "I need to email Priya",
+    "She's my manager",
+    "Tell her I'll be late to tomorrow's standup because of a dentist appointment",
+    "Make it a bit more formal",
+    "Also mention I'll catch up on the notes afterwards and that the deploy is still on track for Friday",
+    "Shorter please",
+    "cc Daniel from the platform team",
+    "Actually say I'll join remotely for the first ten minutes if I can",
+    "Drop the part about the notes",
+    "Add a thank you at the end",
+]
+
+
+class StubCompletions:
+    """Answers like the mediator would and records what it was sent"""
+
+    def __init__(self, base_ms, per_token_ms, decode_ms):
+        self.base_ms = base_ms
+        self.per_token_ms = per_token_ms
+        self.decode_ms = decode_ms
+        self.state = {}
+        self.last_prompt_tokens = 0
+        self.last_output_tokens = 0
+        self.last_latency_ms = 0
+
+    def create(self, model, messages, **kwargs):
+        previous = self.state
+        user_input = messages[-1]["content"]
+        # The first request sets the description; later turns are revisions of the draft
+        description = self.state.get("description") or (
+            "Email to Priya, the user's manager. " + user_input + " Keep the tone polite and concise, "
+            "explain the reason briefly, and confirm the user will follow up on anything missed."
+        )
+        self.state = {
+            "recipient_name": "Priya",
+            "recipient_relation": "manager",
+            "recipient_options": None,
+            "cc": ["Daniel"] if "cc" in user_input or self.state.get("cc") else None,
+            "bcc": None,
+            "description": description,
+            "mail_revision": user_input if self.state else None
+        }
+        if kwargs.get("response_format", {}).get("type") == "json_schema":
+            content = encode_patch(previous, self.state)
+        else:
+            content = json.dumps(self.state)
+
+        self.last_prompt_tokens = message_tokens(messages)
+        self.last_output_tokens = estimate_tokens(content)
+        self.last_latency_ms = (self.base_ms + self.per_token_ms * self.last_prompt_tokens
+                                + self.decode_ms * self.last_output_tokens)
+        reply = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=reply)])
+
+
+def make_mediator(bounded, live, args):
+    if bounded:
+        mediator = EmailMediator(output_mode=args.output_mode)
+    else:
+        # Never compact: every turn is resent, as before
+        mediator = EmailMediator(token_budget=10 ** 9, window_turns=10 ** 9, output_mode=args.output_mode)
+    if not live:
+        stub = StubCompletions(args.base_ms, args.per_token_ms, args.decode_ms)
+        mediator.llm = LLMGateway(client=SimpleNamespace(chat=SimpleNamespace(completions=stub)))
+        mediator.stub = stub
+    return mediator
+
+
+def run_session(mediator, turns, live):
+    """[(prompt_tokens, latency_ms)] per turn"""
+    results = []
+    for turn in range(turns):
+        user_input = SCRIPT[turn % len(SCRIPT)]
+        prompt_tokens = message_tokens(mediator.context.build_messages(mediator.json_state, user_input))
+
+        start = time.perf_counter()
+        mediator.advance(user_input)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        if not live:
+            # Modelled API time plus the real local overhead
+            elapsed_ms += mediator.stub.last_latency_ms
+        results.append((prompt_tokens, elapsed_ms))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=3)
+    parser.add_argument("--base-ms", type=float, default=300.0)
+    parser.add_argument("--per-token-ms", type=float, default=0.05)
+    parser.add_argument("--decode-ms", type=float, default=4.0)
+    parser.add_argument("--output-mode", choices=("full", "delta"), default=OUTPUT_MODE)
+    parser.add_argument("--live", action="store_true")
+    args = parser.parse_args()
+
+    checkpoints = [t for t in (1, 10, 25, 50, args.turns) if t <= args.turns]
+    checkpoints = sorted(set(checkpoints))
+
+    print(f"{'turn':>5} {'full tokens':>12} {'full ms':>9} {'bounded tokens':>15} {'bounded ms':>11}")
+    print('-' * 56)
+
+    totals = {}
+    for bounded in (False, True):
+        per_turn = [[0, 0.0] for _ in range(args.turns)]
+        for _ in range(args.sessions):
+            mediator = make_mediator(bounded, args.live, args)
+            for i, (tokens, ms) in enumerate(run_session(mediator, args.turns, args.live)):
+                per_turn[i][0] += tokens / args.sessions
+                per_turn[i][1] += ms / args.sessions
+        totals[bounded] = per_turn
+
+    for turn in checkpoints:
+        full_tokens, full_ms = totals[False][turn - 1]
+        bounded_tokens, bounded_ms = totals[True][turn - 1]
+        print(f"{turn:>5} {full_tokens:>12.0f} {full_ms:>9.0f} {bounded_tokens:>15.0f} {bounded_ms:>11.0f}")
+
+    for bounded, label in ((False, 'full history'), (True, 'bounded')):
+        tokens = sum(t for t, _ in totals[bounded])
+        print(f"{label}: {tokens:.0f} prompt tokens per {args.turns}-turn session")
+
+
+if __name__ == '__main__':
+    main()
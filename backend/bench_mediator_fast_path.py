@@ -0,0 +1,157 @@
+# bench_mediator_fast_path.py
+"""
+Hit rate and latency saved by the mediator fast path.
+
+CORPUS holds utterances as users type or dictate them, each with the
+mediator state it arrives in and what the fast path should do with it:
+the fields it must change, or None when only the model can decide.
+Every utterance is run through try_fast_path(); wrong answers (a hit
+where the model was required, or the wrong fields) are listed.
+
+Model latency for each hit is modelled as a fixed cost plus a prefill
+cost per prompt token (tune with --base-ms / --per-token-ms); pass --live
+to time the real mediator call for each hit instead (needs OPENAI_API_KEY).
+
+Run from the backend directory:
+    python bench_mediator_fast_path.py [--repeat 1000] [--live]
+"""
+
+import argparse
+import time
+
+from info_extractor import EmailMediator
+from mediator_context import message_tokens
+from mediator_fast_path import try_fast_path
+
+EMPTY = {
+    "recipient_name": None, "recipient_relation": None, "recipient_options": None,
+    "cc": None, "bcc": None, "description": None, "mail_revision": None
+}
+DRAFTING = dict(
+    EMPTY, recipient_name="Priya", recipient_relation="manager",
+    description="Email to Priya, the user's manager, saying the user will be late to tomorrow's standup."
+)
+# While ambiguous the description is held back, so a pick still needs the model
+AMBIGUOUS = dict(EMPTY, recipient_name="Alex", recipient_options=3)
+AMBIGUOUS_DESCRIBED = dict(AMBIGUOUS, description="Email to Alex asking for the Q3 budget figures.")
+REVISING = dict(DRAFTING, cc=["Daniel"], mail_revision="Make the email more formal.")
+
+CORPUS = [
+    # Bare addresses
+    (EMPTY, "bob@example.com", {"recipient_name": "bob@example.com"}),
+    (EMPTY, "priya.shah@acme.io", {"recipient_name": "priya.shah@acme.io"}),
+    (EMPTY, "to j.doe@uni.edu", {"recipient_name": "j.doe@uni.edu"}),
+    (EMPTY, "send it to hr@company.com please", {"recipient_name": "hr@company.com"}),
+    (EMPTY, "bob@example.com and alice@example.com", None),
+    (DRAFTING, "bob@example.com", None),
+    (EMPTY, "email bob@example.com about the invoice", None),
+    # cc / bcc
+    (DRAFTING, "cc bob@x.com", {"cc": ["bob@x.com"]}),
+    (DRAFTING, "cc: alice@example.com", {"cc": ["alice@example.com"]}),
+    (DRAFTING, "Cc Daniel", {"cc": ["Daniel"]}),
+    (DRAFTING, "cc Daniel and Maria", {"cc": ["Daniel", "Maria"]}),
+    (DRAFTING, "also cc Sam Lee", {"cc": ["Sam Lee"]}),
+    (DRAFTING, "bcc legal@acme.io", {"bcc": ["legal@acme.io"]}),
+    (DRAFTING, "add Daniel to cc", {"cc": ["Daniel"]}),
+    (DRAFTING, "put finance@acme.io in bcc", {"bcc": ["finance@acme.io"]}),
+    (REVISING, "cc Maria", {"cc": ["Daniel", "Maria"]}),
+    (REVISING, "cc Daniel", {}),
+    (DRAFTING, "cc my boss", None),
+    (DRAFTING, "cc the whole team", None),
+    (DRAFTING, "remove Daniel from cc", None),
+    (DRAFTING, "don't cc anyone", None),
+    (DRAFTING, "cc Daniel and tell him the deploy is on track", None),
+    # Approval
+    (DRAFTING, "yes", {}),
+    (DRAFTING, "Yes.", {}),
+    (DRAFTING, "send it", {}),
+    (DRAFTING, "looks good!", {}),
+    (DRAFTING, "ok send it", {}),
+    (DRAFTING, "Perfect, thanks", {}),
+    (REVISING, "that's fine", {}),
+    (REVISING, "sounds good", {}),
+    (DRAFTING, "yes but make it shorter", None),
+    (DRAFTING, "no", None),
+    (DRAFTING, "not quite", None),
+    # Picking a recipient while ambiguous
+    (AMBIGUOUS, "2", None),
+    (AMBIGUOUS, "the second one", None),
+    (AMBIGUOUS_DESCRIBED, "2", {"recipient_options": None}),
+    (AMBIGUOUS_DESCRIBED, "option 2", {"recipient_options": None}),
+    (AMBIGUOUS_DESCRIBED, "the second one", {"recipient_options": None}),
+    (AMBIGUOUS_DESCRIBED, "first", {"recipient_options": None}),
+    (AMBIGUOUS_DESCRIBED, "#3", {"recipient_options": None}),
+    (AMBIGUOUS_DESCRIBED, "I mean the third", {"recipient_options": None}),
+    (AMBIGUOUS_DESCRIBED, "5", None),
+    (AMBIGUOUS, "the one from marketing", None),
+    (AMBIGUOUS, "Alex Chen", None),
+    (DRAFTING, "2", None),
+    # Ordinary requests: always the model
+    (EMPTY, "I need to email Priya", None),
+    (EMPTY, "Write to my professor asking for an extension on the assignment", None),
+    (DRAFTING, "Make it a bit more formal", None),
+    (DRAFTING, "Shorter please", None),
+    (DRAFTING, "Also mention the deploy is still on track for Friday", None),
+    (REVISING, "Drop the part about the notes", None),
+    (REVISING, "Add a thank you at the end", None),
+    (DRAFTING, "Actually send it to Daniel instead", None),
+    (EMPTY, "yo can u tell sam im running late", None),
+]
+
+
+def changed_fields(before, after):
+    return {k: v for k, v in after.items() if before.get(k) != v}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=1000)
+    parser.add_argument("--base-ms", type=float, default=300.0)
+    parser.add_argument("--per-token-ms", type=float, default=0.05)
+    parser.add_argument("--live", action="store_true")
+    args = parser.parse_args()
+
+    hits = 0
+    wrong = []
+    saved_ms = 0.0
+    mediator = EmailMediator(fast_path=False)
+
+    for state, utterance, expected in CORPUS:
+        user_input = utterance + " sender_name: Jordan"
+        result = try_fast_path(state, user_input)
+        actual = None if result is None else changed_fields(state, result)
+        if actual != expected:
+            wrong.append((utterance, expected, actual))
+        if result is None:
+            continue
+
+        hits += 1
+        if args.live:
+            mediator.json_state = dict(state)
+            mediator.context.reset()
+            started = time.perf_counter()
+            mediator.advance(user_input)
+            saved_ms += (time.perf_counter() - started) * 1000
+        else:
+            tokens = message_tokens(mediator.context.build_messages(state, user_input))
+            saved_ms += args.base_ms + args.per_token_ms * tokens
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for state, utterance, _ in CORPUS:
+            try_fast_path(state, utterance)
+    parse_us = (time.perf_counter() - started) * 1e6 / (args.repeat * len(CORPUS))
+
+    model_required = sum(1 for *_, expected in CORPUS if expected is None)
+    print(f"utterances:       {len(CORPUS)} ({len(CORPUS) - model_required} trivial, {model_required} need the model)")
+    print(f"fast path hits:   {hits} ({hits / len(CORPUS):.0%} of all inputs)")
+    print(f"pre-parse cost:   {parse_us:.1f} us per input")
+    print(f"model time saved: {saved_ms:.0f} ms total, {saved_ms / max(hits, 1):.0f} ms per hit"
+          f"{'' if args.live else ' (modelled)'}")
+    print(f"wrong answers:    {len(wrong)}")
+    for utterance, expected, actual in wrong:
+        print(f"  {utterance!r}: expected {expected}, got {actual}")
+
+
+if __name__ == '__main__':
+    main()
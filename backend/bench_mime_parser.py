@@ -0,0 +1,155 @@
+# bench_mime_parser.py
+"""
+Micro-benchmarks for mime_parser against the extraction code it replaced.
+
+Run from the backend directory:
+    python bench_mime_parser.py
+"""
+
+import base64
+import timeit
+
+from mime_parser import parse_payload
+
+
+def _encode(text):
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def _text_part(mime_type, text):
+    return {'mimeType': mime_type, 'filename': '', 'body': {'size': len(text), 'data': _encode(text)}}
+
+
+def _attachment_part(index):
+    return {
+        'mimeType': 'application/pdf',
+        'filename': f'report-{index}.pdf',
+        'body': {'size': 250000, 'attachmentId': f'att-{index}'}
+    }
+
+
+def large_message():
+    """multipart/alternative with a 5 MB HTML part"""
+    html = '<html><body>' + '<p>Quarterly numbers look good.</p>' * 150000 + '</body></html>'
+    plain = 'Quarterly numbers look good.\n' * 150000
+    return {
+        'mimeType': 'multipart/alternative',
+        'headers': [{'name': 'Subject', 'value': 'Large'}],
+        'parts': [_text_part('text/plain', plain), _text_part('text/html', html)]
+    }
+
+
+def nested_message(depth=60):
+    """A forward-of-a-forward chain with the body at the bottom"""
+    part = {
+        'mimeType': 'multipart/alternative',
+        'parts': [_text_part('text/plain', 'Original text\n' * 200), _text_part('text/html', '<p>Original</p>' * 200)]
+    }
+    for _ in range(depth):
+        part = {'mimeType': 'multipart/mixed', 'parts': [part]}
+    part['headers'] = [{'name': 'Subject', 'value': 'Nested'}]
+    return part
+
+
+def attachment_message(count=200):
+    """Short body followed by many attachments"""
+    return {
+        'mimeType': 'multipart/mixed',
+        'headers': [{'name': 'Subject', 'value': 'Attachments'}],
+        'parts': [
+            {
+                'mimeType': 'multipart/alternative',
+                'parts': [_text_part('text/plain', 'See attached.'), _text_part('text/html', '<p>See attached.</p>')]
+            }
+        ] + [_attachment_part(i) for i in range(count)]
+    }
+
+
+# ----------------------------------------------------------------------
+# Previous implementation (inline in app.py before mime_parser existed)
+# ----------------------------------------------------------------------
+def legacy_detail(payload):
+    def get_attachments(parts):
+        atts = []
+        if not parts: return atts
+        for part in parts:
+            if part.get('filename') and part.get('body') and part['body'].get('attachmentId'):
+                atts.append({
+                    'filename': part['filename'],
+                    'mimeType': part['mimeType'],
+                    'size': int(part['body'].get('size', 0)),
+                    'attachmentId': part['body']['attachmentId']
+                })
+            if part.get('parts'):
+                atts.extend(get_attachments(part['parts']))
+        return atts
+
+    body_html = ''
+    body_plain = ''
+    parts = payload.get('parts', [])
+    attachments = get_attachments(parts)
+
+    if parts:
+        for part in parts:
+            if part['mimeType'] == 'text/plain' and 'data' in part['body']:
+                body_plain = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
+            elif part['mimeType'] == 'text/html' and 'data' in part['body']:
+                body_html = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
+            elif part['mimeType'].startswith('multipart/') and 'parts' in part:
+                for subpart in part['parts']:
+                    if subpart['mimeType'] == 'text/plain' and 'data' in subpart['body']:
+                        body_plain = base64.urlsafe_b64decode(subpart['body']['data']).decode('utf-8', errors='ignore')
+                    elif subpart['mimeType'] == 'text/html' and 'data' in subpart['body']:
+                        body_html = base64.urlsafe_b64decode(subpart['body']['data']).decode('utf-8', errors='ignore')
+
+    return (body_html or body_plain), attachments
+
+
+def legacy_preview(payload):
+    body = ''
+    if 'parts' in payload:
+        for part in payload['parts']:
+            if part['mimeType'] == 'text/plain' and 'body' in part and 'data' in part['body']:
+                body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
+                break
+    return body[:500]
+
+
+def new_detail(payload):
+    parsed = parse_payload(payload)
+    return parsed.display_body()[0], parsed.attachments
+
+
+def new_preview(payload):
+    return parse_payload(payload).preview_text(max_bytes=2000)[:500]
+
+
+def _time(fn, payload, number):
+    return min(timeit.repeat(lambda: fn(payload), number=number, repeat=5)) / number * 1000
+
+
+def main():
+    cases = [
+        ('large (5 MB html)', large_message(), 5),
+        ('nested (depth 60)', nested_message(), 500),
+        ('200 attachments', attachment_message(), 500),
+    ]
+
+    print(f"{'case':<22} {'legacy detail':>14} {'new detail':>12} {'legacy preview':>15} {'new preview':>12}")
+    print('-' * 80)
+    for name, payload, number in cases:
+        print(
+            f"{name:<22} "
+            f"{_time(legacy_detail, payload, number):>11.3f} ms "
+            f"{_time(new_detail, payload, number):>9.3f} ms "
+            f"{_time(legacy_preview, payload, number):>12.3f} ms "
+            f"{_time(new_preview, payload, number):>9.3f} ms"
+        )
+
+    # The legacy code stops two levels down; show what it finds
+    nested = nested_message()
+    print(f"\nnested body found by legacy: {bool(legacy_detail(nested)[0])}, by parser: {bool(new_detail(nested)[0])}")
+
+
+if __name__ == '__main__':
+    main()
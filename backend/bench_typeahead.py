@@ -0,0 +1,74 @@
+# bench_typeahead.py
+"""
+Contact search at 1k / 10k / 100k contacts: the old linear substring scan
+against TypeaheadIndex.
+
+Run from the backend directory:
+    python bench_typeahead.py
+"""
+
+import random
+import string
+import time
+
+from typeahead import TypeaheadIndex, local_part
+
+SYLLABLES = ['pri', 'ya', 'ja', 'mes', 'ka', 'ren', 'mo', 'li', 'an', 'dre', 'so', 'fi', 'tan', 'ake',
+             'ga', 'rci', 'ol', 'ga', 'ke', 'nji', 'ma', 'ra', 'smi', 'th', 'pa', 'tel', 'no', 'vak']
+DOMAINS = ['gmail.com', 'example.org', 'university.edu', 'company.io']
+QUERIES = ['pr', 'ja', 'pat', 'priya', 'garc', 'kenji', 'zz9', 'smith', 'tanake']
+
+
+def make_contacts(count, seed=7):
+    rng = random.Random(seed)
+    contacts = []
+    for i in range(count):
+        first = ''.join(rng.choices(SYLLABLES, k=rng.randint(2, 3)))
+        last = ''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4)))
+        suffix = ''.join(rng.choices(string.digits, k=3))
+        name = f"{first.capitalize()} {last.capitalize()}"
+        email = f"{first}.{last}{suffix}@{rng.choice(DOMAINS)}"
+        contacts.append({'name': name, 'email': email})
+    return contacts
+
+
+def linear_search(contacts, query):
+    """What search_contacts_with_creds did per keystroke (after listing)"""
+    query_lower = query.lower()
+    return [c for c in contacts if query_lower in c['name'].lower() or query_lower in c['email'].lower()]
+
+
+def _per_query_us(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for q in QUERIES:
+            fn(q)
+    return (time.perf_counter() - start) / (repeat * len(QUERIES)) * 1e6
+
+
+def main():
+    print(f"{'contacts':>9} {'build':>10} {'linear scan':>14} {'index top-20':>14}")
+    print('-' * 52)
+
+    for count in (1000, 10000, 100000):
+        contacts = make_contacts(count)
+        rng = random.Random(1)
+        counts = {c['email']: rng.randint(0, 50) for c in rng.sample(contacts, count // 20)}
+
+        start = time.perf_counter()
+        index = TypeaheadIndex()
+        for i, c in enumerate(contacts):
+            index.add(i, c, [c['name'], local_part(c['email'])])
+        build_ms = (time.perf_counter() - start) * 1000
+
+        repeat = max(1, 20000 // count)
+        linear = _per_query_us(lambda q: linear_search(contacts, q), repeat)
+        indexed = _per_query_us(
+            lambda q: index.search(q, 20, score=lambda r: counts.get(r['email'], 0)), repeat * 10
+        )
+
+        print(f"{count:>9} {build_ms:>7.0f} ms {linear:>11.0f} us {indexed:>11.0f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+# contact_index.py
+"""
+Per-user in-memory contact index.
+
+Contact search used to page through every `otherContacts` entry on each
+keystroke. Here each user's contacts ("Other contacts" plus saved
+`people.connections`) are listed once, then kept fresh with the People API
+sync tokens, which return only what changed since the previous call.
+
+Search ranks addresses by how often the user emails them. The counts kept
+by the app only cover mail sent through it, so when an index is built it is
+also seeded from the recipients of the user's recent Gmail SENT messages.
+"""
+
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from email.utils import getaddresses
+
+from googleapiclient.errors import HttpError
+
+from google_services import get_service
+from inbox_fetcher import fetch_messages
+from mime_parser import get_header
+from typeahead import TypeaheadIndex, local_part, DEFAULT_LIMIT
+
+# How stale an index may get before a search triggers an incremental sync
+REFRESH_INTERVAL_SECONDS = 60
+MAX_INDEXED_USERS = 500
+
+OTHER_CONTACTS_MASK = 'names,emailAddresses,metadata'
+CONNECTION_FIELDS = 'names,emailAddresses,metadata'
+
+# Recent sent messages read to seed the send counts (0 disables seeding)
+SENT_SEED_MESSAGES = int(os.environ.get('CONTACT_SENT_SEED', 200))
+RECIPIENT_HEADERS = ['To', 'Cc', 'Bcc']
+
+
+def sent_address_counts(gmail_service, max_messages=SENT_SEED_MESSAGES):
+    """How many of the user's most recent sent messages went to each (lower-cased) address"""
+    message_ids = []
+    page_token = None
+    while len(message_ids) < max_messages:
+        results = gmail_service.users().messages().list(
+            userId='me',
+            labelIds=['SENT'],
+            maxResults=min(max_messages - len(message_ids), 500),
+            pageToken=page_token
+        ).execute()
+        message_ids.extend(m['id'] for m in results.get('messages', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+
+    messages, _ = fetch_messages(gmail_service, message_ids, format='metadata', metadata_headers=RECIPIENT_HEADERS)
+    counts = Counter()
+    for message in messages:
+        values = [get_header(message['payload'], name, '') for name in RECIPIENT_HEADERS]
+        counts.update({addr.lower() for _, addr in getaddresses(values) if addr})
+    return dict(counts)
+
+
+def merge_counts(recorded, seeded):
+    """Per address, the larger count: mail sent through the app is also in the sent mail"""
+    counts = dict(seeded or {})
+    for address, count in (recorded or {}).items():
+        counts[address] = max(counts.get(address, 0), count)
+    return counts
+
+
+class ContactIndex:
+    """All known contacts of one user, keyed by People API resource name"""
+
+    def __init__(self):
+        # resourceName -> {'name': str, 'emails': [str]}
+        self.contacts = {}
+        self.typeahead = TypeaheadIndex()
+        self.sync_tokens = {'other': None, 'connections': None}
+        # Lower-cased address -> recent sent messages to it; None until seeded
+        self.sent_counts = None
+        self.last_refresh = None
+        self.lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Sync
+    # ------------------------------------------------------------------
+    def refresh(self, people_service, gmail_service=None):
+        """Full build on first use, incremental sync afterwards"""
+        for source in ('other', 'connections'):
+            try:
+                self._sync_source(people_service, source, self.sync_tokens[source])
+            except HttpError as e:
+                # An expired sync token comes back as 410 GONE (or 400 on
+                # some endpoints); rebuild that source from scratch.
+                if self.sync_tokens[source] and e.resp.status in (400, 410):
+                    print(f"Contact sync token for '{source}' expired, rebuilding")
+                    self._drop_source(source)
+                    self._sync_source(people_service, source, None)
+                else:
+                    raise
+
+        if self.sent_counts is None and gmail_service is not None and SENT_SEED_MESSAGES:
+            try:
+                self.sent_counts = sent_address_counts(gmail_service)
+            except Exception as e:
+                # Ranking works without it; tried again on the next refresh
+                print(f"Error seeding send counts from sent mail: {e}")
+        self.last_refresh = time.monotonic()
+
+    def _list_page(self, people_service, source, sync_token, page_token):
+        if source == 'other':
+            return people_service.otherContacts().list(
+                pageSize=1000,
+                readMask=OTHER_CONTACTS_MASK,
+                pageToken=page_token,
+                syncToken=sync_token,
+                requestSyncToken=True
+            ).execute(), 'otherContacts'
+
+        return people_service.people().connections().list(
+            resourceName='people/me',
+            pageSize=1000,
+            personFields=CONNECTION_FIELDS,
+            pageToken=page_token,
+            syncToken=sync_token,
+            requestSyncToken=True
+        ).execute(), 'connections'
+
+    def _sync_source(self, people_service, source, sync_token):
+        page_token = None
+        while True:
+            results, key = self._list_page(people_service, source, sync_token, page_token)
+
+            for person in results.get(key, []):
+                self._apply_person(source, person)
+
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                self.sync_tokens[source] = results.get('nextSyncToken')
+                return
+
+    def _apply_person(self, source, person):
+        resource_name = person.get('resourceName')
+        if not resource_name:
+            return
+
+        # Resource names are unique per source but prefix them anyway so a
+        # rebuild of one source never touches the other.
+        key = f"{source}:{resource_name}"
+
+        self._remove_contact(key)
+
+        if person.get('metadata', {}).get('deleted'):
+            return
+
+        names = person.get('names', [])
+        emails = [e.get('value') for e in person.get('emailAddresses', []) if e.get('value')]
+        if not emails:
+            return
+
+        contact = {
+            'name': names[0].get('displayName', '') if names else '',
+            'emails': emails
+        }
+        self.contacts[key] = contact
+
+        for email_value in emails:
+            self.typeahead.add(
+                (key, email_value),
+                {'name': contact['name'] or email_value, 'email': email_value},
+                [contact['name'], local_part(email_value)]
+            )
+
+    def _remove_contact(self, key):
+        contact = self.contacts.pop(key, None)
+        if contact:
+            for email_value in contact['emails']:
+                self.typeahead.remove((key, email_value))
+
+    def _drop_source(self, source):
+        prefix = f"{source}:"
+        for key in [k for k in self.contacts if k.startswith(prefix)]:
+            self._remove_contact(key)
+        self.sync_tokens[source] = None
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+    def search(self, query, limit=DEFAULT_LIMIT, email_counts=None):
+        """
+        Top matches on name or email local-part.
+
+        email_counts maps lower-cased addresses to how often the user has
+        emailed them through the app; more frequent addresses rank first.
+        Each address counts as the larger of that and its seeded send count.
+        """
+        counts = merge_counts(email_counts, self.sent_counts)
+        found_contacts = []
+        seen_emails = set()
+
+        # Over-fetch a little: one address can be indexed under two sources
+        for record in self.typeahead.search(query, limit * 2, score=lambda r: counts.get(r['email'].lower(), 0)):
+            if record['email'] not in seen_emails:
+                found_contacts.append(dict(record))
+                seen_emails.add(record['email'])
+            if len(found_contacts) == limit:
+                break
+
+        return found_contacts
+
+
+class ContactIndexRegistry:
+    """One ContactIndex per user, least recently used users dropped first"""
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL_SECONDS, max_users=MAX_INDEXED_USERS):
+        self.refresh_interval = refresh_interval
+        self.max_users = max_users
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_index(self, user_key, creds):
+        """The user's index, synced if it is older than refresh_interval"""
+        with self._lock:
+            index = self._indexes.get(user_key)
+            if index is None:
+                index = self._indexes[user_key] = ContactIndex()
+                while len(self._indexes) > self.max_users:
+                    self._indexes.popitem(last=False)
+            self._indexes.move_to_end(user_key)
+
+        with index.lock:
+            if index.last_refresh is None or time.monotonic() - index.last_refresh > self.refresh_interval:
+                index.refresh(get_service('people', 'v1', creds), get_service('gmail', 'v1', creds))
+
+        return index
+
+    def search(self, user_key, creds, query, limit=DEFAULT_LIMIT, email_counts=None):
+        index = self.get_index(user_key, creds)
+        with index.lock:
+            return index.search(query, limit, email_counts)
+
+    def sent_counts(self, user_key):
+        """Seeded send counts of the user's index ({} before it is built)"""
+        with self._lock:
+            index = self._indexes.get(user_key)
+        if index is None:
+            return {}
+        with index.lock:
+            return dict(index.sent_counts or {})
+
+    def drop(self, user_key):
+        with self._lock:
+            self._indexes.pop(user_key, None)
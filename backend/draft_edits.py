@@ -0,0 +1,167 @@
+# draft_edits.py
+"""
+Edit operations against an existing email draft.
+
+For a revision such as "make the second paragraph shorter" the writer can
+answer with a few targeted edits instead of re-emitting the whole email:
+
+    {"mode": "edit", "edits": [
+        {"op": "set_subject", "text": "..."},
+        {"op": "replace_paragraph", "index": 2, "text": "..."},
+        {"op": "replace_span", "find": "exact old text", "text": "new text"}
+    ]}
+
+or, when most of the email changes, {"mode": "rewrite", "subject", "body"}.
+Paragraphs are the blocks of the body separated by blank lines, numbered
+from 1; replacing a paragraph with "" removes it. apply_edits() applies
+the operations server-side and raises DraftEditError when one does not
+fit the draft.
+"""
+
+import json
+import os
+import re
+import threading
+
+# Edit sets beyond these limits are discarded in favour of a full rewrite
+MAX_EDIT_OPS = int(os.environ.get('WRITER_MAX_EDIT_OPS', 8))
+MAX_EDITED_FRACTION = float(os.environ.get('WRITER_MAX_EDITED_FRACTION', 0.5))
+# Drafts shorter than this are simply rewritten; edits would save little
+MIN_EDIT_BODY_CHARS = int(os.environ.get('WRITER_MIN_EDIT_BODY_CHARS', 600))
+
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+
+class DraftEditError(ValueError):
+    """An edit operation that cannot be applied to the draft"""
+
+
+def split_paragraphs(body):
+    return [p for p in _PARAGRAPH_BREAK.split(body.strip()) if p.strip()]
+
+
+def numbered_draft(draft):
+    """The draft as shown to the model: subject, then numbered paragraphs"""
+    paragraphs = split_paragraphs(draft.get("body", ""))
+    lines = [f"Subject: {draft.get('subject', '')}", ""]
+    lines += [f"[{i + 1}] {p}" for i, p in enumerate(paragraphs)]
+    return "\n\n".join(lines)
+
+
+def parse_edit_reply(content):
+    """(mode, payload): ("edit", [ops]) or ("rewrite", {subject, body})"""
+    try:
+        data = json.loads(content or '')
+    except json.JSONDecodeError as e:
+        raise DraftEditError(f"not valid JSON: {e}")
+    if not isinstance(data, dict):
+        raise DraftEditError("not a JSON object")
+
+    if data.get("mode") == "rewrite":
+        if not isinstance(data.get("body"), str):
+            raise DraftEditError("rewrite without a body")
+        return "rewrite", {"subject": data.get("subject") or "", "body": data["body"]}
+
+    edits = data.get("edits")
+    if not isinstance(edits, list) or not all(isinstance(e, dict) for e in edits):
+        raise DraftEditError("edits must be a list of objects")
+    return "edit", edits
+
+
+def edit_set_too_large(draft, edits):
+    """True when the edits rewrite enough of the draft that a full rewrite is the better answer"""
+    if len(edits) > MAX_EDIT_OPS:
+        return True
+    body = draft.get("body", "")
+    paragraphs = split_paragraphs(body)
+    edited = 0
+    for edit in edits:
+        if edit.get("op") == "replace_paragraph" and isinstance(edit.get("index"), int) \
+                and 1 <= edit["index"] <= len(paragraphs):
+            edited += len(paragraphs[edit["index"] - 1])
+        elif edit.get("op") == "replace_span":
+            edited += len(edit.get("find") or "")
+    return edited > MAX_EDITED_FRACTION * max(len(body), 1)
+
+
+def apply_edits(draft, edits):
+    """
+    New {subject, body} with edits applied. Edits refer to the draft as
+    shown, so two edits of the same text (the subject twice, a paragraph
+    twice, a span inside a replaced paragraph or overlapping another span)
+    are rejected rather than applied in some order.
+    """
+    subject = draft.get("subject", "")
+    paragraphs = split_paragraphs(draft.get("body", ""))
+    original = "\n\n".join(paragraphs)
+
+    # Paragraph numbers refer to the draft as shown, so resolve them first
+    new_subject = None
+    by_index = {}
+    spans = []
+    for edit in edits:
+        op = edit.get("op")
+        text = edit.get("text")
+        if not isinstance(text, str):
+            raise DraftEditError(f"{op} without text")
+        if op == "set_subject":
+            if new_subject is not None:
+                raise DraftEditError("subject set twice")
+            new_subject = text.strip()
+        elif op == "replace_paragraph":
+            index = edit.get("index")
+            if isinstance(index, bool) or not isinstance(index, int) or not 1 <= index <= len(paragraphs):
+                raise DraftEditError(f"no paragraph {index}")
+            if index - 1 in by_index:
+                raise DraftEditError(f"paragraph {index} replaced twice")
+            by_index[index - 1] = text.strip()
+        elif op == "replace_span":
+            find = edit.get("find")
+            if not isinstance(find, str) or not find:
+                raise DraftEditError("replace_span without find text")
+            count = original.count(find)
+            if count != 1:
+                raise DraftEditError(f"span {find[:40]!r} found {count} times")
+            spans.append((original.index(find), find, text))
+        else:
+            raise DraftEditError(f"unknown edit op {op!r}")
+
+    # Character ranges of the edited text in the original body
+    taken = []
+    start = 0
+    for i, paragraph in enumerate(paragraphs):
+        if i in by_index:
+            taken.append((start, start + len(paragraph)))
+        start += len(paragraph) + 2
+    for position, find, _ in spans:
+        end = position + len(find)
+        if any(position < taken_end and taken_start < end for taken_start, taken_end in taken):
+            raise DraftEditError(f"span {find[:40]!r} overlaps another edit")
+        taken.append((position, end))
+
+    paragraphs = [by_index.get(i, p) for i, p in enumerate(paragraphs)]
+    body = "\n\n".join(p for p in paragraphs if p)
+    for _, find, text in spans:
+        count = body.count(find)
+        if count != 1:
+            # The replacement text of another edit repeats the span
+            raise DraftEditError(f"span {find[:40]!r} found {count} times after the other edits")
+        body = body.replace(find, text)
+    return {"subject": subject if new_subject is None else new_subject, "body": body}
+
+
+class EditStats:
+    def __init__(self):
+        self.counts = {'edited': 0, 'rewritten_by_model': 0, 'fallback': 0}
+        self._lock = threading.Lock()
+
+    def record(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+edit_stats = EditStats()
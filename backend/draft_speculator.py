@@ -0,0 +1,181 @@
+# draft_speculator.py
+"""
+Speculative email drafts.
+
+As soon as the mediator produces a new description (or revision request),
+the writer is started in the background, before the frontend has even
+asked for a draft. /api/email/generate then picks up the running or
+finished draft for the same prompt instead of starting a second call. A
+draft still queued behind other drafts is not worth waiting for: it is
+cancelled and the request writes the draft itself. A draft whose prompt has
+been superseded, or that a reader gave up on, is cancelled: if it is still
+streaming, the stream is closed at the next chunk.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_DRAFT_WORKERS = int(os.environ.get('DRAFT_WORKERS', 4))
+MAX_DRAFT_SESSIONS = 1000
+# How long a new draft waits for the one it replaced to let go of the writer
+PREVIOUS_DRAFT_WAIT_SECONDS = 10
+DRAFT_WAIT_SECONDS = 60
+
+
+class DraftJob:
+    """Events of one writer run, replayable by any number of readers"""
+
+    def __init__(self, prompt):
+        self.prompt = prompt
+        self.events = []
+        self.done = False
+        self.cancelled = False
+        # Set when the writer run begins (no longer queued or waiting for the previous draft)
+        self.started = threading.Event()
+        # Set once the writer run has actually returned (after done, when cancelled)
+        self.finished = threading.Event()
+        self._cond = threading.Condition()
+
+    def publish(self, event):
+        with self._cond:
+            if self.done:
+                return
+            self.events.append(event)
+            if event[0] in ('done', 'error'):
+                self.done = True
+            self._cond.notify_all()
+
+    def cancel(self):
+        self.cancelled = True
+        self.publish(('error', 'cancelled'))
+
+    def wait(self, timeout=DRAFT_WAIT_SECONDS):
+        with self._cond:
+            return self._cond.wait_for(lambda: self.done, timeout)
+
+    def result(self, timeout=DRAFT_WAIT_SECONDS):
+        """
+        The email dict, or None if the draft failed, was cancelled or timed
+        out. A timed out draft is cancelled, so it lets go of the writer.
+        """
+        if not self.wait(timeout):
+            self.cancel()
+            return None
+        event = self.events[-1]
+        return event[1] if event[0] == 'done' else None
+
+    def follow(self, timeout=DRAFT_WAIT_SECONDS):
+        """Yield every event so far, then new ones as they are published"""
+        index = 0
+        while True:
+            with self._cond:
+                if not self._cond.wait_for(lambda: index < len(self.events) or self.done, timeout):
+                    yield ('error', 'timed out waiting for draft')
+                    return
+                batch = self.events[index:]
+                index = len(self.events)
+                finished = self.done
+            yield from batch
+            if finished and index == len(self.events):
+                return
+
+
+class DraftSpeculator:
+    def __init__(self, max_workers=MAX_DRAFT_WORKERS, max_sessions=MAX_DRAFT_SESSIONS):
+        self.max_sessions = max_sessions
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='draft')
+        self._jobs = OrderedDict()   # session_id -> DraftJob
+        self._lock = threading.Lock()
+        self.started = 0
+        self.reused = 0
+        # Queued drafts cancelled because a request wanted them first
+        self.skipped = 0
+        self.cancelled = 0
+
+    def speculate(self, session_id, prompt, make_events):
+        """
+        Start a draft for prompt unless one is already running or done.
+        make_events() must return a writer event generator (see
+        EmailWriter.generate_email_stream).
+        """
+        with self._lock:
+            previous = self._jobs.get(session_id)
+            if previous and previous.prompt == prompt and not previous.cancelled:
+                return previous
+            if previous:
+                self._cancel(previous)
+
+            job = self._jobs[session_id] = DraftJob(prompt)
+            self._jobs.move_to_end(session_id)
+            while len(self._jobs) > self.max_sessions:
+                _, evicted = self._jobs.popitem(last=False)
+                self._cancel(evicted)
+            self.started += 1
+
+        self._executor.submit(self._run, job, previous, make_events)
+        return job
+
+    def job_for(self, session_id, prompt):
+        """
+        The session's draft for exactly this prompt, if it has started. One
+        that has not is cancelled, and the caller should write the draft.
+        """
+        with self._lock:
+            job = self._jobs.get(session_id)
+            if not job or job.prompt != prompt or job.cancelled:
+                return None
+            if not job.started.is_set():
+                self._cancel(job)
+                self.skipped += 1
+                return None
+            self.reused += 1
+            return job
+
+    def cancel(self, session_id):
+        with self._lock:
+            job = self._jobs.pop(session_id, None)
+            if job:
+                self._cancel(job)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._jobs),
+                'started': self.started,
+                'reused': self.reused,
+                'skipped': self.skipped,
+                'cancelled': self.cancelled
+            }
+
+    def _cancel(self, job):
+        if not job.done:
+            self.cancelled += 1
+        job.cancel()
+
+    def _run(self, job, previous, make_events):
+        events = None
+        try:
+            # The session's writer must not serve two drafts at once
+            if previous:
+                previous.finished.wait(PREVIOUS_DRAFT_WAIT_SECONDS)
+            with self._lock:
+                # Under the lock, so job_for never hands out a job it is cancelling
+                if job.cancelled:
+                    return
+                job.started.set()
+            events = make_events()
+            for event in events:
+                if job.cancelled:
+                    break
+                job.publish(event)
+        except Exception as e:
+            print(f"Error generating speculative draft: {e}")
+            job.publish(('error', str(e)))
+        finally:
+            if events is not None:
+                # Closes the model stream if the draft was cancelled mid-reply
+                events.close()
+            job.publish(('error', 'draft ended without a result'))
+            job.finished.set()
@@ -1,7 +1,73 @@
-from email_writer import EmailWriter
+import os
+import threading
+import time
+from collections import OrderedDict
 
-# Create a single shared instance (optional but recommended)
-email_writer = EmailWriter()
+from email_writer import EmailWriter, REVISION_MARKER
 
-def generate_email_from_description(description: str):
-    return email_writer.generate_email(description)
+# One writer per compose session; each keeps only its own capped history
+MAX_WRITER_SESSIONS = int(os.environ.get('WRITER_MAX_SESSIONS', 1000))
+WRITER_IDLE_TTL_SECONDS = int(os.environ.get('WRITER_IDLE_TTL', 2 * 60 * 60))
+
+_writers = OrderedDict()   # session_id -> (writer, last_access)
+_writers_lock = threading.Lock()
+
+
+def get_writer(session_id):
+    with _writers_lock:
+        cutoff = time.monotonic() - WRITER_IDLE_TTL_SECONDS
+        while _writers and next(iter(_writers.values()))[1] < cutoff:
+            _writers.popitem(last=False)
+
+        item = _writers.get(session_id)
+        writer = item[0] if item else EmailWriter()
+        _writers[session_id] = (writer, time.monotonic())
+        _writers.move_to_end(session_id)
+
+        while len(_writers) > MAX_WRITER_SESSIONS:
+            _writers.popitem(last=False)
+        return writer
+
+
+def discard_writer(session_id):
+    with _writers_lock:
+        _writers.pop(session_id, None)
+
+
+def writer_stats():
+    with _writers_lock:
+        return {'sessions': len(_writers), 'max_sessions': MAX_WRITER_SESSIONS}
+
+
+def build_writer_prompt(state):
+    """Writer input for the mediator's current state, or None if there is no description yet"""
+    description = state.get("description")
+    if not description:
+        return None
+
+    if state.get("recipient_name"):
+        description += "recipient_name: " + state.get("recipient_name")
+
+    revision = state.get("mail_revision")
+    if revision:
+        description += REVISION_MARKER + revision
+    return description
+
+
+def generate_email_from_description(description: str, session_id=None):
+    # Without a session there is no history worth keeping
+    writer = get_writer(session_id) if session_id else EmailWriter()
+    with writer.lock:
+        return writer.generate_email(description)
+
+
+def stream_email_from_description(description: str, session_id=None):
+    """Events from EmailWriter.generate_email_stream"""
+    writer = get_writer(session_id) if session_id else EmailWriter()
+    return _locked_stream(writer, description)
+
+
+def _locked_stream(writer, description):
+    # Released when the stream ends or is closed, e.g. by a superseded draft
+    with writer.lock:
+        yield from writer.generate_email_stream(description)
@@ -1,5 +1,45 @@
-from openai import OpenAI
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from summary_cache import summary_key
+from summary_chunker import strip_quoted_replies, split_chunks
+from mediator_context import estimate_tokens
+from llm_gateway import gateway
+
+# Inputs longer than this go through map-reduce instead of one prompt
+LONG_INPUT_TOKENS = int(os.environ.get('SUMMARY_LONG_INPUT_TOKENS', 6000))
+CHUNK_TOKENS = int(os.environ.get('SUMMARY_CHUNK_TOKENS', 3000))
+MAX_CHUNK_WORKERS = int(os.environ.get('SUMMARY_CHUNK_WORKERS', 4))
+# Extra map rounds allowed when the chunk notes are still too long to combine
+MAX_FOLD_ROUNDS = 2
+
+
+class StageTimings:
+    """Latency per summarization stage (cache, dedupe, single, map, reduce)"""
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, ms):
+        with self._lock:
+            stats = self._stages.setdefault(stage, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stats['count'] += 1
+            stats['total_ms'] += ms
+            stats['max_ms'] = max(stats['max_ms'], ms)
+
+    def stats(self):
+        with self._lock:
+            return {
+                stage: {
+                    'count': s['count'],
+                    'avg_ms': round(s['total_ms'] / s['count'], 1),
+                    'max_ms': round(s['max_ms'], 1)
+                }
+                for stage, s in self._stages.items()
+            }
+
 
 class EmailSummarizer:
     SYSTEM_PROMPT = (
@@ -17,23 +57,121 @@ class EmailSummarizer:
         "Be accurate, neutral, and brief."
     )
 
-    def __init__(self,model: str = "gpt-4.1-nano"):
+    CHUNK_PROMPT = (
+        "You are summarizing one part of a long email or email thread.\n\n"
+        "Rules:\n"
+        "- Output only the key points of this part: who said what, requests, decisions, dates and deadlines.\n"
+        "- Keep names and figures exact.\n"
+        "- Do not add interpretation or new information.\n"
+        "- If the part has no meaningful content, output nothing."
+    )
+
+    REDUCE_PROMPT = (
+        "You are an Email Summarizer. The user gives you notes taken from consecutive parts "
+        "of one long email or email thread, in order.\n\n"
+        "Rules:\n"
+        "- Combine them into one concise, clear summary of the whole email or thread.\n"
+        "- Capture the main purpose, key points, and any explicit requests or deadlines.\n"
+        "- Remove repetition between parts.\n"
+        "- Do not add interpretation, advice, or new information.\n"
+        "- Do not produce any output other than the summary.\n\n"
+        "Be accurate, neutral, and brief."
+    )
+
+    # Returned instead of a summary when the model call fails
+    API_ERROR_SUMMARY = "Error: Could not generate summary due to an API issue."
+
+    def __init__(self,model: str = "gpt-4.1-nano", cache=None, llm=None):
         # self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.client = OpenAI(api_key = os.environ.get("OPENAI_API_KEY"))
+        self.llm = llm or gateway
         self.model = model
+        # Optional SummaryCache; failed calls are never cached
+        self.cache = cache
+        self.timings = StageTimings()
+        self._executor = ThreadPoolExecutor(max_workers=MAX_CHUNK_WORKERS, thread_name_prefix='summary-chunk')
+
+    def source_key(self, source_id: str) -> str:
+        """Cache key for content identified by a stable ID rather than its text"""
+        return summary_key(f"source:{source_id}", self.model, self.SYSTEM_PROMPT)
+
+    def cached_summary(self, key: str):
+        return self.cache.get(key) if self.cache is not None else None
+
+    def summarize(self, email_text: str, key: str = None) -> str:
+        """Summary of email_text, cached under key (default: a hash of the text)"""
+        return self.summarize_with_timings(email_text, key)[0]
+
+    def summarize_with_timings(self, email_text: str, key: str = None):
+        """(summary, {stage: ms}) for this call"""
+        timings = {}
+
+        if self.cache is not None:
+            started = time.perf_counter()
+            key = key or summary_key(email_text, self.model, self.SYSTEM_PROMPT)
+            cached = self.cache.get(key)
+            self._stage(timings, 'cache', started)
+            if cached is not None:
+                return cached, timings
 
-    def summarize(self, email_text: str) -> str:
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": self.SYSTEM_PROMPT},
-                    {"role": "user", "content": email_text}
-                ],
-                temperature=0.0
-            )
-            return response.choices[0].message.content.strip()
-            
+            if estimate_tokens(email_text) > LONG_INPUT_TOKENS:
+                summary = self._summarize_long(email_text, timings)
+            else:
+                started = time.perf_counter()
+                summary = self._complete(self.SYSTEM_PROMPT, email_text)
+                self._stage(timings, 'single', started)
+
+            if self.cache is not None:
+                self.cache.put(key, summary)
+            return summary, timings
+
         except Exception as e:
             print(f"OpenAI API Error: {e}")
-            return "Error: Could not generate summary due to an API issue."
+            return self.API_ERROR_SUMMARY, timings
+
+    def _summarize_long(self, email_text, timings):
+        """Map-reduce: drop quoted history, summarize chunks concurrently, combine"""
+        started = time.perf_counter()
+        text = strip_quoted_replies(email_text)
+        self._stage(timings, 'dedupe', started)
+
+        if estimate_tokens(text) <= LONG_INPUT_TOKENS:
+            started = time.perf_counter()
+            summary = self._complete(self.SYSTEM_PROMPT, text)
+            self._stage(timings, 'single', started)
+            return summary
+
+        started = time.perf_counter()
+        chunks = split_chunks(text, CHUNK_TOKENS)
+        notes = list(self._executor.map(lambda chunk: self._complete(self.CHUNK_PROMPT, chunk), chunks))
+        self._stage(timings, 'map', started)
+
+        started = time.perf_counter()
+        notes = [n for n in notes if n]
+        # Very long inputs can leave more notes than fit one prompt: fold them first
+        for _ in range(MAX_FOLD_ROUNDS):
+            if len(notes) <= 1 or estimate_tokens("\n\n".join(notes)) <= LONG_INPUT_TOKENS:
+                break
+            groups = split_chunks("\n\n".join(notes), CHUNK_TOKENS)
+            notes = list(self._executor.map(lambda group: self._complete(self.CHUNK_PROMPT, group), groups))
+        joined = "\n\n".join(f"Part {i + 1}:\n{note}" for i, note in enumerate(notes))
+        summary = self._complete(self.REDUCE_PROMPT, joined)
+        self._stage(timings, 'reduce', started)
+        return summary
+
+    def _complete(self, system_prompt, text):
+        response = self.llm.chat(
+            "summarizer",
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": text}
+            ],
+            temperature=0.0
+        )
+        return response.choices[0].message.content.strip()
+
+    def _stage(self, timings, stage, started):
+        ms = (time.perf_counter() - started) * 1000
+        timings[stage] = round(timings.get(stage, 0) + ms, 1)
+        self.timings.record(stage, ms)
@@ -3,14 +3,57 @@ import json
 import sys
 from dotenv import load_dotenv
 import os       
+import threading
+from llm_gateway import LLMGateway, gateway
+from partial_json import PartialJSONFields
+from draft_edits import (
+    MIN_EDIT_BODY_CHARS, DraftEditError, numbered_draft, parse_edit_reply,
+    edit_set_too_large, apply_edits, edit_stats
+)
 
 load_dotenv()
 
+# Request/response pairs kept as context for revisions
+MAX_HISTORY_TURNS = int(os.environ.get('WRITER_HISTORY_TURNS', 3))
+# Revisions are answered with edit operations against the current draft
+# (see draft_edits); set WRITER_EDIT_MODE=0 to always rewrite the whole email
+EDIT_MODE = os.environ.get('WRITER_EDIT_MODE', '1') != '0'
+# Separates the description from the revision instruction in writer input
+REVISION_MARKER = "\n\nPlease revise the email as follows:\n"
+
+EDIT_PROMPT = """You revise an existing email. The user gives you the current email (subject, then numbered body paragraphs) and a revision request.
+
+Respond ONLY with a JSON object of one of these two forms:
+
+{"mode": "edit", "edits": [ ...operations... ]}
+{"mode": "rewrite", "subject": "...", "body": "..."}
+
+Edit operations:
+- {"op": "set_subject", "text": "new subject"}
+- {"op": "replace_paragraph", "index": 2, "text": "new paragraph text"} (use "" to remove the paragraph)
+- {"op": "replace_span", "find": "exact text from the current email", "text": "replacement"}
+
+Rules:
+- Apply ONLY the requested change; everything else stays exactly as it is.
+- Prefer the smallest edits that make the change. "find" must be copied exactly and occur once.
+- Do not include the paragraph numbers in any text.
+- If the request changes most of the email (tone of the whole email, full restructure), use "rewrite" with the complete new subject and body, using \\n for line breaks."""
+
 class EmailWriter:
-    def __init__(self, api_key=None):
-        """Initialize the Email Writer with OpenAI client."""
+    def __init__(self, api_key=None, llm=None, max_history_turns=MAX_HISTORY_TURNS, edit_mode=EDIT_MODE):
+        """Initialize the Email Writer with the shared LLM gateway."""
         # self.client = OpenAI(api_key = os.getenv("OPENAI_API_KEY"))
-        self.client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        if llm is not None:
+            self.llm = llm
+        elif api_key:
+            self.llm = LLMGateway(client=OpenAI(api_key=api_key))
+        else:
+            self.llm = gateway
+        self.max_history_turns = max_history_turns
+        self.edit_mode = edit_mode
+        # Held for a whole generation (see email_agent_service): the
+        # speculative draft and a request may share this writer
+        self.lock = threading.Lock()
         self.system_prompt = """You are a professional email writing assistant. Your sole purpose is to generate well-crafted emails based on the user's requirements.
 
 ## Response Format
@@ -64,9 +107,38 @@ When users request changes:
         
         self.conversation_history = []
         self.model = "gpt-4.1-nano"
+        # Last draft returned, and (revision input, draft it was applied to)
+        self.current_draft = None
+        self._revision_base = None
+        # (input, draft) written elsewhere for this input, see adopt_draft
+        self._adopted = None
     
+    def discard_draft(self):
+        """Forget the current draft and its history, e.g. when a new email is started"""
+        self.conversation_history = []
+        self.current_draft = None
+        self._revision_base = None
+        self._adopted = None
+
+    def adopt_draft(self, user_input, email_data):
+        """
+        Take a draft produced outside this writer (the fused pipeline) as the
+        answer to user_input, so generating for it costs no further call.
+        """
+        self.conversation_history.append({"role": "user", "content": user_input})
+        self.conversation_history.append({"role": "assistant", "content": json.dumps(email_data)})
+        self._trim_history()
+        self.current_draft = email_data
+        self._adopted = (user_input, email_data)
+
     def generate_email(self, user_input):
         """Generate or refine email based on user input."""
+        if self._adopted and self._adopted[0] == user_input:
+            return dict(self._adopted[1])
+        edited = self._revise_with_edits(user_input)
+        if edited is not None:
+            return edited
+
         self.conversation_history.append({
             "role": "user",
             "content": user_input
@@ -75,7 +147,8 @@ When users request changes:
         messages = [{"role": "system", "content": self.system_prompt}] + self.conversation_history
         
         try:
-            response = self.client.chat.completions.create(
+            response = self.llm.chat(
+                "writer",
                 model=self.model,
                 messages=messages,
                 response_format={"type": "json_object"},
@@ -87,8 +160,10 @@ When users request changes:
                 "role": "assistant",
                 "content": assistant_message
             })
+            self._trim_history()
             
             email_data = json.loads(assistant_message)
+            self.current_draft = email_data
             return email_data
             
         except json.JSONDecodeError as e:
@@ -96,7 +171,148 @@ When users request changes:
             return None
         except Exception as e:
             print(f"Error: {e}")
+            # The request never got an answer; don't leave it in the history
+            if self.conversation_history and self.conversation_history[-1]["role"] == "user":
+                self.conversation_history.pop()
             return None
+
+    def generate_email_stream(self, user_input):
+        """
+        Streaming generate_email. Yields ("delta", field, text) as subject and
+        body text arrive, then ("done", email_data) with the same dict
+        generate_email returns, or ("error", message).
+        """
+        if self._adopted and self._adopted[0] == user_input:
+            edited = dict(self._adopted[1])
+        else:
+            edited = self._revise_with_edits(user_input)
+        if edited is not None:
+            # Already written, or one short edit reply: send the result as whole-field deltas
+            yield ("delta", "subject", edited.get("subject", ""))
+            yield ("delta", "body", edited.get("body", ""))
+            yield ("done", edited)
+            return
+
+        self.conversation_history.append({
+            "role": "user",
+            "content": user_input
+        })
+        
+        messages = [{"role": "system", "content": self.system_prompt}] + self.conversation_history
+        reader = PartialJSONFields()
+        parts = []
+        
+        try:
+            stream = self.llm.chat_stream(
+                "writer",
+                model=self.model,
+                messages=messages,
+                response_format={"type": "json_object"},
+            )
+            
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if not text:
+                    continue
+                parts.append(text)
+                for field, delta in reader.feed(text):
+                    if field in ("subject", "body"):
+                        yield ("delta", field, delta)
+        except GeneratorExit:
+            # Reader went away mid-reply (client disconnected, draft superseded)
+            stream.close()
+            if self.conversation_history and self.conversation_history[-1]["role"] == "user":
+                self.conversation_history.pop()
+            raise
+        except Exception as e:
+            print(f"Error: {e}")
+            if self.conversation_history and self.conversation_history[-1]["role"] == "user":
+                self.conversation_history.pop()
+            yield ("error", str(e))
+            return
+        
+        assistant_message = "".join(parts)
+        self.conversation_history.append({
+            "role": "assistant",
+            "content": assistant_message
+        })
+        self._trim_history()
+        
+        try:
+            email_data = json.loads(assistant_message)
+        except json.JSONDecodeError as e:
+            print(f"Error: Failed to parse JSON response. {e}")
+            # Keep whatever the incremental reader managed to decode
+            if "body" not in reader.values:
+                yield ("error", "Invalid response from model")
+                return
+            email_data = {"subject": reader.values.get("subject", ""), "body": reader.values["body"]}
+        self.current_draft = email_data
+        yield ("done", email_data)
+
+    def _revise_with_edits(self, user_input):
+        """
+        The revised draft when user_input is a revision that edit operations
+        can express, else None and the caller rewrites the whole email.
+        """
+        if not self.edit_mode or REVISION_MARKER not in user_input:
+            return None
+        instruction = user_input.split(REVISION_MARKER, 1)[1].strip()
+        if self._revision_base and self._revision_base[0] == user_input:
+            # Same revision again (e.g. a retried request): redo it from the same draft
+            draft = self._revision_base[1]
+        else:
+            draft = self.current_draft
+        if not instruction or not draft or len(draft.get("body", "")) < MIN_EDIT_BODY_CHARS:
+            return None
+
+        messages = [
+            {"role": "system", "content": EDIT_PROMPT},
+            {"role": "user", "content": f"Current email:\n\n{numbered_draft(draft)}\n\nRevision request:\n{instruction}"}
+        ]
+        try:
+            response = self.llm.chat(
+                "writer",
+                model=self.model,
+                messages=messages,
+                response_format={"type": "json_object"},
+            )
+            mode, payload = parse_edit_reply(response.choices[0].message.content)
+            if mode == "rewrite":
+                email_data = payload
+                edit_stats.record('rewritten_by_model')
+            elif edit_set_too_large(draft, payload):
+                print(f"Edit set too large ({len(payload)} ops), rewriting the whole email")
+                edit_stats.record('fallback')
+                return None
+            else:
+                email_data = apply_edits(draft, payload)
+                edit_stats.record('edited')
+        except DraftEditError as e:
+            print(f"Edit revision failed ({e}), rewriting the whole email")
+            edit_stats.record('fallback')
+            return None
+        except Exception as e:
+            print(f"Error: {e}")
+            return None
+
+        # Later full rewrites see the revised draft as the last answer
+        self.conversation_history.append({"role": "user", "content": user_input})
+        self.conversation_history.append({"role": "assistant", "content": json.dumps(email_data)})
+        self._trim_history()
+        self._revision_base = (user_input, draft)
+        self.current_draft = email_data
+        return email_data
+
+    def _trim_history(self):
+        """Keep only the last max_history_turns request/response pairs."""
+        excess = len(self.conversation_history) - 2 * self.max_history_turns
+        if excess > 0:
+            del self.conversation_history[:excess]
+        while self.conversation_history and self.conversation_history[0]["role"] != "user":
+            self.conversation_history.pop(0)
     
     def display_email(self, email_data):
         """Display email in a formatted way."""
@@ -115,7 +331,7 @@ When users request changes:
     
     def reset_conversation(self):
         """Clear conversation history."""
-        self.conversation_history = []
+        self.discard_draft()
         print("✅ Conversation history cleared!\n")
     
     def run(self):
@@ -0,0 +1,113 @@
+# fused_pipeline.py
+"""
+Single-call mediator-plus-writer mode.
+
+In the default two-stage pipeline a voice turn that completes the
+description costs two sequential model calls: the mediator updates the
+state, then the writer drafts from it. In fused mode
+(PIPELINE_MODE=fused) one call returns the state patch and, once the
+state is complete, the draft subject and body as well. The mediator's
+context and state handling are unchanged; only the reply gains an
+"email" field (see EmailMediator.advance_with_draft).
+
+Revisions of a long draft are cheaper through the writer's edit
+operations than through a fused call that re-emits the whole email, so
+PIPELINE_MODE=fused_first fuses only until the first draft exists.
+"""
+
+import json
+import os
+
+from mediator_output import PATCH_SCHEMA, MediatorOutputError, parse_patch
+from email_agent_service import build_writer_prompt
+
+# 'two_stage' (default), 'fused' or 'fused_first'
+PIPELINE_MODES = ('two_stage', 'fused', 'fused_first')
+PIPELINE_MODE = os.environ.get('PIPELINE_MODE', 'two_stage')
+if PIPELINE_MODE not in PIPELINE_MODES:
+    raise ValueError(f"PIPELINE_MODE must be one of {', '.join(PIPELINE_MODES)}, not {PIPELINE_MODE!r}")
+
+FUSED_SCHEMA = dict(
+    PATCH_SCHEMA,
+    properties=dict(
+        PATCH_SCHEMA["properties"],
+        email={
+            "anyOf": [
+                {
+                    "type": "object",
+                    "properties": {"subject": {"type": "string"}, "body": {"type": "string"}},
+                    "required": ["subject", "body"],
+                    "additionalProperties": False
+                },
+                {"type": "null"}
+            ]
+        }
+    ),
+    required=PATCH_SCHEMA["required"] + ["email"]
+)
+
+FUSED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "mediator_fused", "strict": True, "schema": FUSED_SCHEMA}
+}
+
+FUSED_RULES = """12. EMAIL DRAFT (FUSED MODE)
+
+* After deciding the state changes, fill "email".
+* If, after your changes, description is not null and recipient_options is not greater than 1, write the email:
+  * "subject": concise and specific (5-10 words), no spam trigger words.
+  * "body": an appropriate greeting for recipient_relation, short paragraphs (2-4 sentences), active voice, \
+a closing and the sender's name (sender_name) as sign-off. Use \\n for line breaks.
+  * If a current draft is given and the user asks for changes, revise that draft: apply ONLY the requested changes \
+and keep everything else, including tone, unless asked otherwise.
+* Otherwise set "email" to null."""
+
+
+def draft_instructions(current_draft):
+    """System message with the fused rules and, if there is one, the draft being revised"""
+    if not current_draft:
+        return FUSED_RULES
+    return (
+        FUSED_RULES
+        + "\n\nCurrent draft:\nSubject: " + current_draft.get("subject", "")
+        + "\n\n" + current_draft.get("body", "")
+    )
+
+
+def parse_fused(content, current):
+    """(new state, {subject, body} or None) from a fused reply"""
+    state = parse_patch(content, current)
+    email = json.loads(content).get("email")
+    if email is None:
+        return state, None
+    if not isinstance(email, dict) or not isinstance(email.get("subject"), str) \
+            or not isinstance(email.get("body"), str):
+        raise MediatorOutputError("email must be an object with subject and body")
+
+    options = state.get("recipient_options")
+    if not state.get("description") or (options and options > 1):
+        # A draft for an incomplete state would be thrown away by the UI anyway
+        return state, None
+    return state, {"subject": email["subject"], "body": email["body"]}
+
+
+def advance_pipeline(mediator, writer, user_input, mode=PIPELINE_MODE):
+    """
+    Advance the mediator in the given pipeline mode and return the new
+    state. When the call also wrote the draft, the writer adopts it, so
+    generating for the new state costs no further call.
+    """
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"Unknown pipeline mode {mode!r}")
+    if writer.current_draft and not mediator.json_state.get("description"):
+        # No description yet, so the draft belongs to an earlier email
+        writer.discard_draft()
+
+    if mode == 'two_stage' or (mode == 'fused_first' and writer.current_draft):
+        return mediator.advance(user_input)
+
+    state, email_data = mediator.advance_with_draft(user_input, writer.current_draft)
+    prompt = build_writer_prompt(state)
+    if email_data and prompt:
+        writer.adopt_draft(prompt, email_data)
+    return state
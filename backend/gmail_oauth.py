@@ -4,7 +4,7 @@ import json
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow, Flow
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from google_services import get_service as get_google_service
 from email.mime.text import MIMEText
 import base64
 
@@ -49,13 +49,13 @@ class GmailOAuthManager:
 
         # If credentials already exist and are valid, reuse them
         if self.creds and self.creds.valid:
-            self.service = build("gmail", "v1", credentials=self.creds)
+            self.service = get_google_service("gmail", "v1", self.creds)
             return True
 
         # Refresh if possible
         if self.creds and self.creds.expired and self.creds.refresh_token:
             self.creds.refresh(Request())
-            self.service = build("gmail", "v1", credentials=self.creds)
+            self.service = get_google_service("gmail", "v1", self.creds)
             return True
 
         # Load client config from ENV (preferred)
@@ -71,7 +71,7 @@ class GmailOAuthManager:
         if authorization_response:
             flow.fetch_token(authorization_response=authorization_response)
             self.creds = flow.credentials
-            self.service = build("gmail", "v1", credentials=self.creds)
+            self.service = get_google_service("gmail", "v1", self.creds)
             return True
 
         # Authorization start phase
@@ -127,7 +127,7 @@ class GmailOAuthManager:
 
     def search_contacts_with_creds(creds, query):
         try:
-            people_service = build('people', 'v1', credentials=creds)
+            people_service = get_google_service('people', 'v1', creds)
 
             all_contacts = []
             page_token = None
@@ -3,7 +3,7 @@ import json
 from flask import redirect, request, session, url_for
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from google_services import get_service
 
 SCOPES = [
     'openid',
@@ -87,4 +87,4 @@ def get_gmail_service_from_session():
         return None
 
     creds = Credentials(**session["google_creds"])
-    return build("gmail", "v1", credentials=creds)
+    return get_service("gmail", "v1", creds)
@@ -0,0 +1,83 @@
+# google_services.py
+"""
+Process-wide factory for Google API service objects.
+
+`googleapiclient.discovery.build()` parses the API's discovery document and
+creates a new HTTP transport on every call. Discovery documents never change
+at runtime, so they are parsed once per process here, and built services are
+reused for as long as the same credential is presented.
+
+httplib2 transports are not thread-safe, so built services are cached per
+thread.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+
+from googleapiclient.discovery import build, build_from_document
+
+try:
+    from googleapiclient.discovery_cache import get_static_doc
+except ImportError:  # googleapiclient < 2.0 has no bundled documents
+    get_static_doc = None
+
+# Built services kept per thread; one per (api, version, credential)
+MAX_SERVICES_PER_THREAD = 64
+
+_documents = {}
+_documents_lock = threading.Lock()
+_local = threading.local()
+
+
+def _discovery_document(api, version):
+    """Parsed discovery document for api/version, or None if not bundled"""
+    key = (api, version)
+    with _documents_lock:
+        if key not in _documents:
+            raw = get_static_doc(api, version) if get_static_doc else None
+            _documents[key] = json.loads(raw) if raw else None
+        return _documents[key]
+
+
+def _credential_key(credentials):
+    return (
+        getattr(credentials, 'token', None),
+        getattr(credentials, 'refresh_token', None),
+        getattr(credentials, 'client_id', None),
+    )
+
+
+def _thread_services():
+    services = getattr(_local, 'services', None)
+    if services is None:
+        services = _local.services = OrderedDict()
+    return services
+
+
+def get_service(api, version, credentials):
+    """
+    Return a service object for api/version authorized with credentials.
+
+    Drop-in replacement for build(api, version, credentials=credentials).
+    """
+    key = (api, version, _credential_key(credentials))
+    services = _thread_services()
+
+    service = services.get(key)
+    if service is not None:
+        services.move_to_end(key)
+        return service
+
+    document = _discovery_document(api, version)
+    if document is not None:
+        service = build_from_document(document, credentials=credentials)
+    else:
+        service = build(api, version, credentials=credentials)
+
+    services[key] = service
+    while len(services) > MAX_SERVICES_PER_THREAD:
+        services.popitem(last=False)
+
+    return service
+
@@ -0,0 +1,24 @@
+# gunicorn.conf.py
+"""
+Gunicorn settings, read automatically when gunicorn is started from the
+backend directory (`gunicorn wsgi:app`).
+
+/api/mediator/events keeps one streaming response open per compose tab
+for up to MEDIATOR_STREAM_SECONDS, and long polls on /api/mediator/state
+wait up to 30 s. With the default sync workers each of those would hold
+a whole worker, so the workers are threaded: every open stream costs one
+thread. Size GUNICORN_THREADS for the expected number of open tabs per
+worker plus ordinary requests.
+
+More than one worker needs MEDIATOR_STORE=sqlite (without
+MEDIATOR_STORE_SHARED=0), so every worker sees the same compose sessions.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5001)}"
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+# Streams send a keepalive every 15 s, well inside this
+timeout = 60
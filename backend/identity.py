@@ -0,0 +1,147 @@
+# identity.py
+"""
+Who is the signed-in user?
+
+Resolving the email/name/picture for a credential used to cost a userinfo
+round trip on almost every request. The answer only changes when the
+credential does, so it is kept both in the Flask session and in a
+process-wide TTL cache (for workers that see the session cookie before they
+have seen the user).
+
+A cached identity is only trusted for IDENTITY_REVALIDATE_SECONDS after the
+userinfo call that produced it. After that the call is made again, which
+also finds out when the user has revoked the grant.
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+from flask import session
+from google.oauth2.credentials import Credentials
+
+from google_services import get_service
+
+IDENTITY_TTL_SECONDS = 60 * 60
+# How old (in seconds since its userinfo call) a cached identity may be
+IDENTITY_REVALIDATE_SECONDS = int(os.environ.get('IDENTITY_REVALIDATE_SECONDS', 5 * 60))
+MAX_CACHED_IDENTITIES = 10000
+
+
+def credential_fingerprint(creds_data):
+    """Stable, non-reversible key for a stored credential dict"""
+    material = f"{creds_data.get('refresh_token') or ''}:{creds_data.get('token') or ''}"
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def credentials_from_dict(creds_data):
+    return Credentials(
+        token=creds_data['token'],
+        refresh_token=creds_data.get('refresh_token'),
+        token_uri=creds_data['token_uri'],
+        client_id=creds_data['client_id'],
+        client_secret=creds_data['client_secret'],
+        scopes=creds_data['scopes']
+    )
+
+
+def fetch_identity(creds):
+    """One userinfo call for a Credentials object"""
+    user_info = get_service('oauth2', 'v2', creds).userinfo().get().execute()
+    return {
+        'email': user_info.get('email'),
+        'name': user_info.get('name'),
+        'picture': user_info.get('picture', ''),
+        # Wall clock: the session copy outlives this process
+        'fetched_at': time.time()
+    }
+
+
+class IdentityCache:
+    """Fingerprint -> identity, with expiry"""
+
+    def __init__(self, ttl=IDENTITY_TTL_SECONDS, max_entries=MAX_CACHED_IDENTITIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint):
+        with self._lock:
+            item = self._entries.get(fingerprint)
+            if not item:
+                return None
+            identity, expires_at = item
+            if expires_at < time.monotonic():
+                del self._entries[fingerprint]
+                return None
+            return identity
+
+    def put(self, fingerprint, identity):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                now = time.monotonic()
+                for key in [k for k, (_, exp) in self._entries.items() if exp < now]:
+                    del self._entries[key]
+                if len(self._entries) >= self.max_entries:
+                    # Still full: drop the entry closest to expiry
+                    del self._entries[min(self._entries, key=lambda k: self._entries[k][1])]
+            self._entries[fingerprint] = (identity, time.monotonic() + self.ttl)
+
+    def invalidate(self, fingerprint):
+        with self._lock:
+            self._entries.pop(fingerprint, None)
+
+
+identity_cache = IdentityCache()
+
+
+# ----------------------------------------------------------------------
+# Session helpers (used by the Flask routes)
+# ----------------------------------------------------------------------
+def remember_identity(identity):
+    """Store an identity resolved elsewhere (e.g. the OAuth callback) for the current session"""
+    fingerprint = credential_fingerprint(session['google_creds'])
+    identity = dict(identity)
+    identity.setdefault('fetched_at', time.time())
+    identity_cache.put(fingerprint, identity)
+    session['user_info'] = dict(identity, fingerprint=fingerprint)
+
+
+def _is_fresh(identity, max_age):
+    return bool(identity and identity.get('email')) and time.time() - identity.get('fetched_at', 0) <= max_age
+
+
+def get_current_identity(max_age=IDENTITY_REVALIDATE_SECONDS):
+    """
+    Identity of the signed-in user, or None when not signed in. A cached
+    identity older than max_age seconds is fetched again.
+
+    Raises whatever the userinfo call raises when the credential is
+    unusable, so callers can tell "signed out" from "token revoked".
+    """
+    creds_data = session.get('google_creds')
+    if not creds_data:
+        return None
+
+    fingerprint = credential_fingerprint(creds_data)
+
+    cached = session.get('user_info')
+    if cached and cached.get('fingerprint') == fingerprint and _is_fresh(cached, max_age):
+        return cached
+
+    identity = identity_cache.get(fingerprint)
+    if not _is_fresh(identity, max_age):
+        identity = fetch_identity(credentials_from_dict(creds_data))
+        identity_cache.put(fingerprint, identity)
+
+    session['user_info'] = dict(identity, fingerprint=fingerprint)
+    return session['user_info']
+
+
+def forget_current_identity():
+    creds_data = session.get('google_creds')
+    if creds_data:
+        identity_cache.invalidate(credential_fingerprint(creds_data))
+    session.pop('user_info', None)
@@ -0,0 +1,312 @@
+# inbox_sync.py
+"""
+Incremental inbox sync on top of the Gmail history API.
+
+Each user gets a local mirror of the messages the inbox views have shown,
+plus the `historyId` it is current as of. A refresh asks Gmail only for what
+changed since then (`users.history.list`) and applies the messagesAdded,
+messagesDeleted, labelsAdded and labelsRemoved deltas, so an unchanged
+inbox costs one history call instead of a list plus one get per message.
+
+Label sets the mirror learns (from listings and history) are pushed into
+the message cache, so label checks against cached messages stay current.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from googleapiclient.errors import HttpError
+
+from inbox_fetcher import fetch_messages, summarize_message, LIST_METADATA_HEADERS
+
+HISTORY_TYPES = ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+
+# Page tokens handed out for pages served from the local mirror. Anything
+# else is a Gmail page token and must go straight to Gmail.
+PAGE_TOKEN_PREFIX = 'sync:'
+
+# Mirrors kept in memory: least recently used users are dropped first, and
+# any mirror idle this long is dropped (a later visit runs a full sync)
+MAX_SYNCED_MAILBOXES = int(os.environ.get('INBOX_SYNC_MAX_USERS', 500))
+SYNC_IDLE_TTL_SECONDS = int(os.environ.get('INBOX_SYNC_IDLE_TTL', 2 * 60 * 60))
+
+
+def is_sync_page_token(page_token):
+    return bool(page_token) and page_token.startswith(PAGE_TOKEN_PREFIX)
+
+
+def sync_page_offset(page_token):
+    """Position in the label view that a sync page token points at (0 for anything else)"""
+    if not is_sync_page_token(page_token):
+        return 0
+    try:
+        return max(int(page_token[len(PAGE_TOKEN_PREFIX):]), 0)
+    except ValueError:
+        return 0
+
+
+class MailboxState:
+    """Local mirror of one user's mailbox"""
+
+    def __init__(self, user_key=None):
+        self.user_key = user_key
+        self.history_id = None
+        # message id -> {'summary': dict, 'labelIds': list, 'internalDate': int}
+        self.messages = {}
+        # label id -> {'ids': [message ids, newest first], 'next_page_token': str|None}
+        self.windows = {}
+        self.lock = threading.Lock()
+        self.last_access = time.monotonic()
+
+
+class InboxSyncEngine:
+    def __init__(self, message_cache=None, max_users=MAX_SYNCED_MAILBOXES, idle_ttl=SYNC_IDLE_TTL_SECONDS):
+        """message_cache, if given, receives every label set the mirror learns"""
+        self.message_cache = message_cache
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self._states = OrderedDict()   # user_key -> MailboxState, least recently used first
+        self._states_lock = threading.Lock()
+        self.evictions = 0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def list_messages(self, service, user_key, label_id, max_results=20, page_token=None):
+        """
+        Return one page of a label view, syncing with Gmail first.
+
+        Returns (messages, next_page_token). Page tokens returned here are
+        only meaningful to this engine (see is_sync_page_token).
+        """
+        state = self._get_state(user_key)
+
+        with state.lock:
+            self.sync(service, state)
+
+            window = state.windows.get(label_id)
+            if window is None:
+                window = {'ids': [], 'next_page_token': None}
+                state.windows[label_id] = window
+                self._extend_window(service, state, label_id, max_results, first_page=True)
+
+            offset = sync_page_offset(page_token)
+
+            # "Load more" past what we hold: pull the next Gmail page into the mirror
+            while len(window['ids']) < offset + max_results and window['next_page_token']:
+                self._extend_window(service, state, label_id, max_results)
+
+            page_ids = window['ids'][offset:offset + max_results]
+            messages = [self._render(state.messages[mid]) for mid in page_ids if mid in state.messages]
+
+            end = offset + len(page_ids)
+            has_more = end < len(window['ids']) or window['next_page_token']
+            next_page_token = f"{PAGE_TOKEN_PREFIX}{end}" if has_more else None
+
+        return messages, next_page_token
+
+    def sync(self, service, state):
+        """Bring a mailbox mirror up to date; falls back to a full resync if needed"""
+        if state.history_id is None:
+            self._full_sync(service, state)
+            return
+
+        try:
+            records, history_id = self._list_history(service, state.history_id)
+        except HttpError as e:
+            # Gmail only keeps history for a limited time; an expired
+            # startHistoryId comes back as 404.
+            if e.resp.status == 404:
+                print(f"History {state.history_id} expired, running full resync")
+                self._full_sync(service, state)
+                return
+            raise
+
+        self._apply_history(service, state, records)
+        state.history_id = history_id
+
+    def update_labels(self, user_key, message_id, add=None, remove=None):
+        """Apply a label change made by this server without waiting for the next sync"""
+        state = self._get_state(user_key)
+        with state.lock:
+            entry = state.messages.get(message_id)
+            if not entry:
+                return
+            labels = [l for l in entry['labelIds'] if l not in (remove or [])]
+            labels.extend(l for l in (add or []) if l not in labels)
+            self._set_labels(state, message_id, labels)
+
+    def reset(self, user_key):
+        with self._states_lock:
+            self._states.pop(user_key, None)
+
+    def stats(self):
+        with self._states_lock:
+            return {'users': len(self._states), 'max_users': self.max_users, 'evictions': self.evictions}
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+    def _get_state(self, user_key):
+        with self._states_lock:
+            now = time.monotonic()
+            while self._states:
+                oldest_key, oldest = next(iter(self._states.items()))
+                if now - oldest.last_access <= self.idle_ttl:
+                    break
+                del self._states[oldest_key]
+                self.evictions += 1
+
+            state = self._states.get(user_key)
+            if state is None:
+                state = self._states[user_key] = MailboxState(user_key)
+                while len(self._states) > self.max_users:
+                    self._states.popitem(last=False)
+                    self.evictions += 1
+            state.last_access = now
+            self._states.move_to_end(user_key)
+            return state
+
+    def _render(self, entry):
+        summary = dict(entry['summary'])
+        summary['isUnread'] = 'UNREAD' in entry['labelIds']
+        return summary
+
+    def _full_sync(self, service, state):
+        # Capture the history ID before listing so nothing that changes
+        # while we list is missed on the next incremental sync.
+        profile = service.users().getProfile(userId='me').execute()
+
+        state.messages.clear()
+        labels = list(state.windows)
+        state.windows.clear()
+        state.history_id = profile['historyId']
+
+        for label_id in labels:
+            state.windows[label_id] = {'ids': [], 'next_page_token': None}
+            self._extend_window(service, state, label_id, 20, first_page=True)
+
+    def _extend_window(self, service, state, label_id, max_results, first_page=False):
+        window = state.windows[label_id]
+
+        results = service.users().messages().list(
+            userId='me',
+            maxResults=max_results,
+            pageToken=None if first_page else window['next_page_token'],
+            labelIds=[label_id]
+        ).execute()
+
+        listed_ids = [msg['id'] for msg in results.get('messages', [])]
+        self._store_messages(service, state, [mid for mid in listed_ids if mid not in state.messages])
+
+        for message_id in listed_ids:
+            if message_id in state.messages and message_id not in window['ids']:
+                window['ids'].append(message_id)
+        window['next_page_token'] = results.get('nextPageToken')
+
+    def _store_messages(self, service, state, message_ids):
+        if not message_ids:
+            return
+
+        fetched, errors = fetch_messages(
+            service,
+            message_ids,
+            format='metadata',
+            metadata_headers=LIST_METADATA_HEADERS
+        )
+        for failed_id, error in errors.items():
+            print(f"Error fetching message {failed_id}: {error}")
+
+        for message in fetched:
+            try:
+                state.messages[message['id']] = {
+                    'summary': summarize_message(message),
+                    'labelIds': list(message.get('labelIds', [])),
+                    'internalDate': int(message.get('internalDate', 0))
+                }
+                self._publish_labels(state, message['id'], message.get('labelIds', []))
+            except Exception as e:
+                print(f"Error parsing message {message.get('id')}: {e}")
+
+    def _list_history(self, service, start_history_id):
+        records = []
+        page_token = None
+        while True:
+            response = service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes=HISTORY_TYPES,
+                pageToken=page_token
+            ).execute()
+            records.extend(response.get('history', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return records, response.get('historyId', start_history_id)
+
+    def _apply_history(self, service, state, records):
+        # Latest known label set per message; None marks a deletion
+        latest_labels = {}
+
+        for record in records:
+            for item in record.get('messagesAdded', []):
+                message = item['message']
+                latest_labels[message['id']] = list(message.get('labelIds', []))
+            for item in record.get('labelsAdded', []) + record.get('labelsRemoved', []):
+                message = item['message']
+                if latest_labels.get(message['id'], []) is not None:
+                    latest_labels[message['id']] = list(message.get('labelIds', []))
+            for item in record.get('messagesDeleted', []):
+                latest_labels[item['message']['id']] = None
+
+        # Only messages that belong in a view we mirror are worth fetching
+        to_fetch = [
+            mid for mid, labels in latest_labels.items()
+            if labels is not None
+            and mid not in state.messages
+            and any(label in state.windows for label in labels)
+        ]
+        self._store_messages(service, state, to_fetch)
+
+        for message_id, labels in latest_labels.items():
+            if labels is None:
+                self._remove_message(state, message_id)
+            elif message_id in state.messages:
+                self._set_labels(state, message_id, labels)
+
+    def _remove_message(self, state, message_id):
+        state.messages.pop(message_id, None)
+        for window in state.windows.values():
+            if message_id in window['ids']:
+                window['ids'].remove(message_id)
+
+    def _set_labels(self, state, message_id, labels):
+        entry = state.messages[message_id]
+        entry['labelIds'] = labels
+        self._publish_labels(state, message_id, labels)
+
+        for label_id, window in state.windows.items():
+            in_window = message_id in window['ids']
+            if label_id in labels and not in_window:
+                self._insert_sorted(state, window, message_id)
+            elif label_id not in labels and in_window:
+                window['ids'].remove(message_id)
+
+    def _publish_labels(self, state, message_id, labels):
+        if self.message_cache is not None and state.user_key:
+            self.message_cache.set_labels(state.user_key, message_id, labels)
+
+    def _insert_sorted(self, state, window, message_id):
+        date = state.messages[message_id]['internalDate']
+        ids = window['ids']
+
+        for index, existing_id in enumerate(ids):
+            if state.messages[existing_id]['internalDate'] < date:
+                ids.insert(index, message_id)
+                return
+
+        # Older than everything we hold: only append if the window is the
+        # whole label, otherwise Gmail paging will surface it later.
+        if not window['next_page_token']:
+            ids.append(message_id)
@@ -1,13 +1,24 @@
-from openai import OpenAI
 import json
 from dotenv import load_dotenv
 import os
+from mediator_context import MediatorContext, DEFAULT_TOKEN_BUDGET, DEFAULT_WINDOW_TURNS
+from llm_gateway import gateway
+from mediator_fast_path import try_fast_path, resolve_recipient_pick, fast_path_stats
+from mediator_output import (
+    OUTPUT_MODE, PATCH_RULES, PATCH_RESPONSE_FORMAT, MediatorOutputError,
+    parse_full_state, parse_patch, encode_patch, output_stats
+)
+from fused_pipeline import FUSED_RESPONSE_FORMAT, draft_instructions, parse_fused
 
 load_dotenv()
 
+# Set MEDIATOR_FAST_PATH=0 to send every input to the model
+FAST_PATH_ENABLED = os.environ.get('MEDIATOR_FAST_PATH', '1') != '0'
+
 # UI gets the recipient name, (cc & bcc) from this module
 class EmailMediator:
-    def __init__(self):
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, window_turns=DEFAULT_WINDOW_TURNS, fast_path=FAST_PATH_ENABLED,
+                 output_mode=OUTPUT_MODE):
         self.system_prompt = """You are the Email Mediator. You must output exactly one JSON object and nothing else.
 
 The JSON object MUST contain only the following keys:
@@ -112,7 +123,12 @@ Be deterministic, conservative in inference, and focused on clarity and complete
 """
         
         # self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.client = OpenAI(api_key = os.environ.get("OPENAI_API_KEY"))
+        # Shared gateway: one pooled client for every session
+        self.llm = gateway
+        # Trivial inputs ("yes", "cc bob@x.com", "2") are parsed without a model call
+        self.fast_path = fast_path
+        # 'delta': the model returns only changed keys (see mediator_output)
+        self.output_mode = output_mode
         self.json_state = {
             "recipient_name": None,
             "recipient_relation": None,
@@ -123,12 +139,32 @@ Be deterministic, conservative in inference, and focused on clarity and complete
             "mail_revision": None
         }
 
-        self.chat_history = [{'role': 'system', 'content': self.system_prompt}]
+        # Bounded context used by advance()
+        context_prompt = self.system_prompt + PATCH_RULES if output_mode == 'delta' else self.system_prompt
+        self.context = MediatorContext(context_prompt, token_budget, window_turns)
+
+    def to_dict(self):
+        """Serializable session state (the system prompt is not stored)"""
+        return {
+            "json_state": self.json_state,
+            "context": self.context.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        mediator = cls()
+        mediator.json_state = data.get("json_state", mediator.json_state)
+        if "context" in data:
+            mediator.context.load_dict(data["context"])
+        elif "chat_history" in data:
+            mediator.context.load_chat_history(data["chat_history"])
+        return mediator
 
     def process_user_input(self, user_input, chat_history):
         chat_history.append({"role": "user", "content": user_input})
 
-        response = self.client.chat.completions.create(
+        response = self.llm.chat(
+            "mediator",
             model="gpt-4.1-nano",
             messages=chat_history,
         )
@@ -169,7 +205,8 @@ Be deterministic, conservative in inference, and focused on clarity and complete
             )
 
             try:
-                response = self.client.chat.completions.create(
+                response = self.llm.chat(
+                    "mediator",
                     model="gpt-4.1-nano",
                     messages=chat_history,
                     # temperature=0.7
@@ -208,30 +245,113 @@ Be deterministic, conservative in inference, and focused on clarity and complete
                 break
 
     def advance(self, user_input):
-        self.chat_history.append({"role": "user", "content": user_input})
+        state = self._fast_path_state(user_input)
+        if state is not None:
+            return state
+        return self._advance_with_model(user_input)
+
+    def advance_with_draft(self, user_input, current_draft=None):
+        """
+        Fused mode: one model call returns the new state and, once the state
+        is complete, the draft as well. Returns (state, {subject, body} or
+        None); current_draft is the draft a revision applies to.
+        """
+        state = self._fast_path_state(user_input)
+        if state is not None:
+            return state, None
+
+        self.json_state, user_input = resolve_recipient_pick(self.json_state, user_input)
+        messages = self.context.build_messages(self.json_state, user_input)
+        instructions = draft_instructions(current_draft)
+        if self.output_mode != 'delta':
+            # The fused reply is always a patch
+            instructions = PATCH_RULES.strip() + "\n\n" + instructions
+        messages.insert(1, {"role": "system", "content": instructions})
+        try:
+            # Writes the email too, so it runs under the writer's limits and timeout
+            response = self.llm.chat(
+                "writer",
+                model="gpt-4.1-nano",
+                messages=messages,
+                response_format=FUSED_RESPONSE_FORMAT
+            )
+            state, email_data = parse_fused(response.choices[0].message.content, self.json_state)
+            output_stats.record('ok')
+        except MediatorOutputError as e:
+            print(f"⚠️ Fused reply rejected ({e}), falling back to the mediator alone")
+            return self._advance_with_model(user_input), None
+
+        self.context.add_turn(user_input, self._turn_reply(state))
+        self.json_state = state
+        return self.json_state, email_data
+
+    def _fast_path_state(self, user_input):
+        """New state if the fast path decided the input, else None"""
+        if not self.fast_path:
+            return None
+        state = try_fast_path(self.json_state, user_input)
+        fast_path_stats.record(state is not None)
+        if state is not None:
+            # Recorded like a model turn so later prompts see it
+            self.context.add_turn(user_input, self._turn_reply(state))
+            self.json_state = state
+        return state
+
+    def _advance_with_model(self, user_input):
+        # A recipient pick is settled here; the model writes the held-back description
+        self.json_state, user_input = resolve_recipient_pick(self.json_state, user_input)
+        messages = self.context.build_messages(self.json_state, user_input)
+        try:
+            state = self._request_state(messages)
+            output_stats.record('ok')
+        except MediatorOutputError as e:
+            print(f"⚠️ Mediator reply rejected ({e}), asking for the full state")
+            try:
+                state = self._request_full_state(messages)
+                output_stats.record('repaired')
+            except MediatorOutputError as e:
+                print(f"⚠️ Mediator reply rejected again ({e}), state unchanged")
+                output_stats.record('failed')
+                return self.json_state
+
+        self.context.add_turn(user_input, self._turn_reply(state))
+        self.json_state = state
+        return self.json_state
+
+    def _request_state(self, messages):
+        """New state from one model call in the configured output mode"""
+        if self.output_mode == 'delta':
+            response = self.llm.chat(
+                "mediator",
+                model="gpt-4.1-nano",
+                messages=messages,
+                response_format=PATCH_RESPONSE_FORMAT
+            )
+            return parse_patch(response.choices[0].message.content, self.json_state)
 
-        response = self.client.chat.completions.create(
+        response = self.llm.chat(
+            "mediator",
             model="gpt-4.1-nano",
-            messages=self.chat_history
+            messages=messages
         )
+        return parse_full_state(response.choices[0].message.content, self.json_state)
 
-        assistant_message = response.choices[0].message.content
-        # print(assistant_message)
-        self.chat_history.append(
-            {"role": "assistant", "content": assistant_message}
+    def _request_full_state(self, messages):
+        """Fallback after a malformed reply: the whole state, in JSON mode"""
+        messages = [{"role": "system", "content": self.system_prompt}] + messages[1:]
+        response = self.llm.chat(
+            "mediator",
+            model="gpt-4.1-nano",
+            messages=messages,
+            response_format={"type": "json_object"}
         )
+        return parse_full_state(response.choices[0].message.content, self.json_state)
 
-        try:
-            self.json_state = json.loads(assistant_message)
-        except json.JSONDecodeError:
-            pass
-
-        # Persist state for Flask
-        with open("mediator_state.json", "w") as f:
-            json.dump(self.json_state, f, indent=2)
-
-        return self.json_state
-
+    def _turn_reply(self, state):
+        """The assistant reply stored in context for a turn that produced state"""
+        if self.output_mode == 'delta':
+            return encode_patch(self.json_state, state)
+        return json.dumps(state)
 
 if __name__ == "__main__":
     mediator = EmailMediator()
@@ -0,0 +1,284 @@
+# llm_gateway.py
+"""
+Process-wide gateway for every OpenAI call (mediator, writer, summarizer).
+
+- One client, so every caller shares the same keep-alive connection pool.
+- Calls run under a per-task semaphore, so a burst of digest summaries
+  cannot starve the interactive mediator.
+- Every request has a timeout and is retried with jittered exponential
+  backoff on connection errors, timeouts, 429s and 5xx.
+- A circuit breaker opens after repeated upstream failures and fails calls
+  fast until a probe succeeds.
+- Latency, token and error counts are kept per task.
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import httpx
+from openai import OpenAI, APIConnectionError, APIStatusError, RateLimitError
+
+MAX_CONNECTIONS = int(os.environ.get('OPENAI_MAX_CONNECTIONS', 20))
+
+TASKS = ('mediator', 'writer', 'summarizer')
+DEFAULT_CONCURRENCY = {'mediator': 16, 'writer': 8, 'summarizer': 8}
+DEFAULT_TIMEOUTS = {'mediator': 20.0, 'writer': 60.0, 'summarizer': 60.0}
+# How long a call may wait for a free slot before it is rejected
+QUEUE_TIMEOUT_SECONDS = 30
+MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 2))
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 8
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_COOLDOWN_SECONDS = 30
+LATENCY_SAMPLES = 500
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_openai_client():
+    """The shared client; the gateway does its own retries, so the SDK's are off"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI(
+                    api_key=os.environ.get("OPENAI_API_KEY"),
+                    max_retries=0,
+                    http_client=httpx.Client(
+                        limits=httpx.Limits(
+                            max_connections=MAX_CONNECTIONS,
+                            max_keepalive_connections=MAX_CONNECTIONS
+                        )
+                    )
+                )
+    return _client
+
+
+class LLMUnavailable(Exception):
+    """Raised without calling upstream: circuit open or no free slot"""
+
+
+def is_retryable(error):
+    if isinstance(error, (APIConnectionError, RateLimitError)):   # includes timeouts
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500
+    return False
+
+
+def backoff_seconds(attempt):
+    """Full jitter: uniform in [0, base * 2^attempt], capped"""
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, cooldown=BREAKER_COOLDOWN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == 'closed':
+                return
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    raise LLMUnavailable('LLM circuit open')
+                self.state = 'half_open'
+            # half open: let a single probe through
+            if self._probe_in_flight:
+                raise LLMUnavailable('LLM circuit half-open, probe in flight')
+            self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.times_opened += 1
+                    print(f"⚠️ LLM circuit opened after {self.failures} failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'times_opened': self.times_opened}
+
+
+class TaskStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.max_prompt_tokens = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.lock = threading.Lock()
+
+    def record_usage(self, usage):
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        with self.lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += getattr(usage, 'completion_tokens', 0) or 0
+            self.max_prompt_tokens = max(self.max_prompt_tokens, prompt_tokens)
+
+    def record_call(self, ms, ok):
+        with self.lock:
+            self.calls += 1
+            if ok:
+                self.latencies.append(ms)
+            else:
+                self.errors += 1
+
+    def bump(self, field):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def snapshot(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            ok_calls = self.calls - self.errors
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'retries': self.retries,
+                'rejected': self.rejected,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'avg_prompt_tokens': round(self.prompt_tokens / ok_calls, 1) if ok_calls else None,
+                'max_prompt_tokens': self.max_prompt_tokens,
+                'p50_ms': round(latencies[len(latencies) // 2], 1) if latencies else None,
+                'p95_ms': round(latencies[int(len(latencies) * 0.95)], 1) if latencies else None
+            }
+
+
+class LLMGateway:
+    def __init__(self, client=None, max_retries=MAX_RETRIES, breaker=None):
+        """client defaults to the shared pooled client (created on first call)"""
+        self._client = client
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.timeouts = {
+            task: float(os.environ.get(f'LLM_TIMEOUT_{task.upper()}', DEFAULT_TIMEOUTS[task])) for task in TASKS
+        }
+        self._semaphores = {
+            task: threading.BoundedSemaphore(int(os.environ.get(f'LLM_CONCURRENCY_{task.upper()}', DEFAULT_CONCURRENCY[task])))
+            for task in TASKS
+        }
+        self._stats = {task: TaskStats() for task in TASKS}
+
+    @property
+    def client(self):
+        return self._client or get_openai_client()
+
+    def chat(self, task, **kwargs):
+        """chat.completions.create for task; returns the response"""
+        stats = self._stats[task]
+        self._acquire(task)
+        started = time.perf_counter()
+        try:
+            response = self._with_retries(task, kwargs)
+        except Exception:
+            stats.record_call((time.perf_counter() - started) * 1000, ok=False)
+            raise
+        finally:
+            self._semaphores[task].release()
+
+        stats.record_call((time.perf_counter() - started) * 1000, ok=True)
+        stats.record_usage(getattr(response, 'usage', None))
+        return response
+
+    def chat_stream(self, task, **kwargs):
+        """
+        Streaming chat.completions.create; yields chunks. Only opening the
+        stream is retried: once chunks have been yielded a failure is raised.
+        The task's slot is held until the stream is consumed or closed.
+        """
+        kwargs = dict(kwargs, stream=True)
+        kwargs.setdefault('stream_options', {'include_usage': True})
+        stats = self._stats[task]
+
+        self._acquire(task)
+        started = time.perf_counter()
+        ok = False
+        stream = None
+        try:
+            stream = self._with_retries(task, kwargs)
+            for chunk in stream:
+                if getattr(chunk, 'usage', None):
+                    stats.record_usage(chunk.usage)
+                yield chunk
+            ok = True
+        except GeneratorExit:
+            # Abandoned by the reader (client gone, draft superseded): not an error
+            ok = None
+            raise
+        finally:
+            if stream is not None and not ok and hasattr(stream, 'close'):
+                stream.close()
+            self._semaphores[task].release()
+            if ok is not None:
+                stats.record_call((time.perf_counter() - started) * 1000, ok=ok)
+
+    def stats(self):
+        result = {task: stats.snapshot() for task, stats in self._stats.items()}
+        result['circuit'] = self.breaker.stats()
+        return result
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+    def _acquire(self, task):
+        if not self._semaphores[task].acquire(timeout=QUEUE_TIMEOUT_SECONDS):
+            self._stats[task].bump('rejected')
+            raise LLMUnavailable(f'Too many concurrent {task} calls')
+
+    def _with_retries(self, task, kwargs):
+        kwargs.setdefault('timeout', self.timeouts[task])
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.breaker.before_call()
+            except LLMUnavailable:
+                self._stats[task].bump('rejected')
+                raise
+
+            try:
+                result = self.client.chat.completions.create(**kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    # Upstream answered (e.g. a 400): it is healthy
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                self._stats[task].bump('retries')
+                print(f"LLM {task} call failed ({e}), retrying")
+                time.sleep(backoff_seconds(attempt))
+                continue
+
+            self.breaker.record_success()
+            return result
+
+
+gateway = LLMGateway()
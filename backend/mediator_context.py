@@ -0,0 +1,117 @@
+# mediator_context.py
+"""
+Bounded prompt context for EmailMediator.
+
+The mediator is stateful: everything earlier turns established is already
+captured in its `json_state`. So instead of resending the whole
+conversation each turn, the prompt carries the system prompt, the current
+state, a sliding window of recent turns and a compact summary of the turns
+that fell out of the window. Prompt size stays flat however long the
+compose session runs.
+"""
+
+import json
+import os
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # optional; fall back to a character estimate
+    _encoding = None
+
+DEFAULT_TOKEN_BUDGET = int(os.environ.get('MEDIATOR_CONTEXT_TOKENS', 3000))
+DEFAULT_WINDOW_TURNS = int(os.environ.get('MEDIATOR_WINDOW_TURNS', 4))
+# Share of the budget the compacted summary may use
+SUMMARY_TOKEN_BUDGET = 400
+# Longest excerpt of a compacted user turn kept in the summary
+SUMMARY_LINE_CHARS = 200
+
+
+def estimate_tokens(text):
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    # ~4 characters per token for English prose and JSON
+    return len(text) // 4 + 1
+
+
+def message_tokens(messages):
+    # Each chat message carries a few tokens of framing
+    return sum(estimate_tokens(m["content"]) + 4 for m in messages)
+
+
+class MediatorContext:
+    def __init__(self, system_prompt, token_budget=DEFAULT_TOKEN_BUDGET, window_turns=DEFAULT_WINDOW_TURNS):
+        self.system_prompt = system_prompt
+        self.token_budget = token_budget
+        self.window_turns = window_turns
+
+        self.turns = []          # [(user_content, assistant_content)], oldest first
+        self.summary_lines = []  # compacted user requests, oldest first
+
+    def add_turn(self, user_content, assistant_content):
+        self.turns.append((user_content, assistant_content))
+        while len(self.turns) > self.window_turns:
+            self._compact_oldest()
+
+    def build_messages(self, json_state, user_input):
+        """Messages for the next model call, trimmed to the token budget"""
+        while True:
+            messages = self._render(json_state, user_input)
+            if message_tokens(messages) <= self.token_budget or not self.turns:
+                return messages
+            self._compact_oldest()
+
+    def reset(self):
+        self.turns = []
+        self.summary_lines = []
+
+    def to_dict(self):
+        return {"turns": [list(turn) for turn in self.turns], "summary_lines": list(self.summary_lines)}
+
+    def load_dict(self, data):
+        self.turns = [tuple(turn) for turn in data.get("turns", [])]
+        self.summary_lines = list(data.get("summary_lines", []))
+        while len(self.turns) > self.window_turns:
+            self._compact_oldest()
+
+    def load_chat_history(self, chat_history):
+        """Rebuild from a flat user/assistant message list (older stored sessions)"""
+        self.reset()
+        pending = None
+        for message in chat_history:
+            if message.get("role") == "user":
+                pending = message.get("content", "")
+            elif message.get("role") == "assistant" and pending is not None:
+                self.add_turn(pending, message.get("content", ""))
+                pending = None
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+    def _render(self, json_state, user_input):
+        messages = [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "system", "content": "Current state (preserve unless the user changes it):\n" + json.dumps(json_state)},
+        ]
+        if self.summary_lines:
+            messages.append({
+                "role": "system",
+                "content": "Earlier user requests in this session, oldest first:\n" + "\n".join(self.summary_lines)
+            })
+        for user_content, assistant_content in self.turns:
+            messages.append({"role": "user", "content": user_content})
+            messages.append({"role": "assistant", "content": assistant_content})
+        messages.append({"role": "user", "content": user_input})
+        return messages
+
+    def _compact_oldest(self):
+        user_content, _ = self.turns.pop(0)
+
+        # The assistant reply is not kept: its effect is in json_state
+        excerpt = " ".join(user_content.split())
+        if len(excerpt) > SUMMARY_LINE_CHARS:
+            excerpt = excerpt[:SUMMARY_LINE_CHARS] + "..."
+        self.summary_lines.append(f"- {excerpt}")
+
+        while len(self.summary_lines) > 1 and estimate_tokens("\n".join(self.summary_lines)) > SUMMARY_TOKEN_BUDGET:
+            self.summary_lines.pop(0)
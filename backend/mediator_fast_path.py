@@ -0,0 +1,164 @@
+# mediator_fast_path.py
+"""
+Deterministic pre-parser for trivial mediator inputs.
+
+Some utterances need no language model at all: a bare email address when
+no recipient is known yet, "cc bob@example.com", "yes" / "send it", or
+"2" while the recipient is ambiguous. try_fast_path() handles exactly
+those, and only when the whole utterance matches; anything else returns
+None and goes to the model as before.
+
+Picking a recipient usually leaves work for the model: while the
+recipient is ambiguous the description is held back, so it still has to
+be written. resolve_recipient_pick() spells the pick out for that model
+turn instead.
+"""
+
+import re
+import threading
+
+EMAIL = r"[A-Za-z0-9._%+\-']+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}"
+# A name as the user would dictate it for cc/bcc: up to three capitalized
+# words, case-sensitive even inside IGNORECASE patterns ("cc my boss" is not one)
+NAME = r"(?-i:[A-Z][A-Za-z'\-]*(?:\s+[A-Z][A-Za-z'\-]*){0,2})"
+RECIPIENT = rf"(?:{EMAIL}|{NAME})"
+RECIPIENT_LIST = rf"{RECIPIENT}(?:\s*(?:,|\band\b|&)\s*{RECIPIENT})*"
+
+_SENDER_SUFFIX = re.compile(r"\s*sender_name:.*$", re.DOTALL)
+_FILLER = re.compile(r"^(?:please|pls|ok(?:ay)?|and|also)[,\s]+|[,\s]+(?:please|pls|thanks|thank you)$", re.IGNORECASE)
+
+_EMAILS_ONLY = re.compile(rf"^(?:(?:to|send (?:it|this) to|email)\s+)?({EMAIL}(?:\s*(?:,|\band\b)\s*{EMAIL})*)$", re.IGNORECASE)
+_COPY = re.compile(
+    rf"^(?:(?:add|put|include)\s+)?(bcc|cc)\s*:?\s+({RECIPIENT_LIST})$"
+    rf"|^(?:add|put|include)\s+({RECIPIENT_LIST})\s+(?:(?:in|on|to|as)\s+)?(bcc|cc)$",
+    re.IGNORECASE
+)
+_AFFIRMATIONS = {
+    'yes', 'yeah', 'yep', 'yup', 'ok', 'okay', 'sure', 'fine', 'great', 'perfect', 'good', 'nice',
+    'looks good', 'look good', 'looks great', 'looks fine', 'looks perfect', 'sounds good', 'sounds great',
+    'thats fine', "that's fine", 'that is fine', 'thats good', "that's good", 'that works', 'all good',
+    'send it', 'send', 'send this', 'send the email', 'go ahead', 'done', 'no changes', 'thanks', 'thank you',
+    'yes send it', 'yes looks good', 'ok send it', 'okay send it', 'perfect send it', 'great thanks',
+}
+_ORDINALS = {
+    'first': 1, 'second': 2, 'third': 3, 'fourth': 4, 'fifth': 5,
+    'sixth': 6, 'seventh': 7, 'eighth': 8, 'ninth': 9, 'tenth': 10,
+    'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
+    'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10,
+}
+_OPTION = re.compile(
+    r"^(?:(?:i mean|pick|choose|select|use|go with)\s+)?(?:the\s+)?(?:option|number|no\.?|#)?\s*"
+    r"(\d{1,2}|first|second|third|fourth|fifth|sixth|seventh|eighth|ninth|tenth|one|two|three|four|five|six|seven|eight|nine|ten)"
+    r"(?:\s+(?:one|option))?$",
+    re.IGNORECASE
+)
+_SPLIT_LIST = re.compile(r"\s*(?:,|\band\b|&)\s*")
+
+
+def clean_utterance(user_input):
+    """The user's words without the sender suffix, fillers and trailing punctuation"""
+    text = _SENDER_SUFFIX.sub('', user_input)
+    text = ' '.join(text.split()).strip(' .!?')
+    previous = None
+    while previous != text:
+        previous = text
+        text = _FILLER.sub('', text).strip(' ,.!?')
+    return text
+
+
+def try_fast_path(state, user_input):
+    """New json_state for a trivial input, or None when the model must decide"""
+    text = clean_utterance(user_input)
+    if not text:
+        return None
+
+    lowered = text.lower()
+
+    if lowered.replace(',', '') in _AFFIRMATIONS:
+        # Approval changes nothing, so the draft already speculated for this state is kept
+        return dict(state)
+
+    if _is_ambiguous(state):
+        # Only complete on its own when the description is already there
+        if recipient_pick(state, user_input) is not None and state.get('description'):
+            return dict(state, recipient_options=None)
+        return None
+
+    match = _EMAILS_ONLY.match(text)
+    if match and not state.get('recipient_name'):
+        emails = [e for e in _SPLIT_LIST.split(match.group(1)) if e]
+        if len(emails) == 1:
+            return dict(state, recipient_name=emails[0], recipient_options=None)
+        return None
+
+    match = _COPY.match(text)
+    if match:
+        field = (match.group(1) or match.group(4)).lower()
+        recipients = [r for r in _SPLIT_LIST.split(match.group(2) or match.group(3)) if r]
+        existing = list(state.get(field) or [])
+        for recipient in recipients:
+            if recipient.lower() not in (e.lower() for e in existing):
+                existing.append(recipient)
+        return dict(state, **{field: existing})
+
+    return None
+
+
+def _is_ambiguous(state):
+    options = state.get('recipient_options')
+    return isinstance(options, int) and not isinstance(options, bool) and options > 1
+
+
+def recipient_pick(state, user_input):
+    """The option (from 1) user_input picks while the recipient is ambiguous, else None"""
+    if not _is_ambiguous(state):
+        return None
+    match = _OPTION.match(clean_utterance(user_input).lower())
+    if not match:
+        return None
+    choice = match.group(1)
+    index = int(choice) if choice.isdigit() else _ORDINALS[choice]
+    return index if 1 <= index <= state['recipient_options'] else None
+
+
+def resolve_recipient_pick(state, user_input):
+    """
+    (state, user_input) for a model turn. A recipient pick comes back with
+    the ambiguity cleared and spelled out, so the model goes on to write
+    the description it held back.
+    """
+    index = recipient_pick(state, user_input)
+    if index is None:
+        return state, user_input
+    sender = _SENDER_SUFFIX.search(user_input)
+    text = (
+        f"I mean option {index} of the {state['recipient_options']} people named "
+        f"{state.get('recipient_name')}; the recipient is resolved, so continue with the email I asked for."
+    )
+    return dict(state, recipient_options=None), text + (sender.group(0) if sender else '')
+
+
+class FastPathStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else None
+            }
+
+
+fast_path_stats = FastPathStats()
@@ -0,0 +1,141 @@
+# mediator_output.py
+"""
+Parsing and validation of mediator replies.
+
+In full mode the model re-emits all seven state keys every turn. In delta
+mode it answers through a strict JSON schema with only what changed: every
+key is present, "changed" names the keys to update, and the others are
+null, so an unchanged description costs one token instead of a paragraph.
+EmailMediator merges the patch into json_state locally.
+
+Both parsers raise MediatorOutputError on anything that does not validate,
+so a malformed reply is never merged into the state.
+"""
+
+import json
+import os
+import threading
+
+STATE_KEYS = (
+    "recipient_name", "recipient_relation", "recipient_options",
+    "cc", "bcc", "description", "mail_revision"
+)
+STRING_KEYS = ("recipient_name", "recipient_relation", "description", "mail_revision")
+LIST_KEYS = ("cc", "bcc")
+
+# 'delta' (default) or 'full'
+OUTPUT_MODE = os.environ.get('MEDIATOR_OUTPUT_MODE', 'delta')
+
+_NULLABLE_STRING = {"type": ["string", "null"]}
+_NULLABLE_LIST = {"type": ["array", "null"], "items": {"type": "string"}}
+
+PATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "changed": {"type": "array", "items": {"type": "string", "enum": list(STATE_KEYS)}},
+        "recipient_name": _NULLABLE_STRING,
+        "recipient_relation": _NULLABLE_STRING,
+        "recipient_options": {"type": ["integer", "null"]},
+        "cc": _NULLABLE_LIST,
+        "bcc": _NULLABLE_LIST,
+        "description": _NULLABLE_STRING,
+        "mail_revision": _NULLABLE_STRING
+    },
+    "required": ["changed"] + list(STATE_KEYS),
+    "additionalProperties": False
+}
+
+PATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "mediator_patch", "strict": True, "schema": PATCH_SCHEMA}
+}
+
+# Appended to the mediator system prompt in delta mode; overrides rule 1
+PATCH_RULES = """
+11. OUTPUT FORMAT IN PATCH MODE (overrides rule 1)
+
+* The current state is given to you. Return only what changes.
+* "changed" lists every key whose value differs from the current state, and nothing else.
+* Keys listed in "changed" carry their new value; null clears the value.
+* Every key not listed in "changed" must be null.
+* If nothing changes, "changed" is an empty array.
+"""
+
+
+class MediatorOutputError(ValueError):
+    """The model's reply is not valid JSON or does not fit the state schema"""
+
+
+def validate_value(key, value):
+    if value is None:
+        return None
+    if key in STRING_KEYS:
+        if not isinstance(value, str):
+            raise MediatorOutputError(f"{key} must be a string or null")
+        return value
+    if key in LIST_KEYS:
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise MediatorOutputError(f"{key} must be an array of strings or null")
+        return value or None
+    # recipient_options: a count of matches, only meaningful when > 1
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise MediatorOutputError("recipient_options must be an integer or null")
+    return value if value > 1 else None
+
+
+def _load_object(content):
+    try:
+        data = json.loads(content or '')
+    except json.JSONDecodeError as e:
+        raise MediatorOutputError(f"not valid JSON: {e}")
+    if not isinstance(data, dict):
+        raise MediatorOutputError("not a JSON object")
+    return data
+
+
+def parse_full_state(content, current):
+    """New state from a full-mode reply; keys it leaves out keep their current value"""
+    data = _load_object(content)
+    state = dict(current)
+    for key in STATE_KEYS:
+        if key in data:
+            state[key] = validate_value(key, data[key])
+    return state
+
+
+def parse_patch(content, current):
+    """New state from a delta-mode reply"""
+    data = _load_object(content)
+    changed = data.get("changed")
+    if not isinstance(changed, list) or any(key not in STATE_KEYS for key in changed):
+        raise MediatorOutputError("changed must list state keys")
+    state = dict(current)
+    for key in changed:
+        state[key] = validate_value(key, data.get(key))
+    return state
+
+
+def encode_patch(current, state):
+    """The delta-mode reply that turns current into state"""
+    patch = {key: None for key in STATE_KEYS}
+    patch["changed"] = [key for key in STATE_KEYS if current.get(key) != state.get(key)]
+    for key in patch["changed"]:
+        patch[key] = state.get(key)
+    return json.dumps(patch)
+
+
+class OutputStats:
+    def __init__(self):
+        self.counts = {'ok': 0, 'repaired': 0, 'failed': 0}
+        self._lock = threading.Lock()
+
+    def record(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, mode=OUTPUT_MODE)
+
+
+output_stats = OutputStats()
@@ -0,0 +1,522 @@
+# mediator_store.py
+"""
+Session store for EmailMediator instances.
+
+Live mediators are kept in a bounded in-process LRU with idle expiry and
+rough memory accounting. Behind it sits a pluggable persistence backend:
+the default keeps nothing outside the process, while the SQLite backend
+lets mediator state survive restarts and be shared by several gunicorn
+workers on one host, so sessions no longer need to be sticky.
+
+Each session keeps a versioned snapshot of its state in memory; the version
+only moves when the state actually changes. Versions count from the moment
+a session is created, so a cursor ("<epoch>.<version>", see state_cursor)
+also carries a per-session epoch: a reader holding a cursor from before an
+eviction or restart sees the epoch differ and gets the current state.
+
+A backend shared by several workers (MEDIATOR_STORE=sqlite) is written
+synchronously and allocates versions itself, so another worker never reads
+a state older than one already handed out. A backend private to one worker
+(MEDIATOR_STORE=sqlite with MEDIATOR_STORE_SHARED=0: state survives
+restarts, one worker only) is written behind the request path by a
+PersistenceSink, which coalesces changes per session and writes them in
+batches.
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from message_cache import estimate_size
+
+DEFAULT_MAX_SESSIONS = 1000
+DEFAULT_IDLE_TTL_SECONDS = 2 * 60 * 60
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# How often idle sessions are purged from a persistent backend
+BACKEND_PURGE_INTERVAL_SECONDS = 10 * 60
+# Write-behind: how long a change may wait before it is persisted
+DEFAULT_FLUSH_INTERVAL_SECONDS = 0.5
+DEFAULT_MAX_BATCH = 100
+# How often a session is re-checked in a shared backend for changes made by
+# other workers while streams wait on it (once per session, not per stream)
+CROSS_WORKER_POLL_SECONDS = 2.0
+
+
+# ----------------------------------------------------------------------
+# Persistence backends
+# ----------------------------------------------------------------------
+class InMemoryBackend:
+    """No persistence: state lives only in the worker that created it"""
+
+    persistent = False
+    shared = False
+
+    def save(self, session_id, data, version):
+        return version
+
+    def load(self, session_id, newer_than=0):
+        return None
+
+    def delete(self, session_id):
+        pass
+
+
+class SQLiteBackend:
+    """Mediator state in a SQLite file, by default shared by every worker on the host"""
+
+    persistent = True
+
+    def __init__(self, path, shared=True):
+        self.path = path
+        # Shared: every worker on the host reads and writes the same rows.
+        # Otherwise only this worker uses the file, which can then be
+        # written behind the request path.
+        self.shared = shared
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS mediator_sessions ("
+                " session_id TEXT PRIMARY KEY,"
+                " version INTEGER NOT NULL,"
+                " data TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def save(self, session_id, data, version):
+        """
+        Store data as the session's next version and return that version.
+        It differs from version when another worker saved the session
+        since this one loaded it.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT version FROM mediator_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            stored = (row[0] if row else 0) + 1
+            conn.execute(
+                "INSERT INTO mediator_sessions (session_id, version, data, updated_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(session_id) DO UPDATE SET"
+                " version = excluded.version, data = excluded.data, updated_at = excluded.updated_at",
+                (session_id, stored, json.dumps(data), time.time())
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return stored
+
+    def save_many(self, items):
+        """Write [(session_id, data, version)] in one transaction"""
+        now = time.time()
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT INTO mediator_sessions (session_id, version, data, updated_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(session_id) DO UPDATE SET"
+                " version = excluded.version, data = excluded.data, updated_at = excluded.updated_at"
+                " WHERE excluded.version > mediator_sessions.version",
+                [(session_id, version, json.dumps(data), now) for session_id, data, version in items]
+            )
+
+    def load(self, session_id, newer_than=0):
+        """(data, version) if the stored state is newer than newer_than, else None"""
+        row = self._connection().execute(
+            "SELECT data, version FROM mediator_sessions WHERE session_id = ? AND version > ?",
+            (session_id, newer_than)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def delete(self, session_id):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM mediator_sessions WHERE session_id = ?", (session_id,))
+
+    def purge_idle(self, idle_ttl):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM mediator_sessions WHERE updated_at < ?", (time.time() - idle_ttl,))
+
+
+def backend_from_env():
+    """
+    MEDIATOR_STORE=sqlite (with MEDIATOR_STORE_PATH, and
+    MEDIATOR_STORE_SHARED=0 for a single worker) or memory (default)
+    """
+    if os.environ.get('MEDIATOR_STORE', 'memory').lower() == 'sqlite':
+        return SQLiteBackend(
+            os.environ.get('MEDIATOR_STORE_PATH', 'mediator_sessions.db'),
+            shared=os.environ.get('MEDIATOR_STORE_SHARED', '1') != '0'
+        )
+    return InMemoryBackend()
+
+
+# ----------------------------------------------------------------------
+# Write-behind sink
+# ----------------------------------------------------------------------
+class PersistenceSink:
+    """
+    Asynchronous, batched writes to a backend.
+
+    Only the newest pending state of each session is kept, so a session that
+    changes several times between flushes is written once.
+    """
+
+    def __init__(self, backend, flush_interval=DEFAULT_FLUSH_INTERVAL_SECONDS, max_batch=DEFAULT_MAX_BATCH):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        self._pending = OrderedDict()   # session_id -> (data, version)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flush_lock = threading.Lock()
+        self.writes = 0
+        self.coalesced = 0
+        self.errors = 0
+
+        self._thread = threading.Thread(target=self._run, name='mediator-sink', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def submit(self, session_id, data, version):
+        with self._lock:
+            if session_id in self._pending:
+                self.coalesced += 1
+            self._pending[session_id] = (data, version)
+            self._pending.move_to_end(session_id)
+            if len(self._pending) >= self.max_batch:
+                self._wake.set()
+
+    def discard(self, session_id):
+        with self._lock:
+            self._pending.pop(session_id, None)
+
+    def pending(self, session_id):
+        """(data, version) not yet written for the session, or None"""
+        with self._lock:
+            return self._pending.get(session_id)
+
+    def flush(self):
+        """Write everything pending now (also run at interpreter exit)"""
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        return
+                    batch = []
+                    while self._pending and len(batch) < self.max_batch:
+                        session_id, (data, version) = self._pending.popitem(last=False)
+                        batch.append((session_id, data, version))
+                try:
+                    save_many = getattr(self.backend, 'save_many', None)
+                    if save_many:
+                        save_many(batch)
+                    else:
+                        for item in batch:
+                            self.backend.save(*item)
+                    self.writes += len(batch)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Error persisting mediator sessions: {e}")
+                    return
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'writes': self.writes,
+                'coalesced': self.coalesced,
+                'errors': self.errors
+            }
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+def state_digest(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def new_epoch():
+    return uuid.uuid4().hex[:8]
+
+
+def state_cursor(epoch, state_version):
+    """Opaque position in a session's state history (SSE id, ETag, ?since=)"""
+    return f"{epoch}.{state_version}"
+
+
+def parse_cursor(cursor):
+    """(epoch or None, state_version) from a cursor or a bare version; (None, -1) if unreadable"""
+    epoch, _, version = ('' if cursor is None else str(cursor)).strip().rpartition('.')
+    try:
+        return epoch or None, int(version)
+    except ValueError:
+        return None, -1
+
+
+# ----------------------------------------------------------------------
+# Store
+# ----------------------------------------------------------------------
+class MediatorStore:
+    def __init__(self, factory, backend=None, max_sessions=DEFAULT_MAX_SESSIONS,
+                 idle_ttl=DEFAULT_IDLE_TTL_SECONDS, max_bytes=DEFAULT_MAX_BYTES,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL_SECONDS):
+        """
+        factory(data=None) must return a mediator; with data it restores
+        one from the dict produced by mediator.to_dict().
+
+        flush_interval=0 writes persistent backends synchronously instead
+        of through a PersistenceSink. Shared backends are always written
+        synchronously: a queued write would let another worker load, and
+        then overwrite, an older state.
+        """
+        self.factory = factory
+        self.backend = backend or InMemoryBackend()
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+
+        self.sink = None
+        if self.backend.persistent and not self.backend.shared and flush_interval > 0:
+            self.sink = PersistenceSink(self.backend, flush_interval)
+
+        # session_id -> {'mediator', 'version', 'digest', 'state', 'state_version',
+        #                'state_epoch', 'state_digest', 'size', 'last_access', 'checked_at'}
+        # version counts every persisted change (conversation included);
+        # state_version only moves when json_state does.
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Signalled whenever a session's state_version moves
+        self._changed = threading.Condition(self._lock)
+        self._last_purge = time.monotonic()
+        self.evictions = 0
+
+    def get(self, session_id):
+        with self._lock:
+            self._expire_idle()
+            entry = self._entries.get(session_id)
+            known_version = entry['version'] if entry else 0
+            if entry:
+                entry['checked_at'] = time.monotonic()
+
+        # Loading and building a mediator happen outside the lock, so a slow
+        # load only holds up its own session
+        stored = mediator = None
+        if entry is None or self.backend.shared:
+            # Another worker may have advanced this session since we cached it
+            stored = self._load(session_id, known_version)
+        if stored is not None:
+            data, version = stored
+            mediator = self.factory(data)
+        elif entry is None:
+            mediator = self.factory()
+
+        with self._lock:
+            current = self._entries.get(session_id)
+            if stored is not None and (current is None or current['version'] < version):
+                current = self._put(session_id, mediator, version, data,
+                                    data.get('state_version', version), data.get('state_epoch') or new_epoch())
+                self._changed.notify_all()
+            elif current is None:
+                # Evicted in the meantime, in which case nothing was built yet
+                if mediator is None:
+                    mediator = self.factory()
+                current = self._put(session_id, mediator, 0, mediator.to_dict(), 0, new_epoch())
+
+            current['last_access'] = time.monotonic()
+            self._entries.move_to_end(session_id)
+            return current['mediator']
+
+    def save(self, session_id, mediator):
+        """
+        Record a mediator after an advance and return its state version.
+        Nothing is written when the session did not actually change.
+        """
+        data = mediator.to_dict()
+        digest = state_digest(data)
+
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry and entry['digest'] == digest:
+                entry['last_access'] = time.monotonic()
+                return entry['state_version']
+
+            version = (entry['version'] if entry else 0) + 1
+            state_version = entry['state_version'] if entry else 0
+            epoch = entry['state_epoch'] if entry else new_epoch()
+            if not entry or entry['state_digest'] != state_digest(data.get('json_state')):
+                state_version += 1
+            data['state_version'] = state_version
+            data['state_epoch'] = epoch
+            self._put(session_id, mediator, version, data, state_version, epoch)
+            self._changed.notify_all()
+
+        if self.sink:
+            self.sink.submit(session_id, data, version)
+        elif self.backend.persistent:
+            stored = self.backend.save(session_id, data, version)
+            if stored is not None and stored != version:
+                # Both workers advanced from the same version; this save is the newer one
+                print(f"⚠️ Mediator session {session_id} was also saved by another worker, stored as version {stored}")
+                with self._lock:
+                    entry = self._entries.get(session_id)
+                    if entry:
+                        entry['version'] = stored
+        return state_version
+
+    def snapshot(self, session_id):
+        """(json_state, cursor) as of the last save, or None for an unknown session"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            return entry['state'], state_cursor(entry['state_epoch'], entry['state_version'])
+
+    def wait_for_change(self, session_id, since, timeout):
+        """
+        Block until the session's state has moved past the cursor since.
+        Returns (json_state, cursor), or None after timeout seconds. A cursor
+        from another epoch, or one ahead of the session, answers at once.
+        """
+        epoch, since_version = parse_cursor(since)
+        shared = self.backend.shared
+        deadline = time.monotonic() + timeout
+        while True:
+            if shared:
+                # Picks up advances handled by another worker
+                self._refresh(session_id)
+            with self._changed:
+                entry = self._entries.get(session_id)
+                if entry and (
+                    entry['state_version'] != since_version
+                    or (epoch is not None and entry['state_epoch'] != epoch)
+                ):
+                    return entry['state'], state_cursor(entry['state_epoch'], entry['state_version'])
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._changed.wait(min(remaining, CROSS_WORKER_POLL_SECONDS) if shared else remaining)
+
+    def _refresh(self, session_id):
+        """get(), unless the session was checked less than CROSS_WORKER_POLL_SECONDS ago"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry and time.monotonic() - entry['checked_at'] < CROSS_WORKER_POLL_SECONDS:
+                return
+        self.get(session_id)
+
+    def _load(self, session_id, newer_than):
+        """(data, version) from the sink's pending writes or the backend, if newer than newer_than"""
+        pending = self.sink.pending(session_id) if self.sink else None
+        if pending is not None and pending[1] > newer_than:
+            return pending
+        return self.backend.load(session_id, newer_than=newer_than)
+
+    def reset(self, session_id):
+        """
+        Start the session over with a fresh mediator. It is saved like an
+        advance, so other workers pick it up, under a new epoch so that
+        every open stream resyncs.
+        """
+        self.get(session_id)
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry:
+                entry['state_epoch'] = new_epoch()
+                # Always written, even when the state was already empty
+                entry['digest'] = None
+        self.save(session_id, self.factory())
+
+    def delete(self, session_id):
+        with self._lock:
+            self._discard(session_id)
+        if self.sink:
+            self.sink.discard(session_id)
+        self.backend.delete(session_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._entries),
+                'bytes': self._bytes,
+                'max_sessions': self.max_sessions,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'backend': type(self.backend).__name__,
+                'sink': self.sink.stats() if self.sink else None
+            }
+
+    def _put(self, session_id, mediator, version, data, state_version, state_epoch):
+        self._discard(session_id)
+        data = {k: v for k, v in data.items() if k not in ('state_version', 'state_epoch')}
+        state = data.get('json_state', {})
+        size = estimate_size(data)
+        entry = {
+            'mediator': mediator,
+            'version': version,
+            'digest': state_digest(data),
+            # Copy: the mediator replaces json_state on the next advance
+            'state': json.loads(json.dumps(state)),
+            'state_version': state_version,
+            'state_epoch': state_epoch,
+            'state_digest': state_digest(state),
+            'size': size,
+            'last_access': time.monotonic(),
+            # Last time a shared backend was asked for a newer version
+            'checked_at': time.monotonic()
+        }
+        self._entries[session_id] = entry
+        self._bytes += size
+
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_sessions or self._bytes > self.max_bytes
+        ):
+            oldest = next(iter(self._entries))
+            if oldest == session_id:
+                break
+            self._discard(oldest)
+            self.evictions += 1
+
+        return entry
+
+    def _discard(self, session_id):
+        entry = self._entries.pop(session_id, None)
+        if entry:
+            self._bytes -= entry['size']
+
+    def _expire_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._entries:
+            session_id, entry = next(iter(self._entries.items()))
+            if entry['last_access'] >= cutoff:
+                break
+            self._discard(session_id)
+            self.evictions += 1
+
+        purge = getattr(self.backend, 'purge_idle', None)
+        if purge and time.monotonic() - self._last_purge > BACKEND_PURGE_INTERVAL_SECONDS:
+            self._last_purge = time.monotonic()
+            try:
+                purge(self.idle_ttl)
+            except Exception as e:
+                print(f"Error purging idle mediator sessions: {e}")
@@ -0,0 +1,186 @@
+# message_cache.py
+"""
+In-process cache of parsed Gmail messages.
+
+Gmail message content (headers, bodies, attachment metadata) never changes
+for a given message ID, so once parsed it can be reused by the inbox list,
+the message view and reply threading. Labels are the exception: they change
+whenever a message is read, starred or moved, so they are tracked on their
+own and never treated as part of the immutable content.
+"""
+
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_USER_MAX_BYTES = 8 * 1024 * 1024
+
+
+def estimate_size(value):
+    """Rough in-memory footprint of a cached value, in bytes"""
+    if value is None or isinstance(value, bool):
+        return 8
+    if isinstance(value, str):
+        return 49 + len(value)
+    if isinstance(value, (int, float)):
+        return 28
+    if isinstance(value, dict):
+        return 64 + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return 56 + sum(estimate_size(v) for v in value)
+    return 64
+
+
+class MessageCache:
+    """
+    Byte-budgeted LRU keyed by (user, message_id).
+
+    Each entry is a dict that may hold:
+        'headers': {lower-cased header name: value} (possibly partial)
+        'detail':  the parsed message as returned by /api/inbox/message/<id>
+
+    A user that exceeds its own quota evicts its own oldest entries first,
+    so one large mailbox cannot push everyone else out of the cache.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, user_max_bytes=DEFAULT_USER_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.user_max_bytes = user_max_bytes
+
+        self._entries = OrderedDict()   # (user, message_id) -> (entry, size)
+        self._user_keys = {}            # user -> OrderedDict of that user's keys, LRU order
+        self._user_bytes = {}
+        self._labels = {}               # (user, message_id) -> set of label IDs
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ------------------------------------------------------------------
+    # Content (immutable)
+    # ------------------------------------------------------------------
+    def get(self, user, message_id, field=None):
+        """
+        Return the cached entry, or None.
+
+        With field set, only counts as a hit if that part of the entry is
+        cached (e.g. field='detail' for the full parsed message).
+        """
+        key = (user, message_id)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or (field and item[0].get(field) is None):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._user_keys[user].move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, user, message_id, headers=None, detail=None):
+        """Add or extend a cache entry; headers are merged into any already cached"""
+        key = (user, message_id)
+        with self._lock:
+            existing = self._entries.get(key)
+            entry = dict(existing[0]) if existing else {}
+
+            if headers:
+                merged = dict(entry.get('headers') or {})
+                merged.update({name.lower(): value for name, value in headers.items()})
+                entry['headers'] = merged
+            if detail is not None:
+                entry['detail'] = detail
+
+            size = estimate_size(entry)
+            if size > self.user_max_bytes or size > self.max_bytes:
+                return
+
+            labels = self._labels.get(key)
+            if existing:
+                self._discard(key)
+
+            self._entries[key] = (entry, size)
+            self._bytes += size
+            self._user_bytes[user] = self._user_bytes.get(user, 0) + size
+            self._user_keys.setdefault(user, OrderedDict())[key] = None
+            if labels is not None:
+                self._labels[key] = labels
+
+            self._evict(user)
+
+    def get_header(self, user, message_id, name):
+        entry = self.get(user, message_id, field='headers')
+        if not entry:
+            return None
+        return entry['headers'].get(name.lower())
+
+    # ------------------------------------------------------------------
+    # Labels (mutable)
+    # ------------------------------------------------------------------
+    def get_labels(self, user, message_id):
+        with self._lock:
+            labels = self._labels.get((user, message_id))
+            return set(labels) if labels is not None else None
+
+    def set_labels(self, user, message_id, labels):
+        with self._lock:
+            # Only track labels for messages whose content we hold
+            if (user, message_id) in self._entries:
+                self._labels[(user, message_id)] = set(labels)
+
+    def update_labels(self, user, message_id, add=None, remove=None):
+        with self._lock:
+            labels = self._labels.get((user, message_id))
+            if labels is None:
+                return
+            labels.difference_update(remove or [])
+            labels.update(add or [])
+
+    # ------------------------------------------------------------------
+    # Housekeeping
+    # ------------------------------------------------------------------
+    def clear_user(self, user):
+        with self._lock:
+            for key in list(self._user_keys.get(user, ())):
+                self._discard(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'users': len(self._user_bytes),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'evictions': self.evictions
+            }
+
+    def _discard(self, key):
+        entry, size = self._entries.pop(key)
+        self._labels.pop(key, None)
+        self._bytes -= size
+
+        user = key[0]
+        self._user_bytes[user] -= size
+        del self._user_keys[user][key]
+        if not self._user_keys[user]:
+            del self._user_bytes[user]
+            del self._user_keys[user]
+
+    def _evict(self, user):
+        # Per-user quota first: drop this user's least recently used entries
+        while self._user_bytes.get(user, 0) > self.user_max_bytes:
+            oldest = next(iter(self._user_keys[user]))
+            self._discard(oldest)
+            self.evictions += 1
+
+        # Then the global budget, oldest first regardless of user
+        while self._bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self.evictions += 1
@@ -0,0 +1,170 @@
+# mime_parser.py
+"""
+Single-pass parser for Gmail API message payloads.
+
+Gmail returns a message as a tree of MIME parts whose bodies are base64url
+strings. Walking that tree once gives us everything the routes need: the
+preferred text/plain and text/html parts at any depth, and attachment
+metadata. Bodies are only decoded when asked for, and only as many bytes as
+the caller wants.
+"""
+
+import base64
+import re
+from html.parser import HTMLParser
+
+# Tags whose start or end is a line break in the text rendering
+_BLOCK_TAGS = {'p', 'div', 'br', 'tr', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'pre', 'table'}
+_SKIP_TAGS = {'script', 'style', 'head', 'title'}
+# Bytes of HTML decoded per byte of preview text wanted: newsletter
+# markup (inline styles, tables) easily outweighs its text several times
+HTML_PREVIEW_RATIO = 8
+
+
+def get_header(payload, name, default=None):
+    """Case-insensitive lookup of a top-level header value"""
+    name = name.lower()
+    for header in payload.get('headers', []):
+        if header['name'].lower() == name:
+            return header['value']
+    return default
+
+
+def decode_body(data, max_bytes=None):
+    """
+    Decode a base64url body string to text.
+
+    With max_bytes set only the prefix needed for that many bytes is
+    decoded, so truncating a multi-megabyte HTML part costs the same as
+    decoding a short one.
+    """
+    if not data:
+        return ''
+
+    if max_bytes is not None:
+        # Every 4 base64 characters hold 3 bytes
+        chars = -(-max_bytes // 3) * 4
+        data = data[:chars]
+
+    padded = data + '=' * (-len(data) % 4)
+    raw = base64.urlsafe_b64decode(padded)
+    if max_bytes is not None:
+        raw = raw[:max_bytes]
+
+    # A cut inside a multi-byte character is dropped rather than raising
+    return raw.decode('utf-8', errors='ignore')
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skipping += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in _BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+
+def html_to_text(html):
+    """Readable text of an HTML body (what the browser's textContent gives, with line breaks)"""
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    text = ''.join(extractor.parts)
+    text = re.sub(r'[ \t\r\f\v]+', ' ', text)
+    return re.sub(r'\s*\n\s*', '\n', text).strip()
+
+
+class ParsedPayload:
+    """Result of one walk over a message payload"""
+
+    def __init__(self, payload, plain_part, html_part, attachments):
+        self.payload = payload
+        self.plain_part = plain_part
+        self.html_part = html_part
+        self.attachments = attachments
+
+    def header(self, name, default=None):
+        return get_header(self.payload, name, default)
+
+    def plain_text(self, max_bytes=None):
+        if not self.plain_part:
+            return ''
+        return decode_body(self.plain_part['body'].get('data'), max_bytes)
+
+    def html_text(self, max_bytes=None):
+        if not self.html_part:
+            return ''
+        return decode_body(self.html_part['body'].get('data'), max_bytes)
+
+    def display_body(self, max_bytes=None):
+        """HTML when the message has it, plain text otherwise: (body, is_html)"""
+        if self.html_part:
+            return self.html_text(max_bytes), True
+        return self.plain_text(max_bytes), False
+
+    def preview_text(self, max_bytes=None):
+        """
+        Plain text when available, falling back to the text of the HTML
+        part. For HTML, max_bytes counts text rather than markup: up to
+        HTML_PREVIEW_RATIO times as many bytes of the part are decoded.
+        """
+        if self.plain_part:
+            return self.plain_text(max_bytes)
+        return html_to_text(self.html_text(max_bytes * HTML_PREVIEW_RATIO if max_bytes else None))
+
+
+def parse_payload(payload):
+    """
+    Walk a Gmail payload tree once.
+
+    The first inline text/plain and text/html parts found in document
+    order are kept as the message bodies; parts with a filename and an
+    attachmentId are reported as attachments.
+    """
+    plain_part = None
+    html_part = None
+    attachments = []
+
+    # Explicit stack instead of recursion: deeply nested forwards can
+    # exceed the recursion limit.
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        body = part.get('body') or {}
+        mime_type = part.get('mimeType', '')
+
+        if part.get('filename') and body.get('attachmentId'):
+            attachments.append({
+                'filename': part['filename'],
+                'mimeType': mime_type,
+                'size': int(body.get('size', 0)),
+                'attachmentId': body['attachmentId']
+            })
+        elif 'data' in body and not part.get('filename'):
+            if mime_type == 'text/plain' and plain_part is None:
+                plain_part = part
+            elif mime_type == 'text/html' and html_part is None:
+                html_part = part
+            elif not mime_type.startswith('text/') and part is payload and plain_part is None:
+                # Single-part message with an unusual type: show it as text
+                plain_part = part
+
+        children = part.get('parts')
+        if children:
+            stack.extend(reversed(children))
+
+    return ParsedPayload(payload, plain_part, html_part, attachments)
@@ -0,0 +1,146 @@
+# partial_json.py
+"""
+Incremental reader for the string fields of a streamed JSON object.
+
+The writer model replies with {"subject": "...", "body": "..."}. When that
+reply is streamed, feed() takes each raw chunk as it arrives and returns the
+newly decoded text of every top-level string field, so the body can be shown
+word by word long before the object is complete.
+"""
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class PartialJSONFields:
+    def __init__(self):
+        self.values = {}          # field -> decoded text so far (string fields only)
+        self._state = 'start'
+        self._key = []
+        self._field = None
+        self._escape = None       # None, '' (after a backslash) or 'u' plus the digits so far
+        self._high_surrogate = None
+        self._depth = 0           # nesting inside a skipped non-string value
+        self._skip_in_string = False
+        self._skip_escape = False
+
+    def feed(self, chunk):
+        """Consume raw text; return [(field, new_text)] decoded from it"""
+        deltas = {}
+        order = []
+        for ch in chunk:
+            text = self._step(ch)
+            if text:
+                if self._field not in deltas:
+                    deltas[self._field] = []
+                    order.append(self._field)
+                deltas[self._field].append(text)
+        return [(field, ''.join(deltas[field])) for field in order]
+
+    # ------------------------------------------------------------------
+    # State machine
+    # ------------------------------------------------------------------
+    def _step(self, ch):
+        state = self._state
+
+        if state == 'start':
+            if ch == '{':
+                self._state = 'key'
+        elif state == 'key':
+            if ch == '"':
+                self._key = []
+                self._state = 'in_key'
+            elif ch == '}':
+                self._state = 'done'
+        elif state == 'in_key':
+            # Field names here are plain ASCII; escapes are not decoded
+            if ch == '"':
+                self._field = ''.join(self._key)
+                self._state = 'colon'
+            else:
+                self._key.append(ch)
+        elif state == 'colon':
+            if ch == ':':
+                self._state = 'value'
+        elif state == 'value':
+            if ch == '"':
+                self.values[self._field] = ''
+                self._state = 'in_value'
+            elif not ch.isspace():
+                self._state = 'skip'
+                self._depth = 0
+                return self._skip(ch)
+        elif state == 'in_value':
+            return self._string_char(ch)
+        elif state == 'skip':
+            return self._skip(ch)
+        elif state == 'after_value':
+            if ch == ',':
+                self._state = 'key'
+            elif ch == '}':
+                self._state = 'done'
+        return None
+
+    def _string_char(self, ch):
+        if self._escape is None:
+            if ch == '\\':
+                self._escape = ''
+                return None
+            if ch == '"':
+                self._state = 'after_value'
+                # A high surrogate that never got its pair is kept, as json.loads does
+                return self._emit('')
+            return self._emit(ch)
+
+        if self._escape == '':
+            if ch == 'u':
+                self._escape = 'u'
+                return None
+            self._escape = None
+            return self._emit(_ESCAPES.get(ch, ch))
+
+        # \uXXXX
+        self._escape += ch
+        if len(self._escape) < 5:
+            return None
+        code = int(self._escape[1:], 16)
+        self._escape = None
+
+        if 0xDC00 <= code < 0xE000 and self._high_surrogate is not None:
+            code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+            self._high_surrogate = None
+        if 0xD800 <= code < 0xDC00:
+            text = self._emit('')
+            self._high_surrogate = code
+            return text
+        return self._emit(chr(code))
+
+    def _emit(self, text):
+        if self._high_surrogate is not None:
+            text = chr(self._high_surrogate) + text
+            self._high_surrogate = None
+        self.values[self._field] += text
+        return text
+
+    def _skip(self, ch):
+        """Step over a non-string value (number, literal, array, object)"""
+        if self._skip_in_string:
+            if self._skip_escape:
+                self._skip_escape = False
+            elif ch == '\\':
+                self._skip_escape = True
+            elif ch == '"':
+                self._skip_in_string = False
+            return None
+
+        if ch == '"':
+            self._skip_in_string = True
+        elif ch in '[{':
+            self._depth += 1
+        elif ch in ']}':
+            if self._depth == 0:
+                self._state = 'done'
+            else:
+                self._depth -= 1
+        elif ch == ',' and self._depth == 0:
+            self._state = 'key'
+        return None
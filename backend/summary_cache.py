@@ -0,0 +1,162 @@
+# summary_cache.py
+"""
+Content-addressed cache for email summaries.
+
+Summaries are generated at temperature 0, so the same text summarized by the
+same model with the same prompt gives (effectively) the same answer. The key
+is a hash of exactly those three things, with the text normalized first so
+whitespace differences between two renderings of a message don't matter.
+
+Entries live in a bounded in-memory LRU, optionally backed by a SQLite file
+that survives restarts and is shared by workers on one host.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+def normalize_text(text):
+    text = unicodedata.normalize('NFC', text)
+    return ' '.join(text.split())
+
+
+def summary_key(text, model, prompt=''):
+    material = '\0'.join((model, hashlib.sha256(prompt.encode('utf-8')).hexdigest(), normalize_text(text)))
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class SQLiteSummaryStore:
+    """On-disk tier: key -> (summary, expires_at)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                " key TEXT PRIMARY KEY,"
+                " summary TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT summary, expires_at FROM summaries WHERE key = ? AND expires_at > ?",
+            (key, time.time())
+        ).fetchone()
+        return row
+
+    def put(self, key, summary, expires_at):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, expires_at) VALUES (?, ?, ?)",
+                (key, summary, expires_at)
+            )
+
+    def purge_expired(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM summaries WHERE expires_at <= ?", (time.time(),))
+
+
+class SummaryCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL_SECONDS, store=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store
+
+        self._entries = OrderedDict()   # key -> (summary, expires_at), wall-clock expiry
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                if item[1] > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return item[0]
+                del self._entries[key]
+
+        if self.store is not None:
+            try:
+                row = self.store.get(key)
+            except Exception as e:
+                print(f"Error reading summary cache: {e}")
+                row = None
+            if row is not None:
+                with self._lock:
+                    self._remember(key, row[0], row[1])
+                    self.disk_hits += 1
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, summary):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, summary, expires_at)
+
+        if self.store is not None:
+            try:
+                self.store.put(key, summary, expires_at)
+            except Exception as e:
+                print(f"Error writing summary cache: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else None,
+                'disk': self.store is not None
+            }
+
+    def _remember(self, key, summary, expires_at):
+        self._entries[key] = (summary, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def summary_cache_from_env():
+    """SUMMARY_CACHE_PATH enables the SQLite tier; SUMMARY_CACHE_ENTRIES / SUMMARY_CACHE_TTL size it"""
+    path = os.environ.get('SUMMARY_CACHE_PATH')
+    store = None
+    if path:
+        store = SQLiteSummaryStore(path)
+        try:
+            store.purge_expired()
+        except Exception as e:
+            print(f"Error purging summary cache: {e}")
+
+    return SummaryCache(
+        max_entries=int(os.environ.get('SUMMARY_CACHE_ENTRIES', DEFAULT_MAX_ENTRIES)),
+        ttl=int(os.environ.get('SUMMARY_CACHE_TTL', DEFAULT_TTL_SECONDS)),
+        store=store
+    )
@@ -0,0 +1,83 @@
+# summary_chunker.py
+"""
+Input preparation for long-document summaries.
+
+Long threads mostly repeat themselves: every reply quotes the one before
+it. strip_quoted_replies() drops that quoted history, and split_chunks()
+cuts what is left into pieces under a token budget, preferring message
+boundaries, then paragraphs, then lines, so each piece reads on its own.
+"""
+
+import re
+
+from mediator_context import estimate_tokens
+
+# Separator thread_summary_text() puts between messages
+MESSAGE_SEPARATOR = '\n\n---\n\n'
+
+_QUOTE_HEADER = re.compile(r'^\s*On .{0,200}wrote:\s*$', re.IGNORECASE)
+_FORWARD_HEADER = re.compile(r'^\s*-{2,}\s*(Original Message|Forwarded message)\s*-{2,}\s*$', re.IGNORECASE)
+_OUTLOOK_HEADER = re.compile(r'^\s*From:\s.+$', re.IGNORECASE)
+
+
+def strip_quoted_replies(text):
+    """
+    Remove quoted reply history from each message of text: '>' lines, and
+    everything after an "On ... wrote:" or "-----Original Message-----"
+    header. Forwarded messages are kept, since their content is new.
+    """
+    sections = text.split(MESSAGE_SEPARATOR)
+    return MESSAGE_SEPARATOR.join(_strip_section(section) for section in sections)
+
+
+def _strip_section(section):
+    lines = section.split('\n')
+    kept = []
+    for i, line in enumerate(lines):
+        if line.lstrip().startswith('>'):
+            continue
+        if _QUOTE_HEADER.match(line):
+            break
+        if _FORWARD_HEADER.match(line) and 'original' in line.lower():
+            break
+        # Outlook replies: a "From:" block followed by "Sent:" starts the history
+        if i > 0 and _OUTLOOK_HEADER.match(line) and i + 1 < len(lines) and lines[i + 1].lower().startswith('sent:'):
+            break
+        kept.append(line)
+    return '\n'.join(kept).rstrip()
+
+
+def split_chunks(text, max_tokens):
+    """Split text into pieces of at most ~max_tokens, on the largest boundary that fits"""
+    return [chunk for chunk in _split(text, max_tokens, 0) if chunk.strip()]
+
+
+_BOUNDARIES = [MESSAGE_SEPARATOR, '\n\n', '\n', ' ']
+
+
+def _split(text, max_tokens, level):
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    if level == len(_BOUNDARIES):
+        # One unbroken run of characters: cut it by size
+        size = max(1, len(text) * max_tokens // estimate_tokens(text))
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    separator = _BOUNDARIES[level]
+    chunks = []
+    current = ''
+    for piece in text.split(separator):
+        candidate = current + separator + piece if current else piece
+        if estimate_tokens(candidate) <= max_tokens:
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        if estimate_tokens(piece) <= max_tokens:
+            current = piece
+        else:
+            chunks.extend(_split(piece, max_tokens, level + 1))
+            current = ''
+    if current:
+        chunks.append(current)
+    return chunks
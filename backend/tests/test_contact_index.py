@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("googleapiclient.discovery")
+
+from contact_index import ContactIndex, merge_counts, sent_address_counts
+
+
+class Request:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+class FakeGmail:
+    def __init__(self, sent):
+        # [(to, cc)] newest first
+        self.sent = [
+            {"id": f"s{i}", "payload": {"headers": [{"name": "To", "value": to}, {"name": "Cc", "value": cc}]}}
+            for i, (to, cc) in enumerate(sent)
+        ]
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return SimpleNamespace(list=self._list, get=self._get)
+
+    def _list(self, userId, labelIds, maxResults, pageToken=None):
+        assert labelIds == ["SENT"]
+        start = int(pageToken or 0)
+        end = start + maxResults
+        return Request({
+            "messages": [{"id": m["id"]} for m in self.sent[start:end]],
+            "nextPageToken": str(end) if end < len(self.sent) else None
+        })
+
+    def _get(self, userId, id, format, metadataHeaders=None):
+        return Request(next(m for m in self.sent if m["id"] == id))
+
+    def new_batch_http_request(self, callback):
+        requests = []
+        return SimpleNamespace(
+            add=lambda request, request_id: requests.append((request, request_id)),
+            execute=lambda: [callback(rid, r.execute(), None) for r, rid in requests]
+        )
+
+
+SENT = [
+    ("Priya Shah <Priya@acme.io>", ""),
+    ("priya@acme.io, sam@acme.io", "Daniel <daniel@acme.io>"),
+    ("sam@acme.io", ""),
+    ("old@acme.io", ""),
+]
+
+
+def test_sent_counts_come_from_recent_recipients():
+    counts = sent_address_counts(FakeGmail(SENT), max_messages=3)
+    assert counts == {"priya@acme.io": 2, "sam@acme.io": 2, "daniel@acme.io": 1}
+
+
+def test_recorded_and_seeded_counts_are_not_added_up():
+    assert merge_counts({"a@x.io": 3, "b@x.io": 1}, {"b@x.io": 4, "c@x.io": 2}) == {
+        "a@x.io": 3, "b@x.io": 4, "c@x.io": 2
+    }
+    assert merge_counts(None, None) == {}
+
+
+def test_seeded_counts_rank_search():
+    index = ContactIndex()
+    for name, email in (("Sam Lee", "sam.lee@acme.io"), ("Samuel Jackson-Smith", "sam@acme.io")):
+        index._apply_person("other", {
+            "resourceName": email, "names": [{"displayName": name}], "emailAddresses": [{"value": email}]
+        })
+    # Without counts the shorter entry ranks first
+    assert index.search("sam")[0]["email"] == "sam.lee@acme.io"
+    index.sent_counts = sent_address_counts(FakeGmail(SENT))
+    assert index.search("sam")[0]["email"] == "sam@acme.io"
@@ -0,0 +1,86 @@
+import pytest
+
+from draft_edits import DraftEditError, apply_edits, edit_set_too_large, parse_edit_reply
+
+DRAFT = {
+    "subject": "Standup",
+    "body": "Hi Priya,\n\nI will be late to standup tomorrow.\n\nThe deploy is on track.\n\nBest,\nJordan"
+}
+
+
+def test_edits_apply_to_the_draft_as_shown():
+    result = apply_edits(DRAFT, [
+        {"op": "replace_paragraph", "index": 2, "text": "I will miss the first half of standup."},
+        {"op": "replace_span", "find": "on track", "text": "on track for Friday"},
+        {"op": "set_subject", "text": " Running late "},
+    ])
+    assert result == {
+        "subject": "Running late",
+        "body": "Hi Priya,\n\nI will miss the first half of standup.\n\n"
+                "The deploy is on track for Friday.\n\nBest,\nJordan"
+    }
+
+
+def test_deleting_a_paragraph_keeps_later_numbers():
+    result = apply_edits(DRAFT, [
+        {"op": "replace_paragraph", "index": 2, "text": ""},
+        {"op": "replace_paragraph", "index": 3, "text": "The deploy slipped."},
+    ])
+    assert result["body"] == "Hi Priya,\n\nThe deploy slipped.\n\nBest,\nJordan"
+
+
+@pytest.mark.parametrize("index", [0, 5, -1, True, "2", None])
+def test_out_of_range_paragraph(index):
+    with pytest.raises(DraftEditError):
+        apply_edits(DRAFT, [{"op": "replace_paragraph", "index": index, "text": "x"}])
+
+
+@pytest.mark.parametrize("edits", [
+    # The same paragraph twice
+    [{"op": "replace_paragraph", "index": 2, "text": "a"}, {"op": "replace_paragraph", "index": 2, "text": "b"}],
+    # A span inside a replaced paragraph
+    [{"op": "replace_paragraph", "index": 3, "text": "a"}, {"op": "replace_span", "find": "deploy", "text": "b"}],
+    # Overlapping spans
+    [{"op": "replace_span", "find": "late to standup", "text": "a"},
+     {"op": "replace_span", "find": "standup tomorrow", "text": "b"}],
+    # The subject twice
+    [{"op": "set_subject", "text": "a"}, {"op": "set_subject", "text": "b"}],
+])
+def test_overlapping_edits_are_rejected(edits):
+    with pytest.raises(DraftEditError):
+        apply_edits(DRAFT, edits)
+
+
+@pytest.mark.parametrize("find", ["not in the draft", "\n\n", ""])
+def test_span_must_occur_exactly_once(find):
+    with pytest.raises(DraftEditError):
+        apply_edits(DRAFT, [{"op": "replace_span", "find": find, "text": "x"}])
+
+
+def test_span_is_matched_in_the_body_only():
+    # "Standup" is also the subject
+    result = apply_edits(DRAFT, [{"op": "replace_span", "find": "standup", "text": "the sync"}])
+    assert result["subject"] == "Standup"
+    assert "late to the sync tomorrow" in result["body"]
+
+
+def test_replacement_that_repeats_a_span_is_rejected():
+    with pytest.raises(DraftEditError):
+        apply_edits(DRAFT, [
+            {"op": "replace_paragraph", "index": 2, "text": "The deploy is late."},
+            {"op": "replace_span", "find": "The deploy is", "text": "Deploy:"},
+        ])
+
+
+def test_large_edit_sets_fall_back_to_a_rewrite():
+    edits = [{"op": "replace_paragraph", "index": i, "text": "x"} for i in (1, 2, 3)]
+    assert edit_set_too_large(DRAFT, edits)
+    assert not edit_set_too_large(DRAFT, edits[:1])
+
+
+def test_parse_edit_reply():
+    assert parse_edit_reply('{"mode": "rewrite", "body": "b"}') == ("rewrite", {"subject": "", "body": "b"})
+    assert parse_edit_reply('{"mode": "edit", "edits": []}') == ("edit", [])
+    for bad in ("", "[]", '{"mode": "edit", "edits": [1]}', '{"mode": "rewrite"}'):
+        with pytest.raises(DraftEditError):
+            parse_edit_reply(bad)
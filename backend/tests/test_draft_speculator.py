@@ -0,0 +1,74 @@
+import threading
+
+from draft_speculator import DraftSpeculator
+
+EMAIL = {"subject": "s", "body": "b"}
+
+
+def writer_events(gate=None, closed=None):
+    """Stands in for EmailWriter.generate_email_stream; waits on gate before finishing"""
+    def events():
+        try:
+            yield ("delta", "body", "b")
+            if gate is not None:
+                gate.wait(5)
+            yield ("done", EMAIL)
+        finally:
+            if closed is not None:
+                closed.set()
+    return events
+
+
+def test_started_draft_is_reused():
+    speculator = DraftSpeculator(max_workers=1)
+    job = speculator.speculate("s", "prompt", writer_events())
+    assert job.result(timeout=5) == EMAIL
+    assert speculator.job_for("s", "prompt") is job
+    assert speculator.job_for("s", "other prompt") is None
+    assert speculator.stats()["reused"] == 1
+
+
+def test_queued_draft_is_cancelled_not_waited_for():
+    speculator = DraftSpeculator(max_workers=1)
+    gate = threading.Event()
+    busy = speculator.speculate("a", "prompt", writer_events(gate))
+    busy.started.wait(5)
+
+    queued = speculator.speculate("b", "prompt", writer_events())
+    # Behind session a's draft in the only worker: the request writes it instead
+    assert speculator.job_for("b", "prompt") is None
+    assert queued.cancelled
+    gate.set()
+    assert busy.result(timeout=5) == EMAIL
+    queued.finished.wait(5)
+    assert not queued.started.is_set()
+    assert speculator.stats()["skipped"] == 1
+
+
+def test_timed_out_draft_is_cancelled_and_closed():
+    speculator = DraftSpeculator(max_workers=1)
+    gate = threading.Event()
+    closed = threading.Event()
+    job = speculator.speculate("s", "prompt", writer_events(gate, closed))
+    job.started.wait(5)
+
+    assert job.result(timeout=0.05) is None
+    assert job.cancelled
+    gate.set()
+    # The writer stream is closed instead of running on next to the request's own draft
+    assert job.finished.wait(5)
+    assert closed.is_set()
+    assert ("done", EMAIL) not in job.events
+    assert speculator.job_for("s", "prompt") is None
+
+
+def test_new_prompt_cancels_the_previous_draft():
+    speculator = DraftSpeculator(max_workers=2)
+    gate = threading.Event()
+    first = speculator.speculate("s", "first", writer_events(gate))
+    first.started.wait(5)
+    second = speculator.speculate("s", "second", writer_events())
+    assert first.cancelled
+    gate.set()
+    assert second.result(timeout=5) == EMAIL
+    assert speculator.job_for("s", "first") is None
@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("openai")
+
+from fused_pipeline import advance_pipeline
+from email_writer import EmailWriter
+from info_extractor import EmailMediator
+
+DRAFT = {"subject": "Running late", "body": "Hi Priya,\n\nI'll be late.\n\nJordan"}
+
+
+def test_new_email_does_not_revise_the_last_draft(monkeypatch):
+    mediator = EmailMediator(fast_path=False)
+    writer = EmailWriter()
+    writer.current_draft = dict(DRAFT)
+    seen = []
+
+    def advance_with_draft(user_input, current_draft):
+        seen.append(current_draft)
+        return mediator.json_state, None
+
+    monkeypatch.setattr(mediator, "advance_with_draft", advance_with_draft)
+    advance_pipeline(mediator, writer, "I need to email Sam sender_name: Jordan", "fused_first")
+    # fused_first fuses again, and without the previous email's draft
+    assert seen == [None]
+    assert writer.current_draft is None
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        advance_pipeline(EmailMediator(fast_path=False), EmailWriter(), "hi", "fusedd")
@@ -0,0 +1,180 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+from googleapiclient.errors import HttpError
+
+from inbox_sync import InboxSyncEngine, sync_page_offset
+
+
+class Request:
+    def __init__(self, fn):
+        self.fn = fn
+
+    def execute(self):
+        return self.fn()
+
+
+class Batch:
+    def __init__(self, callback):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request, request_id))
+
+    def execute(self):
+        for request, request_id in self.requests:
+            self.callback(request_id, request.execute(), None)
+
+
+class FakeGmail:
+    """Just enough of the Gmail API for the sync engine"""
+
+    def __init__(self, count=0):
+        self.store = {}
+        self.history_records = []   # [(history id, record)]
+        self.history_id = 100
+        self.expired = False
+        self.calls = {"list": 0, "get": 0, "history": 0, "profile": 0}
+        for i in range(count):
+            self.add(f"m{i}", date=i)
+
+    def add(self, message_id, date, labels=("INBOX",)):
+        self.store[message_id] = {
+            "id": message_id, "threadId": "t" + message_id, "labelIds": list(labels),
+            "internalDate": str(date), "snippet": "",
+            "payload": {"headers": [{"name": "Subject", "value": message_id}]}
+        }
+
+    def record(self, kind, message_id):
+        self.history_id += 1
+        labels = list(self.store.get(message_id, {}).get("labelIds", []))
+        item = {"message": {"id": message_id, "labelIds": labels}}
+        self.history_records.append((self.history_id, {kind: [item]}))
+
+    # API surface: users().messages(), users().history(), ...
+    def users(self):
+        return self
+
+    def messages(self):
+        return SimpleNamespace(list=self._list, get=self._get)
+
+    def history(self):
+        return SimpleNamespace(list=self._history)
+
+    def getProfile(self, userId):
+        self.calls["profile"] += 1
+        return Request(lambda: {"historyId": str(self.history_id)})
+
+    def new_batch_http_request(self, callback):
+        return Batch(callback)
+
+    def _list(self, userId, maxResults, pageToken=None, labelIds=None):
+        self.calls["list"] += 1
+        listed = sorted((m for m in self.store.values() if labelIds[0] in m["labelIds"]),
+                        key=lambda m: -int(m["internalDate"]))
+        start = int(pageToken or 0)
+        end = start + maxResults
+        return Request(lambda: {
+            "messages": [{"id": m["id"]} for m in listed[start:end]],
+            "nextPageToken": str(end) if end < len(listed) else None
+        })
+
+    def _get(self, userId, id, format, metadataHeaders=None):
+        self.calls["get"] += 1
+        return Request(lambda: dict(self.store[id]))
+
+    def _history(self, userId, startHistoryId, historyTypes, pageToken=None):
+        self.calls["history"] += 1
+        if self.expired:
+            raise HttpError(SimpleNamespace(status=404, reason="Not Found"), b"")
+        records = [r for h, r in self.history_records if h > int(startHistoryId)]
+        return Request(lambda: {"history": records, "historyId": str(self.history_id)})
+
+
+def subjects(messages):
+    return [m["subject"] for m in messages]
+
+
+def test_unchanged_inbox_costs_one_history_call():
+    service = FakeGmail(5)
+    engine = InboxSyncEngine()
+    first, _ = engine.list_messages(service, "u", "INBOX", 3)
+    assert subjects(first) == ["m4", "m3", "m2"]
+
+    before = dict(service.calls)
+    again, _ = engine.list_messages(service, "u", "INBOX", 3)
+    assert again == first
+    assert service.calls["history"] == before["history"] + 1
+    assert service.calls["get"] == before["get"]
+    assert service.calls["list"] == before["list"]
+
+
+def test_history_deltas_are_applied():
+    service = FakeGmail(3)
+    engine = InboxSyncEngine()
+    engine.list_messages(service, "u", "INBOX", 10)
+
+    service.add("new", date=10, labels=("INBOX", "UNREAD"))
+    service.record("messagesAdded", "new")
+    service.record("messagesDeleted", "m0")
+    service.store["m1"]["labelIds"] = ["INBOX", "UNREAD"]
+    service.record("labelsAdded", "m1")
+    service.store["m2"]["labelIds"] = ["ARCHIVED"]
+    service.record("labelsRemoved", "m2")
+
+    messages, _ = engine.list_messages(service, "u", "INBOX", 10)
+    assert subjects(messages) == ["new", "m1"]
+    assert [m["isUnread"] for m in messages] == [True, True]
+
+
+def test_expired_history_falls_back_to_a_full_resync():
+    service = FakeGmail(3)
+    engine = InboxSyncEngine()
+    engine.list_messages(service, "u", "INBOX", 10)
+
+    service.expired = True
+    service.add("new", date=10)
+    del service.store["m0"]
+    messages, _ = engine.list_messages(service, "u", "INBOX", 10)
+    assert subjects(messages) == ["new", "m2", "m1"]
+    assert service.calls["profile"] == 2
+
+
+def test_load_more_pages_through_the_mirror():
+    service = FakeGmail(5)
+    engine = InboxSyncEngine()
+    page, token = engine.list_messages(service, "u", "INBOX", 2)
+    assert token == "sync:2"
+    page, token = engine.list_messages(service, "u", "INBOX", 2, token)
+    assert subjects(page) == ["m2", "m1"]
+    page, token = engine.list_messages(service, "u", "INBOX", 2, token)
+    assert subjects(page) == ["m0"]
+    assert token is None
+
+
+@pytest.mark.parametrize("token, offset", [("sync:40", 40), ("sync:-3", 0), ("sync:x", 0), ("CAQ", 0), (None, 0)])
+def test_sync_page_offset(token, offset):
+    assert sync_page_offset(token) == offset
+
+
+def test_mirrors_are_bounded():
+    service = FakeGmail(1)
+    engine = InboxSyncEngine(max_users=2)
+    for user in ("a", "b", "a", "c"):
+        engine.list_messages(service, user, "INBOX")
+    assert engine.stats()["users"] == 2
+    assert set(engine._states) == {"a", "c"}
+
+
+def test_idle_mirrors_expire():
+    service = FakeGmail(1)
+    engine = InboxSyncEngine(idle_ttl=0)
+    engine.list_messages(service, "a", "INBOX")
+    engine._states["a"].last_access -= 1
+    engine.list_messages(service, "b", "INBOX")
+    assert list(engine._states) == ["b"]
+    assert engine.evictions == 1
@@ -0,0 +1,72 @@
+from mediator_fast_path import try_fast_path, recipient_pick, resolve_recipient_pick
+
+EMPTY = {
+    "recipient_name": None, "recipient_relation": None, "recipient_options": None,
+    "cc": None, "bcc": None, "description": None, "mail_revision": None
+}
+AMBIGUOUS = dict(EMPTY, recipient_name="Alex", recipient_options=3)
+
+
+def test_pick_without_description_goes_to_the_model():
+    # The description was held back while ambiguous; clearing the options alone would stall the draft
+    assert try_fast_path(AMBIGUOUS, "2 sender_name: Jordan") is None
+
+
+def test_pick_is_spelled_out_for_the_model_turn():
+    state, text = resolve_recipient_pick(AMBIGUOUS, "the second one sender_name: Jordan")
+    assert state["recipient_options"] is None
+    assert state["recipient_name"] == "Alex"
+    assert "option 2 of the 3 people named Alex" in text
+    assert text.endswith(" sender_name: Jordan")
+    assert AMBIGUOUS["recipient_options"] == 3
+
+
+def test_pick_with_description_is_decided_locally():
+    state = dict(AMBIGUOUS, description="Email to Alex asking for the Q3 budget figures.")
+    assert try_fast_path(state, "option 2") == dict(state, recipient_options=None)
+
+
+def test_pick_out_of_range_or_not_ambiguous():
+    assert recipient_pick(AMBIGUOUS, "5") is None
+    assert recipient_pick(dict(AMBIGUOUS, recipient_options=None), "2") is None
+    assert resolve_recipient_pick(EMPTY, "2") == (EMPTY, "2")
+
+
+def test_cc_appends_without_duplicates():
+    state = dict(EMPTY, recipient_name="Priya", cc=["Daniel"])
+    assert try_fast_path(state, "cc Daniel and maria@x.com")["cc"] == ["Daniel", "maria@x.com"]
+    assert try_fast_path(state, "cc my boss") is None
+
+
+def test_bare_address_only_when_no_recipient():
+    assert try_fast_path(EMPTY, "bob@example.com")["recipient_name"] == "bob@example.com"
+    assert try_fast_path(dict(EMPTY, recipient_name="Priya"), "bob@example.com") is None
+
+
+def test_mediator_passes_resolved_pick_to_the_model():
+    import json
+    from types import SimpleNamespace
+
+    import pytest
+    for module in ("dotenv", "httpx", "openai"):
+        pytest.importorskip(module)
+    from info_extractor import EmailMediator
+
+    sent = []
+
+    class StubLLM:
+        def chat(self, task, **kwargs):
+            sent.append(kwargs["messages"])
+            reply = {key: None for key in EMPTY}
+            reply.update(changed=["description"], description="Email to Alex about the budget.")
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(reply)))])
+
+    mediator = EmailMediator(output_mode="delta")
+    mediator.llm = StubLLM()
+    mediator.json_state = dict(AMBIGUOUS)
+
+    state = mediator.advance("2 sender_name: Jordan")
+    assert len(sent) == 1
+    assert "option 2 of the 3 people named Alex" in sent[0][-1]["content"]
+    assert state["recipient_options"] is None
+    assert state["description"] == "Email to Alex about the budget."
@@ -0,0 +1,172 @@
+import threading
+
+import pytest
+
+import mediator_store
+from mediator_store import MediatorStore, SQLiteBackend, parse_cursor, state_cursor
+
+
+class FakeMediator:
+    def __init__(self, data=None):
+        data = data or {}
+        self.json_state = dict(data.get("json_state") or {"description": None})
+        self.turns = data.get("turns", 0)
+
+    def to_dict(self):
+        return {"json_state": dict(self.json_state), "turns": self.turns}
+
+
+def advance(store, session_id, **changes):
+    mediator = store.get(session_id)
+    mediator.json_state.update(changes)
+    mediator.turns += 1
+    return store.save(session_id, mediator)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "mediators.db")
+
+
+def test_state_version_moves_only_with_the_state():
+    store = MediatorStore(FakeMediator)
+    assert advance(store, "s", description="a") == 1
+    # A turn that leaves json_state alone (e.g. a clarifying question)
+    assert advance(store, "s") == 1
+    assert advance(store, "s", description="b") == 2
+    # Saving an unchanged mediator writes nothing
+    assert store.save("s", store.get("s")) == 2
+
+
+def test_cursor_from_before_an_eviction_resyncs():
+    store = MediatorStore(FakeMediator, max_sessions=1)
+    advance(store, "a", description="x")
+    _, cursor = store.snapshot("a")
+    store.get("b")   # evicts a
+    assert store.snapshot("a") is None
+    assert store.evictions == 1
+
+    store.get("a")
+    state, new_cursor = store.wait_for_change("a", cursor, timeout=0)
+    assert parse_cursor(new_cursor)[0] != parse_cursor(cursor)[0]
+    assert state["description"] is None
+
+
+def test_wait_for_change_wakes_on_save():
+    store = MediatorStore(FakeMediator)
+    store.get("s")
+    _, cursor = store.snapshot("s")
+    assert store.wait_for_change("s", cursor, timeout=0.05) is None
+
+    timer = threading.Timer(0.05, advance, (store, "s"), {"description": "x"})
+    timer.start()
+    state, new_cursor = store.wait_for_change("s", cursor, timeout=5)
+    timer.join()
+    assert state["description"] == "x"
+    assert parse_cursor(new_cursor) == (parse_cursor(cursor)[0], 1)
+
+
+def test_reset_starts_a_new_epoch():
+    store = MediatorStore(FakeMediator)
+    advance(store, "s", description="x")
+    _, cursor = store.snapshot("s")
+    store.reset("s")
+    state, new_cursor = store.wait_for_change("s", cursor, timeout=0)
+    assert state["description"] is None
+    assert parse_cursor(new_cursor)[0] != parse_cursor(cursor)[0]
+
+
+@pytest.mark.parametrize("cursor, expected", [
+    (state_cursor("ab12", 3), ("ab12", 3)), ("7", (None, 7)), (None, (None, -1)), ("ab.x", (None, -1))
+])
+def test_parse_cursor(cursor, expected):
+    assert parse_cursor(cursor) == expected
+
+
+def test_sqlite_state_is_shared_between_workers(db_path, monkeypatch):
+    monkeypatch.setattr(mediator_store, "CROSS_WORKER_POLL_SECONDS", 0.01)
+    worker_a = MediatorStore(FakeMediator, backend=SQLiteBackend(db_path))
+    worker_b = MediatorStore(FakeMediator, backend=SQLiteBackend(db_path))
+
+    advance(worker_a, "s", description="x")
+    assert worker_b.get("s").json_state["description"] == "x"
+    _, cursor = worker_b.snapshot("s")
+    assert cursor == worker_a.snapshot("s")[1]
+
+    # A stream on worker B sees an advance handled by worker A
+    timer = threading.Timer(0.05, advance, (worker_a, "s"), {"description": "y"})
+    timer.start()
+    state, _ = worker_b.wait_for_change("s", cursor, timeout=5)
+    timer.join()
+    assert state["description"] == "y"
+
+
+def test_sqlite_concurrent_saves_keep_both_versions(db_path):
+    worker_a = MediatorStore(FakeMediator, backend=SQLiteBackend(db_path))
+    worker_b = MediatorStore(FakeMediator, backend=SQLiteBackend(db_path))
+    worker_a.get("s")
+    worker_b.get("s")
+    advance(worker_a, "s", description="a")
+    # Worker B advances from the same version without reloading
+    mediator = worker_b._entries["s"]["mediator"]
+    mediator.json_state["description"] = "b"
+    worker_b.save("s", mediator)
+    assert worker_b._entries["s"]["version"] == 2
+
+    restarted = MediatorStore(FakeMediator, backend=SQLiteBackend(db_path))
+    assert restarted.get("s").json_state["description"] == "b"
+
+
+def test_sqlite_survives_a_restart_with_the_same_cursor(db_path):
+    store = MediatorStore(FakeMediator, backend=SQLiteBackend(db_path))
+    advance(store, "s", description="x")
+    _, cursor = store.snapshot("s")
+
+    restarted = MediatorStore(FakeMediator, backend=SQLiteBackend(db_path))
+    assert restarted.get("s").json_state["description"] == "x"
+    assert restarted.snapshot("s")[1] == cursor
+    # Nothing new for a client that already has this state
+    assert restarted.wait_for_change("s", cursor, timeout=0) is None
+
+
+def test_private_sqlite_is_written_behind(db_path):
+    backend = SQLiteBackend(db_path, shared=False)
+    store = MediatorStore(FakeMediator, backend=backend, max_sessions=1, flush_interval=60)
+    assert store.sink is not None
+    advance(store, "s", description="x")
+    advance(store, "s", description="y")
+    assert backend.load("s") is None
+
+    # Evicted before the flush: the pending write still answers
+    store.get("other")
+    assert store.get("s").json_state["description"] == "y"
+
+    store.sink.flush()
+    assert backend.load("s")[0]["json_state"]["description"] == "y"
+    assert store.sink.stats()["coalesced"] >= 1
+
+
+def test_shared_backend_is_written_synchronously(db_path):
+    store = MediatorStore(FakeMediator, backend=SQLiteBackend(db_path), flush_interval=60)
+    assert store.sink is None
+    advance(store, "s", description="x")
+    assert SQLiteBackend(db_path).load("s")[0]["json_state"]["description"] == "x"
+
+
+def test_waiting_streams_share_one_throttled_refresh(db_path, monkeypatch):
+    monkeypatch.setattr(mediator_store, "CROSS_WORKER_POLL_SECONDS", 0.1)
+    backend = SQLiteBackend(db_path)
+    store = MediatorStore(FakeMediator, backend=backend)
+    store.get("s")
+    _, cursor = store.snapshot("s")
+
+    loads = []
+    load = backend.load
+    monkeypatch.setattr(backend, "load", lambda *args, **kwargs: loads.append(1) or load(*args, **kwargs))
+    streams = [threading.Thread(target=store.wait_for_change, args=("s", cursor, 0.35)) for _ in range(3)]
+    for stream in streams:
+        stream.start()
+    for stream in streams:
+        stream.join()
+    # About one query per poll interval for the session, however many streams wait on it
+    assert len(loads) <= 6
@@ -0,0 +1,27 @@
+import base64
+
+from mime_parser import parse_payload
+
+
+def part(mime_type, text):
+    data = base64.urlsafe_b64encode(text.encode()).decode()
+    return {"mimeType": mime_type, "body": {"data": data}}
+
+
+def test_preview_of_html_only_message_is_text():
+    html = "<html><head><style>p {color: red}</style></head><body><p>Hello <b>Sam</b>,</p><p>See you soon.</p></body></html>"
+    payload = {"mimeType": "multipart/alternative", "parts": [part("text/html", html)]}
+    assert parse_payload(payload).preview_text(max_bytes=2000) == "Hello Sam,\nSee you soon."
+
+
+def test_preview_prefers_plain_text():
+    payload = {"mimeType": "multipart/alternative", "parts": [
+        part("text/plain", "Hello Sam"), part("text/html", "<p>Hello <b>Sam</b></p>")
+    ]}
+    assert parse_payload(payload).preview_text(max_bytes=2000) == "Hello Sam"
+
+
+def test_markup_does_not_use_up_the_preview():
+    html = '<div style="' + "x" * 300 + '">' + "word " * 100 + "</div>"
+    payload = {"mimeType": "text/html", "body": part("text/html", html)["body"]}
+    assert parse_payload(payload).preview_text(max_bytes=100).startswith("word word")
@@ -0,0 +1,51 @@
+import json
+
+from partial_json import PartialJSONFields
+
+REPLY = json.dumps({
+    "subject": "Caf\u00e9 \"plans\"",
+    "body": "Hi Sam,\n\n\tSee C:\\temp \u2014 ok? \U0001F600 done",
+    "extra": {"nested": ["a", "b\"}"]},
+    "tail": "end"
+}, ensure_ascii=True)
+
+
+def read(chunks):
+    reader = PartialJSONFields()
+    streamed = {}
+    for chunk in chunks:
+        for field, text in reader.feed(chunk):
+            streamed[field] = streamed.get(field, "") + text
+    return reader, streamed
+
+
+def test_every_split_point_decodes_like_json_loads():
+    expected = json.loads(REPLY)
+    for i in range(len(REPLY) + 1):
+        reader, streamed = read([REPLY[:i], REPLY[i:]])
+        for field in ("subject", "body", "tail"):
+            assert reader.values[field] == expected[field], i
+            assert streamed[field] == expected[field], i
+
+
+def test_one_character_chunks():
+    reader, streamed = read(list(REPLY))
+    assert streamed["body"] == json.loads(REPLY)["body"]
+    assert "extra" not in reader.values
+
+
+def test_surrogate_pair_split_between_escapes():
+    reader, streamed = read(['{"body": "a\\ud83d', '\\ude00b"}'])
+    assert streamed["body"] == "a\U0001F600b"
+
+
+def test_escape_split_after_backslash():
+    reader, streamed = read(['{"body": "line\\', 'nnext \\', 'u00e9"}'])
+    assert streamed["body"] == "line\nnext \u00e9"
+
+
+def test_unpaired_surrogates_match_json_loads():
+    for raw in ('"a\\ud83db"', '"a\\ud83d"', '"a\\ud83d\\ud83d\\ude00"', '"a\\ude00b"', '"\\ud83d\\n"'):
+        reader, streamed = read(['{"body": ' + raw[:4], raw[4:] + '}'])
+        assert reader.values["body"] == json.loads(raw), raw
+        assert streamed.get("body", "") == json.loads(raw), raw
@@ -0,0 +1,63 @@
+import pytest
+
+from typeahead import TypeaheadIndex
+
+
+@pytest.fixture
+def index():
+    index = TypeaheadIndex()
+    contacts = [
+        ("priya@acme.io", "Priya Shah", "manager"),
+        ("jose@acme.io", "José García", None),
+        ("mueller@acme.io", "Stefan Straße", None),
+        ("mei@acme.io", "李美", None),
+        ("sam.lee@acme.io", "Sam Lee", None),
+    ]
+    for email, name, relation in contacts:
+        index.add(email, {"email": email}, [name, email.split("@")[0], relation])
+    return index
+
+
+def emails(results):
+    return [r["email"] for r in results]
+
+
+@pytest.mark.parametrize("query", ["", "   ", "\t\n"])
+def test_empty_query_matches_nothing(index, query):
+    assert index.search(query) == []
+
+
+def test_empty_index():
+    assert TypeaheadIndex().search("pri") == []
+
+
+@pytest.mark.parametrize("query", ["josé", "JOSÉ", "josé", "garcía"])
+def test_accented_names(index, query):
+    assert emails(index.search(query)) == ["jose@acme.io"]
+
+
+def test_case_folding_beyond_lower(index):
+    assert emails(index.search("STRASSE")) == ["mueller@acme.io"]
+
+
+@pytest.mark.parametrize("query", ["李", "李美"])
+def test_short_cjk_queries(index, query):
+    assert emails(index.search(query)) == ["mei@acme.io"]
+
+
+def test_no_match_across_terms(index):
+    # "shah" then "priya" would only match if the terms ran together
+    assert index.search("ahpri") == []
+
+
+def test_score_ranks_first(index):
+    results = index.search("s", score=lambda r: r["email"] == "sam.lee@acme.io")
+    assert len(results) == 3
+    assert emails(results)[0] == "sam.lee@acme.io"
+
+
+def test_removed_entries_are_not_found(index):
+    index.remove("priya@acme.io")
+    assert index.search("priya") == []
+    assert index.search("pr") == []
+    assert len(index) == 4
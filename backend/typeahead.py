@@ -0,0 +1,115 @@
+# typeahead.py
+"""
+Compact typeahead index for contact search.
+
+Entries are indexed by the trigrams of their search terms (display name,
+email local-part, relation label). A query of three or more characters only
+looks at entries that share all of its trigrams; shorter queries use a
+token-prefix map. Results are ranked by a caller-supplied score (how often
+the user has emailed the address), then by prefix matches, then by length.
+"""
+
+import heapq
+import re
+import unicodedata
+from collections import defaultdict
+
+DEFAULT_LIMIT = 20
+
+# Never part of a term, so no trigram spans two terms
+_TERM_SEPARATOR = '\x00'
+_TOKEN_SPLIT = re.compile(r"[\s._+\-@]+")
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _fold(text):
+    # "José" typed precomposed or with a combining accent, "STRASSE" for "Straße"
+    return unicodedata.normalize('NFC', text).casefold()
+
+
+def local_part(email):
+    return email.split('@', 1)[0]
+
+
+class TypeaheadIndex:
+    def __init__(self):
+        self._docs = {}                       # key -> (text, tokens, record)
+        self._trigrams = defaultdict(set)     # trigram -> keys
+        self._prefixes = defaultdict(set)     # 1-2 char token prefix -> keys
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, key, record, terms):
+        """Index record under key; terms are the strings it should match on"""
+        self.remove(key)
+
+        terms = [_fold(t) for t in terms if t]
+        text = _TERM_SEPARATOR.join(terms)
+        tokens = {tok for term in terms for tok in _TOKEN_SPLIT.split(term) if tok}
+        # Whole terms count as tokens too ("mary jane" matches the query "mary j")
+        tokens.update(terms)
+
+        self._docs[key] = (text, tokens, record)
+        for gram in _trigrams(text):
+            self._trigrams[gram].add(key)
+        for token in tokens:
+            self._prefixes[token[:1]].add(key)
+            self._prefixes[token[:2]].add(key)
+
+    def remove(self, key):
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+
+        text, tokens, _ = doc
+        for gram in _trigrams(text):
+            postings = self._trigrams.get(gram)
+            if postings is not None:
+                postings.discard(key)
+                if not postings:
+                    del self._trigrams[gram]
+        for token in tokens:
+            for prefix in (token[:1], token[:2]):
+                postings = self._prefixes.get(prefix)
+                if postings is not None:
+                    postings.discard(key)
+                    if not postings:
+                        del self._prefixes[prefix]
+
+    def search(self, query, limit=DEFAULT_LIMIT, score=None):
+        """
+        Return up to limit records matching query.
+
+        Queries shorter than three characters match token prefixes; longer
+        queries match anywhere in a term. score(record) -> number, higher
+        ranks first.
+        """
+        q = _fold(query.strip())
+        if not q:
+            return []
+
+        if len(q) < 3:
+            # Every key under a 1-2 character prefix has a token starting with it
+            candidates = self._prefixes.get(q, ())
+        else:
+            grams = sorted(_trigrams(q), key=lambda g: len(self._trigrams.get(g, ())))
+            postings = self._trigrams.get(grams[0])
+            if not postings:
+                return []
+            matched = postings.intersection(*(self._trigrams.get(g, ()) for g in grams[1:]))
+            # Trigram overlap is necessary, not sufficient: verify
+            candidates = [key for key in matched if q in self._docs[key][0]]
+
+        docs = self._docs
+        short_query = len(q) < 3
+
+        def rank(key):
+            text, tokens, record = docs[key]
+            is_prefix = short_query or any(tok.startswith(q) for tok in tokens)
+            return (-(score(record) if score else 0), not is_prefix, len(text))
+
+        return [self._docs[key][2] for key in heapq.nsmallest(limit, candidates, key=rank)]
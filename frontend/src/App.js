@@ -120,7 +120,6 @@ const GmailComposeApp = () => {
     }
   };
   const getLastTerm = (text) => { if (!text) return ''; const parts = text.split(','); return parts[parts.length - 1].trim(); };
-  const stripHtml = (html) => { const tmp = document.createElement("DIV"); tmp.innerHTML = html; return tmp.textContent || tmp.innerText || ""; };
   const replaceLastTerm = (text, newEmail) => { const parts = text.split(','); parts.pop(); parts.push(' ' + newEmail); return parts.map(p => p.trim()).filter(p => p).join(', ') + ', '; };
   const pushInboxState = useCallback((replace = false, view = 'inbox') => {
     const state = { view: view };
@@ -148,16 +147,16 @@ const GmailComposeApp = () => {
       
       if (query) {
         url = pageToken 
-          ? `${API_BASE}/inbox/messages?pageToken=${pageToken}&q=${encodeURIComponent(query)}`
-          : `${API_BASE}/inbox/messages?q=${encodeURIComponent(query)}`;
+          ? `${API_BASE}/inbox/messages?format=metadata&pageToken=${pageToken}&q=${encodeURIComponent(query)}`
+          : `${API_BASE}/inbox/messages?format=metadata&q=${encodeURIComponent(query)}`;
       } 
       else if (label === 'SCHEDULED') {
         url = `${API_BASE}/scheduled/messages`;
       } 
       else {
         url = pageToken 
-          ? `${API_BASE}/inbox/messages?pageToken=${pageToken}&label=${label}` 
-          : `${API_BASE}/inbox/messages?label=${label}`;
+          ? `${API_BASE}/inbox/messages?format=metadata&pageToken=${pageToken}&label=${label}` 
+          : `${API_BASE}/inbox/messages?format=metadata&label=${label}`;
       }
         
       const response = await fetch(url, { credentials: 'include' });
@@ -343,16 +342,16 @@ const GmailComposeApp = () => {
 
   useEffect(() => {
     if (!isAuthenticated) return;
-    let mounted = true;
-    const interval = setInterval(async () => {
+    // The server pushes a state only when the mediator produces a new version
+    const source = new EventSource(`${API_BASE}/mediator/events`, { withCredentials: true });
+    source.addEventListener('state', (event) => {
         try {
-            const response = await fetch(`${API_BASE}/mediator/state`, { credentials: 'include' });
-            const newState = await response.json();
-            if (!mounted) return;
+            const newState = JSON.parse(event.data);
             setMediatorState(prev => { setPrevMediatorState(prev); return newState; });
-        } catch (err) { console.error('Mediator polling failed', err); }
-    }, 1000);
-    return () => { mounted = false; clearInterval(interval); };
+        } catch (err) { console.error('Bad mediator state event', err); }
+    });
+    source.onerror = () => console.warn('Mediator event stream interrupted, reconnecting');
+    return () => source.close();
   }, [isAuthenticated]);
   useEffect(() => {
     if (!mediatorState || !prevMediatorState) return;
@@ -364,7 +363,32 @@ const GmailComposeApp = () => {
     if (mediatorState.description && mediatorState.description !== prevMediatorState.description) { setEmailGenerated(false); }
   }, [mediatorState, prevMediatorState, toField]);
   useEffect(() => { if (!showCompose) return; const loadComposeContext = async () => { try { const response = await fetch(`${API_BASE}/compose/context`, { credentials: 'include' }); const data = await response.json(); if (data.recipient_name) setToField(data.recipient_name); setComposeContext(data); } catch (err) { console.error('Failed to load compose context', err); } }; loadComposeContext(); }, [showCompose]);
-  useEffect(() => { if (!showCompose || emailGenerated || !mediatorState || !mediatorState.description) return; const generateEmail = async () => { setLoading(true); setStatus('Generating email...'); try { const response = await fetch(`${API_BASE}/email/generate`, { method: 'POST', credentials: 'include' }); const data = await response.json(); if (data.success) { setSubject(data.subject); setBody(data.body); setEmailGenerated(true); } } catch (err) { console.error(err); } finally { setLoading(false); setStatus(''); } }; generateEmail(); }, [showCompose, mediatorState, emailGenerated]);
+  useEffect(() => {
+    if (!showCompose || emailGenerated || !mediatorState || !mediatorState.description) return;
+    const generateEmail = async () => {
+      setLoading(true); setStatus('Generating email...');
+      try {
+        // Streamed as newline-delimited JSON: subject/body deltas, then a final {subject, body}
+        const response = await fetch(`${API_BASE}/email/generate/stream`, { method: 'POST', credentials: 'include' });
+        if (!response.ok || !response.body) { const data = await response.json(); if (data.success) { setSubject(data.subject); setBody(data.body); setEmailGenerated(true); } return; }
+        setSubject(''); setBody('');
+        const reader = response.body.getReader(); const decoder = new TextDecoder(); let buffered = '';
+        const handleLine = (line) => {
+          if (!line.trim()) return; const event = JSON.parse(line);
+          if (event.type === 'delta') { setStatus(''); if (event.field === 'subject') setSubject(prev => prev + event.text); else setBody(prev => prev + event.text); }
+          else if (event.type === 'restart') { setSubject(''); setBody(''); }
+          else if (event.type === 'done') { setSubject(event.subject); setBody(event.body); setEmailGenerated(true); }
+          else if (event.type === 'error') console.error('Email generation failed:', event.error);
+        };
+        while (true) {
+          const { done, value } = await reader.read(); if (done) break;
+          buffered += decoder.decode(value, { stream: true }); const lines = buffered.split('\n'); buffered = lines.pop(); lines.forEach(handleLine);
+        }
+        handleLine(buffered);
+      } catch (err) { console.error(err); } finally { setLoading(false); setStatus(''); }
+    };
+    generateEmail();
+  }, [showCompose, mediatorState, emailGenerated]);
 
   useEffect(() => {
     const onPopState = (event) => {
@@ -418,9 +442,10 @@ const GmailComposeApp = () => {
       console.error('Logout failed:', error); 
     } 
   };
-  const handleSummarize = async () => { if (!selectedMessage) return; setIsSummarizing(true); try { const bodyText = selectedMessage.isHtml ? stripHtml(selectedMessage.body) : selectedMessage.body; const textToSummarize = `Subject: ${selectedMessage.subject}\n\n${bodyText}`; const response = await fetch(`${API_BASE}/email/summarize`, { method: 'POST', headers: { 'Content-Type': 'application/json' }, credentials: 'include', body: JSON.stringify({ text: textToSummarize }) }); const data = await response.json(); if (data.success) { setSummary(data.summary); setShowSummary(true); } else { setStatus('Failed to generate summary'); setTimeout(() => setStatus(''), 2000); } } catch (error) { console.error('Summarize failed:', error); setStatus('Error summarizing'); setTimeout(() => setStatus(''), 2000); } finally { setIsSummarizing(false); } };
-  const handleCompose = () => { setShowCompose(true); setCurrentView('compose'); setToField(''); setCcField(''); setBccField(''); setSubject(''); setBody(''); setAiInstruction(''); setAiMode('voice'); setShowMobileAiMenu(false); setShowMobileTextInput(false); setIsMobileMenuOpen(false); window.history.pushState({ view: 'compose' }, '', window.location.pathname + '#compose'); };
-  const handleReplyNew = () => { setShowReplyMenu(false); if (!selectedMessage) return; const emailMatch = selectedMessage.from.match(/<([^>]+)>/); const replyToEmail = emailMatch ? emailMatch[1] : selectedMessage.from; setToField(replyToEmail); setSubject(selectedMessage.subject || ''); setBody(''); setAiInstruction(''); setAiMode('voice'); setShowMobileAiMenu(false); setShowMobileTextInput(false); setShowCompose(true); setCurrentView('compose'); window.history.pushState({ view: 'compose' }, '', window.location.pathname + '#compose'); };
+  const handleSummarize = async () => { if (!selectedMessage) return; setIsSummarizing(true); try { const response = await fetch(`${API_BASE}/email/summarize`, { method: 'POST', headers: { 'Content-Type': 'application/json' }, credentials: 'include', body: JSON.stringify({ messageId: selectedMessage.id }) }); const data = await response.json(); if (data.success) { setSummary(data.summary); setShowSummary(true); } else { setStatus('Failed to generate summary'); setTimeout(() => setStatus(''), 2000); } } catch (error) { console.error('Summarize failed:', error); setStatus('Error summarizing'); setTimeout(() => setStatus(''), 2000); } finally { setIsSummarizing(false); } };
+  const resetCompose = () => fetch(`${API_BASE}/compose/reset`, { method: 'POST', credentials: 'include' }).catch(err => console.error('Failed to reset compose', err));
+  const handleCompose = () => { resetCompose(); setShowCompose(true); setCurrentView('compose'); setToField(''); setCcField(''); setBccField(''); setSubject(''); setBody(''); setAiInstruction(''); setAiMode('voice'); setShowMobileAiMenu(false); setShowMobileTextInput(false); setIsMobileMenuOpen(false); window.history.pushState({ view: 'compose' }, '', window.location.pathname + '#compose'); };
+  const handleReplyNew = () => { setShowReplyMenu(false); if (!selectedMessage) return; resetCompose(); const emailMatch = selectedMessage.from.match(/<([^>]+)>/); const replyToEmail = emailMatch ? emailMatch[1] : selectedMessage.from; setToField(replyToEmail); setSubject(selectedMessage.subject || ''); setBody(''); setAiInstruction(''); setAiMode('voice'); setShowMobileAiMenu(false); setShowMobileTextInput(false); setShowCompose(true); setCurrentView('compose'); window.history.pushState({ view: 'compose' }, '', window.location.pathname + '#compose'); };
   const handleReplyClick = () => setShowReplyMenu(true);
   const handleReplyThread = () => { setShowReplyMenu(false); setInlineReplyOpen(true); setTimeout(() => { window.scrollTo({ top: document.body.scrollHeight, behavior: 'smooth' }); }, 100); };
   const sendInlineReply = async () => { if (!replyBody.trim() || !selectedMessage) return; setLoading(true); setStatus('Sending reply...'); try { const emailMatch = selectedMessage.from.match(/<([^>]+)>/); const replyToEmail = emailMatch ? emailMatch[1] : selectedMessage.from; const formData = new FormData(); formData.append('to', replyToEmail); formData.append('subject', selectedMessage.subject); formData.append('body', replyBody); formData.append('threadId', selectedMessage.threadId); formData.append('messageId', selectedMessage.id); attachments.forEach((file) => formData.append('attachments', file)); const response = await fetch(`${API_BASE}/email/send`, { method: 'POST', credentials: 'include', body: formData }); const data = await response.json(); if (data.success) { setStatus('Reply sent!'); setReplyBody(''); setAttachments([]); setInlineReplyOpen(false); } else { setStatus('Failed: ' + (data.error || 'unknown')); } } catch (error) { console.error(error); setStatus('Error: ' + error.message); } finally { setLoading(false); setTimeout(() => setStatus(''), 2000); } };